@@ -0,0 +1,80 @@
+"""Bulk import: rows/s of payroll_import into SQLite, batched vs one save per row, and its memory.
+
+    python benchmarks/bench_import.py [--employees 1000] [--months 24] [--per-row 2000]
+
+A synthetic workbook's Records sheet is written to a CSV and imported into a SQLite file that
+holds only its employees: once with the default batch size (one transaction per batch) and,
+for the first --per-row rows, with batch_rows=1 (a save per row, as a row-by-row form entry
+would). Memory is the tracemalloc peak of a dry-run over the file and over a file 10x its
+size; chunked reading keeps the two close.
+"""
+import argparse
+import io
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+import payroll_db  # noqa: E402
+from payroll_import import BATCH_ROWS, RECORDS, import_file  # noqa: E402
+from payroll_storage import SQLiteStorage  # noqa: E402
+from synthetic import FrameConnection, make_workbook  # noqa: E402
+
+
+def timed_import(path, csv_path, batch_rows, limit=None):
+    """(seconds, ImportResult) for importing csv_path (its first limit rows) into a fresh copy of path."""
+    storage = SQLiteStorage(path)
+    db = storage.load()
+    source = csv_path
+    if limit is not None:
+        with open(csv_path, encoding="utf-8") as f: source = io.StringIO("".join(line for _, line in zip(range(limit + 1), f)))
+    t0 = time.perf_counter()
+    result = import_file(source, RECORDS, db, commit=lambda changes: storage.save(db, changes), batch_rows=batch_rows, name="r.csv")
+    return time.perf_counter() - t0, result
+
+
+def peak_dry_run(csv_path, db):
+    tracemalloc.start()
+    import_file(csv_path, RECORDS, db, dry_run=True)
+    peak = tracemalloc.get_traced_memory()[1]; tracemalloc.stop()
+    return peak
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--employees", type=int, default=1000)
+    ap.add_argument("--months", type=int, default=24)
+    ap.add_argument("--per-row", type=int, default=2000, help="rows imported with a save per row")
+    args = ap.parse_args()
+
+    frames = make_workbook(args.employees * args.months, n_employees=args.employees, messy=False)
+    records = frames["Records"]
+    with tempfile.TemporaryDirectory() as tmp:
+        csv_path, big_path = os.path.join(tmp, "records.csv"), os.path.join(tmp, "records_x10.csv")
+        records.to_csv(csv_path, index=False)
+        with open(big_path, "w", encoding="utf-8") as f:
+            # Ten copies under their own ids: same employees, 10x the rows
+            for k in range(10):
+                copy = records.assign(id=records["id"] + f"_{k}")
+                copy.to_csv(f, index=False, header=(k == 0))
+        frames["Records"] = records.iloc[:0]
+        base = payroll_db.load_db(FrameConnection(frames))
+        print(f"records={len(records)} employees={args.employees}")
+
+        for label, batch, limit in (("batched", BATCH_ROWS, None), ("per row", 1, args.per_row)):
+            path = os.path.join(tmp, f"{label.replace(' ', '_')}.db")
+            SQLiteStorage(path).replace_all(base)
+            secs, result = timed_import(path, csv_path, batch, limit)
+            print(f"{label:8s}: {result.rows:7d} rows in {secs * 1000:9.1f} ms = {result.rows / secs:9.0f} rows/s "
+                  f"({result.batches} save(s), {result.error_count} rejected)")
+            check = SQLiteStorage(path).load()
+            if len(check['records']) != result.imported: raise SystemExit(f"{label}: {len(check['records'])} records saved, {result.imported} imported")
+
+        small, big = peak_dry_run(csv_path, base), peak_dry_run(big_path, base)
+        print(f"dry-run peak memory: {len(records)} rows {small / 2**20:.1f} MiB, {len(records) * 10} rows {big / 2**20:.1f} MiB")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,106 @@
+"""Columnar load_db vs the original iterrows loader on a synthetic sheet.
+
+    python benchmarks/bench_load_db.py [--records 50000]
+"""
+import argparse
+import json
+import math
+import os
+import sys
+import time
+
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+import payroll_db  # noqa: E402
+from payroll_db import safe_float  # noqa: E402
+from payroll_models import Employee, PayrollRecord  # noqa: E402
+from synthetic import FrameConnection, make_workbook  # noqa: E402
+
+
+def legacy_load_db(conn):
+    # The row-by-row loader as it was before the columnar rewrite (reference only)
+    default_db = {"employees": {}, "records": [], "leave_records": [], "settings": {"usd_rate": 4.45}}
+    try:
+        df_settings = conn.read(worksheet="Settings", ttl=0)
+        if not df_settings.empty and 'usd_rate' in df_settings.columns:
+            default_db['settings']['usd_rate'] = safe_float(df_settings.iloc[0]['usd_rate'])
+
+        df_emp = conn.read(worksheet="Employees", ttl=0)
+        if not df_emp.empty:
+            for _, row in df_emp.iterrows():
+                emp_name = row['name']
+                try: l_inc = json.loads(row['last_increment']) if row['last_increment'] else None
+                except: l_inc = None
+                try: l_bon = json.loads(row['last_bonus']) if row['last_bonus'] else None
+                except: l_bon = None
+                default_db['employees'][emp_name] = {
+                    "name": row['name'], "designation": row['designation'], "join_date": row['join_date'],
+                    "date_of_birth": row['date_of_birth'], "currency": row['currency'], "bank_name": row['bank_name'],
+                    "account_number": str(row['account_number']).split('.')[0] if pd.notna(row['account_number']) else "",
+                    "basic_salary": safe_float(row['basic_salary']), "status": row['status'],
+                    "master_remark": row['master_remark'] if pd.notna(row['master_remark']) else "",
+                    "last_increment": l_inc, "last_bonus": l_bon
+                }
+
+        df_rec = conn.read(worksheet="Records", ttl=0)
+        if not df_rec.empty:
+            for _, row in df_rec.iterrows():
+                try: earn_list = json.loads(row['earnings_list'])
+                except: earn_list = []
+                try: ded_list = json.loads(row['deductions_list'])
+                except: ded_list = []
+                default_db['records'].append({
+                    "id": row['id'], "employee_id": row['employee_id'], "month_label": row['month_label'],
+                    "payment_date": row['payment_date'], "earnings_list": earn_list, "deductions_list": ded_list,
+                    "net_salary": safe_float(row['net_salary']), "currency": row['currency'],
+                    "remarks": row['remarks'] if pd.notna(row['remarks']) else "", "status": row['status'],
+                    "exchange_rate": safe_float(row['exchange_rate'])
+                })
+        return default_db
+    except Exception:
+        return default_db
+
+
+def canonical(v):
+    # NaN-aware, type-strict comparison key
+    if isinstance(v, dict): return {k: canonical(x) for k, x in v.items()}
+    if isinstance(v, list): return [canonical(x) for x in v]
+    if isinstance(v, float) and math.isnan(v): return ("nan",)
+    return (type(v).__name__ if not isinstance(v, (int, float)) else "num", v)
+
+
+def best_of(fn, repeat):
+    times = []
+    for _ in range(repeat):
+        t0 = time.perf_counter(); out = fn(); times.append(time.perf_counter() - t0)
+    return min(times), out
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--records", type=int, default=50_000)
+    ap.add_argument("--repeat", type=int, default=3)
+    args = ap.parse_args()
+
+    conn = FrameConnection(make_workbook(args.records))
+    t_old, old = best_of(lambda: legacy_load_db(conn), args.repeat)
+    t_new, new = best_of(lambda: payroll_db.load_db(conn), args.repeat)
+    new = {k: v for k, v in new.items() if not k.startswith("_")}
+    new["settings"] = {k: v for k, v in new["settings"].items() if k != "fx_rates"}     # no Rates sheet in the legacy loader
+    new["employees"] = {k: e.to_dict() for k, e in new["employees"].items()}
+    new["records"] = [r.to_dict() for r in new["records"]]; new["leave_records"] = list(new["leave_records"])
+    # The legacy loader kept raw dicts; the models normalise them once, so compare in model form
+    old["employees"] = {k: Employee.from_dict(e).to_dict() for k, e in old["employees"].items()}
+    old["records"] = [PayrollRecord.from_dict(r).to_dict() for r in old["records"]]
+
+    same = canonical(old) == canonical(new)
+    print(f"records={len(new['records'])} employees={len(new['employees'])}")
+    print(f"iterrows loader : {t_old * 1000:8.1f} ms")
+    print(f"columnar loader : {t_new * 1000:8.1f} ms  ({t_old / t_new:.1f}x)")
+    print("identical output:", same)
+    sys.exit(0 if same else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,205 @@
+"""Payslip rendering throughput: template renderer vs the original create_pdf, in pages per second.
+
+    python benchmarks/bench_pdf.py [--employees 1000] [--pages 300]
+    python benchmarks/bench_pdf.py --verify [--pages 300]
+
+Renders --pages payslips of the latest synthetic month three ways: the original per-mark
+create_pdf, the template create_pdf (one PDF each) and create_month_pdf (one combined PDF).
+--verify checks the new output draws the same thing: every page's content stream is
+interpreted into its marks (text with position, font and colour; filled rects; ruled lines)
+and compared with the original's, for single payslips and for the combined month.
+Exits 1 on the first difference.
+"""
+import argparse
+import copy
+import os
+import re
+import sys
+import time
+import zlib
+
+from fpdf import FPDF
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+import payroll_db  # noqa: E402
+from payroll_models import Currency, LineItem  # noqa: E402
+from payroll_pdf import create_month_pdf, create_pdf  # noqa: E402
+from payroll_words import amount_in_words  # noqa: E402
+from synthetic import FrameConnection, make_workbook  # noqa: E402
+
+
+def legacy_create_pdf(record, emp_static):
+    # create_pdf as it was, redrawing every mark per payslip (reference only)
+    pdf = FPDF(orientation='P', unit='mm', format='A4')
+    pdf.add_page()
+    COLOR_NAVY = (33, 47, 61); COLOR_WHITE = (255, 255, 255); COLOR_TEXT = (50, 50, 50)
+    pdf.set_fill_color(*COLOR_NAVY); pdf.rect(0, 0, 210, 45, 'F') 
+    pdf.set_y(15); pdf.set_font("Times", 'B', 36); pdf.set_text_color(*COLOR_WHITE); pdf.cell(0, 10, "SDG Tech", 0, 1, 'C')
+    pdf.set_font("Arial", 'B', 9); pdf.set_text_color(200, 200, 200)
+    pay_year = record.year or ""
+    pdf.cell(0, 8, f"PAYSLIP FOR {record.month_label.upper()} {pay_year}", 0, 1, 'C'); pdf.ln(15)
+    pdf.set_text_color(*COLOR_TEXT); y_start = pdf.get_y(); left_x, right_x = 15, 110; line_h = 7
+    
+    # Left Side (Name, Designation, Join Date)
+    pdf.set_xy(left_x, y_start); pdf.set_font("Arial", 'B', 10); pdf.cell(35, line_h, "Name", 0, 0); pdf.set_font("Arial", '', 10); pdf.cell(50, line_h, f": {emp_static.name}", 0, 1)
+    pdf.set_x(left_x); pdf.set_font("Arial", 'B', 10); pdf.cell(35, line_h, "Designation", 0, 0); pdf.set_font("Arial", '', 10); pdf.cell(50, line_h, f": {emp_static.designation}", 0, 1)
+    pdf.set_x(left_x); pdf.set_font("Arial", 'B', 10); pdf.cell(35, line_h, "Join Date", 0, 0); pdf.set_font("Arial", '', 10); pdf.cell(50, line_h, f": {emp_static.join_date}", 0, 1)
+    
+    # Right Side (MOVED UP: Currency, Bank, Account No - Payment Date Removed)
+    pdf.set_xy(right_x, y_start); pdf.set_font("Arial", 'B', 10); pdf.cell(35, line_h, "Currency", 0, 0); pdf.set_font("Arial", '', 10); pdf.cell(50, line_h, f": {emp_static.currency_text}", 0, 1)
+    pdf.set_x(right_x); pdf.set_font("Arial", 'B', 10); pdf.cell(35, line_h, "Bank Name", 0, 0); pdf.set_font("Arial", '', 10); pdf.cell(50, line_h, f": {emp_static.bank_name}", 0, 1)
+    pdf.set_x(right_x); pdf.set_font("Arial", 'B', 10); pdf.cell(35, line_h, "Account No.", 0, 0); pdf.set_font("Arial", '', 10); pdf.cell(50, line_h, f": {emp_static.account_number}", 0, 1)
+    
+    if record.exchange_rate and record.currency is not Currency.MYR:
+        pdf.set_x(right_x); pdf.set_font("Arial", 'B', 10); pdf.cell(35, line_h, "Exchange Rate", 0, 0); pdf.set_font("Arial", '', 10); pdf.cell(50, line_h, f": 1 {record.currency.code} = {record.exchange_rate:.3f} MYR", 0, 1)
+    pdf.ln(10)
+
+    w_desc, w_amt, h_row = 150, 30, 9
+    def draw_section(title, items, total_val, is_deduct=False):
+        pdf.set_fill_color(230, 230, 230); pdf.set_font("Arial", 'B', 10); 
+        pdf.cell(w_desc + w_amt, 8, f"  {title}", 0, 1, 'L', True); pdf.set_font("Arial", '', 10); 
+        for item in items:
+            if item.amount > 0:
+                pdf.cell(w_desc, h_row, "  " + item.description, 0, 0, 'L', False)
+                pdf.cell(w_amt, h_row, f"{item.amount:,.2f}  ", 0, 1, 'R', False)
+        pdf.set_fill_color(255, 255, 255); pdf.set_font("Arial", 'B', 10); 
+        label = "Total Deductions" if is_deduct else "Total Earnings"; 
+        curr = emp_static.currency_text.split("(")[0].strip()
+        pdf.cell(w_desc, 8, f"{label}  ", "T", 0, 'R', False); 
+        pdf.cell(w_amt, 8, f"{curr} {total_val:,.2f}  ", "T", 1, 'R', False); 
+        pdf.ln(5)
+
+    earn_items = [i for i in record.earnings if i.amount > 0]; total_earn = sum(i.amount for i in earn_items)
+    draw_section("EARNINGS", earn_items, total_earn, False)
+    deduct_items = [i for i in record.deductions if i.amount > 0]; total_deduct = sum(i.amount for i in deduct_items)
+    draw_section("DEDUCTIONS", deduct_items, total_deduct, True)
+    
+    net_pay = total_earn - total_deduct; curr = emp_static.currency_text.split("(")[0].strip()
+    pdf.set_fill_color(33, 47, 61); pdf.set_text_color(255, 255, 255); pdf.set_font("Arial", 'B', 12)
+    pdf.cell(w_desc, 12, "  NET PAYABLE", 0, 0, 'L', True); pdf.cell(w_amt, 12, f"{curr} {net_pay:,.2f}  ", 0, 1, 'R', True)
+    pdf.set_text_color(*COLOR_TEXT); pdf.ln(5)
+    
+    try:
+        words = amount_in_words(net_pay, emp_static.currency_text)
+        pdf.set_font("Arial", 'B', 9); pdf.cell(35, 5, "Amount in Words:", 0, 0, 'L')
+        pdf.set_font("Arial", 'I', 9); pdf.multi_cell(0, 5, words, 0, 'L')
+    except Exception as e: pdf.set_font("Arial", 'I', 9); pdf.multi_cell(0, 5, f"ERROR: {str(e)}", 0, 'L')
+    
+    if record.remarks:
+        pdf.ln(5); pdf.set_font("Arial", 'B', 9); pdf.cell(20, 5, "Comment:", 0, 0, 'L')
+        pdf.set_font("Arial", '', 9); pdf.multi_cell(0, 5, record.remarks, 0, 'L')
+
+    pdf.ln(15); pdf.set_font("Arial", 'I', 8); pdf.set_text_color(150, 150, 150); 
+    pdf.cell(0, 5, "This is computer generated no signature required.", 0, 1, 'C')
+    return pdf.output(dest='S').encode('latin-1', errors='replace')
+
+
+# ==========================================
+
+
+TOKEN = re.compile(rb"\((?:\\.|[^\\)])*\)|[^\s()]+")
+
+
+def page_streams(data):
+    """Decompressed content stream of every page (fpdf writes no other streams for core fonts)."""
+    return [zlib.decompress(data[m.end():m.end() + int(m.group(1))])
+            for m in re.finditer(rb"/Length (\d+)>>\nstream\n", data)]
+
+
+def marks(stream):
+    """What a page paints, as comparable tuples, with the graphics state each mark is painted in."""
+    out, stack, args, path = [], [], [], []
+    gs = {"fill": b"0 g", "stroke": b"0 G", "font": None, "lw": None, "at": None}
+    for tok in TOKEN.findall(stream):
+        if tok[:1] in b"(/-.0123456789": args.append(tok); continue
+        if tok == b"q": stack.append(dict(gs))
+        elif tok == b"Q": gs = stack.pop()
+        elif tok in (b"rg", b"g"): gs["fill"] = b" ".join(args + [tok])
+        elif tok in (b"RG", b"G"): gs["stroke"] = b" ".join(args + [tok])
+        elif tok == b"Tf": gs["font"] = tuple(args)
+        elif tok == b"w": gs["lw"] = args[0]
+        elif tok == b"Td": gs["at"] = tuple(args)
+        elif tok == b"Tj": out.append(("text", gs["at"], gs["font"], gs["fill"], args[0]))
+        elif tok in (b"m", b"l", b"re"): path.append((tok, tuple(args)))
+        elif tok in (b"f", b"F", b"S", b"B", b"b"):
+            out.append(("paint", tok, tuple(path), gs["fill"], gs["stroke"], gs["lw"])); path = []
+        elif tok not in (b"BT", b"ET", b"J"): out.append(("op", tok, tuple(args)))
+        args = []
+    return out
+
+
+def same_drawing(old_pdf, new_pdf):
+    """None if both PDFs paint the same marks page by page, else a description of the first difference.
+    Marks are compared as sets per page, plus the first mark (the header band, under the title)."""
+    old, new = page_streams(old_pdf), page_streams(new_pdf)
+    if len(old) != len(new): return f"{len(old)} pages vs {len(new)}"
+    for n, (a, b) in enumerate(zip(old, new), 1):
+        ma, mb = marks(a), marks(b)
+        if sorted(map(repr, ma)) != sorted(map(repr, mb)) or ma[:1] != mb[:1]:
+            extra = sorted(set(map(repr, mb)) - set(map(repr, ma)))[:3]
+            missing = sorted(set(map(repr, ma)) - set(map(repr, mb)))[:3]
+            return f"page {n}: missing {missing} extra {extra}"
+    return None
+
+
+def month_jobs(db, pages):
+    last = max((r for r in db['records'] if r.payment_date), key=lambda r: r.payment_date)
+    recs = db['records'].for_month(last.year, last.month_label)
+    return [(r, db['employees'][r.employee_id]) for r in recs if r.employee_id in db['employees']][:pages]
+
+
+def edge_jobs(jobs):
+    # A payslip long enough to spill onto a second page, and USD with and without a rate
+    rec, emp = copy.copy(jobs[0][0]), jobs[0][1]
+    rec.earnings = [LineItem(f"Allowance {i}", 100.0 + i) for i in range(40)]; rec.remarks = "Long one"
+    usd = next(((r, e) for r, e in jobs if r.currency is Currency.USD), None)
+    out = [(rec, emp)]
+    if usd:
+        no_rate = copy.copy(usd[0]); no_rate.exchange_rate = 0.0
+        out += [usd, (no_rate, usd[1])]
+    return out
+
+
+def verify(jobs):
+    jobs = edge_jobs(jobs) + jobs
+    for rec, emp in jobs:
+        err = same_drawing(legacy_create_pdf(rec, emp), create_pdf(rec, emp))
+        if err: return f"{rec.id}: {err}"
+    singles = b"".join(legacy_create_pdf(rec, emp) for rec, emp in jobs)
+    err = same_drawing(singles, create_month_pdf(jobs))
+    return f"combined month: {err}" if err else None
+
+
+def pages_per_second(fn, n):
+    t0 = time.perf_counter(); fn(); dt = time.perf_counter() - t0
+    return n / dt, dt
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--employees", type=int, default=1000)
+    ap.add_argument("--pages", type=int, default=300)
+    ap.add_argument("--verify", action="store_true")
+    args = ap.parse_args()
+
+    frames = make_workbook(args.employees * 2, n_employees=args.employees, messy=False)
+    db = payroll_db.load_db(FrameConnection(frames))
+    jobs = month_jobs(db, args.pages)
+
+    if args.verify:
+        err = verify(jobs)
+        print(f"verify: {len(jobs) + 3} payslips + combined month: {err or 'same marks on every page'}")
+        sys.exit(1 if err else 0)
+
+    create_pdf(*jobs[0])      # layers built and fpdf imported outside the timings
+    old, t_old = pages_per_second(lambda: [legacy_create_pdf(r, e) for r, e in jobs], len(jobs))
+    new, t_new = pages_per_second(lambda: [create_pdf(r, e) for r, e in jobs], len(jobs))
+    month, t_month = pages_per_second(lambda: create_month_pdf(jobs), len(jobs))
+    print(f"payslips={len(jobs)}")
+    print(f"original create_pdf  : {old:8.0f} pages/s  ({t_old * 1000:.0f} ms)")
+    print(f"template create_pdf  : {new:8.0f} pages/s  ({t_new * 1000:.0f} ms, {new / old:.2f}x)")
+    print(f"create_month_pdf     : {month:8.0f} pages/s  ({t_month * 1000:.0f} ms, {month / old:.2f}x, one file)")
+
+
+if __name__ == "__main__":
+    main()
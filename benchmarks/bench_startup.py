@@ -0,0 +1,94 @@
+"""App start-up and rerun cost: module import time and full-script rerun wall time.
+
+    python benchmarks/bench_startup.py [--employees 300] [--reruns 10] [--out startup.json]
+
+Imports are timed in a fresh interpreter (python -X importtime), so nothing is cached.
+Reruns drive payroll_app.py with Streamlit's AppTest against a local SQLite copy of a
+synthetic workbook (no Google Sheets, no browser); the first run is the cold start.
+Wall time includes AppTest's own overhead; "in script" is the app's own app.rerun metric.
+"""
+import argparse
+import ast
+import json
+import os
+import re
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+import payroll_db  # noqa: E402
+from payroll_storage import SQLiteStorage  # noqa: E402
+from synthetic import FrameConnection, make_workbook  # noqa: E402
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+WATCH = ["fpdf", "num2words", "streamlit_gsheets"]
+
+
+def import_times():
+    """(total seconds for the app's import line, {watched package: cumulative seconds or None if not imported})."""
+    with open(os.path.join(ROOT, "payroll_app.py"), encoding="utf-8") as f: tree = ast.parse(f.read())
+    # payroll_app.py's module-level import statements, without running the app
+    header = "\n".join(ast.unparse(n) for n in tree.body if isinstance(n, (ast.Import, ast.ImportFrom)))
+    code = f"import time; t = time.perf_counter()\n{header}\nprint(time.perf_counter() - t)"
+    out = subprocess.run([sys.executable, "-X", "importtime", "-c", code], cwd=ROOT, capture_output=True, text=True)
+    if out.returncode: raise SystemExit(out.stderr[-2000:])
+    cumulative = {}
+    for line in out.stderr.splitlines():
+        m = re.match(r"import time:\s+\d+ \|\s+(\d+) \|\s*(\S+)$", line)
+        if m and m.group(2) in WATCH: cumulative[m.group(2)] = int(m.group(1)) / 1e6
+    return float(out.stdout.strip().splitlines()[-1]), {p: cumulative.get(p) for p in WATCH}
+
+
+def rerun_times(db_path, reruns, page):
+    """(cold wall seconds, [warm wall seconds], [warm in-script seconds])."""
+    from streamlit.testing.v1 import AppTest
+    from payroll_metrics import METRICS
+    at = AppTest.from_file(os.path.join(ROOT, "payroll_app.py"), default_timeout=300)
+    at.secrets["credentials"] = {"username": "bench", "password": "bench"}
+    at.secrets["storage"] = {"backend": "sqlite", "path": db_path, "snapshot": False, "write_behind": False}
+    at.session_state["password_correct"] = True
+    t0 = time.perf_counter(); at.run(); cold = time.perf_counter() - t0
+    if at.exception: raise SystemExit(f"app raised: {at.exception[0].value}")
+    if page != "Dashboard": at.sidebar.radio[0].set_value(page).run()
+    METRICS.reset(); warm = []
+    for _ in range(reruns):
+        t0 = time.perf_counter(); at.run(); warm.append(time.perf_counter() - t0)
+    return cold, warm, list(METRICS.series["app.rerun"].samples)
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--employees", type=int, default=300)
+    ap.add_argument("--months", type=int, default=12)
+    ap.add_argument("--reruns", type=int, default=10)
+    ap.add_argument("--page", default="Dashboard")
+    ap.add_argument("--out", help="write the results to this JSON file")
+    args = ap.parse_args()
+
+    total, packages = import_times()
+    print(f"app imports       : {total * 1000:8.1f} ms")
+    for p, s in packages.items(): print(f"  {p:16s}: " + (f"{s * 1000:8.1f} ms" if s is not None else "  not imported"))
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, "bench.db")
+        frames = make_workbook(args.employees * args.months, n_employees=args.employees)
+        SQLiteStorage(db_path).replace_all(payroll_db.load_db(FrameConnection(frames)))
+        cold, warm, script = rerun_times(db_path, args.reruns, args.page)
+    print(f"first run         : {cold * 1000:8.1f} ms")
+    print(f"rerun ({args.page}) : median {statistics.median(warm) * 1000:8.1f} ms   best {min(warm) * 1000:8.1f} ms")
+    print(f"  in script       : median {statistics.median(script) * 1000:8.1f} ms   best {min(script) * 1000:8.1f} ms")
+
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            json.dump({"imports_s": total, "packages_s": packages, "first_run_s": cold,
+                       "rerun_median_s": statistics.median(warm), "rerun_best_s": min(warm),
+                       "script_median_s": statistics.median(script), "script_best_s": min(script),
+                       "page": args.page, "employees": args.employees}, f, indent=2)
+        print(f"wrote {args.out}")
+
+
+if __name__ == "__main__":
+    main()
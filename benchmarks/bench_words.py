@@ -0,0 +1,96 @@
+"""Payslip amount-in-words: payroll_words vs the original num2words path.
+
+    python benchmarks/bench_words.py [--employees 1000] [--months 24]
+    python benchmarks/bench_words.py --verify [--exhaustive 100000] [--samples 100000]
+
+Timing spells every record's net pay once (memo cleared first), then one month's payslips
+again with a warm memo, as a re-export would. --verify checks the output is identical to
+num2words: every integer up to --exhaustive, random integers of every magnitude up to
+10**18 (negative included), and random two-decimal amounts under every currency text in
+CURRENCY_TEXTS. Exits 1 on the first mismatch.
+"""
+import argparse
+import os
+import random
+import sys
+import time
+
+from num2words import num2words
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+import payroll_db  # noqa: E402
+import payroll_words  # noqa: E402
+from payroll_words import amount_in_words, cardinal  # noqa: E402
+from synthetic import FrameConnection, make_workbook  # noqa: E402
+
+# Currency cells seen in real sheets, as the payslip is given them (Employee.currency_text)
+CURRENCY_TEXTS = ["RM (MYR)", "$ (USD)", "RM", "MYR", "USD", "SGD", "", "rm", "RM(MYR)", "US$", "$ (USD) "]
+
+
+def legacy_words(net_pay, currency):
+    # create_pdf's amount-in-words block as it was (reference only)
+    net_val = round(net_pay, 2)
+    dollars = int(net_val); cents = int(round((net_val - dollars) * 100))
+    dollars_txt = num2words(dollars, lang='en').upper().replace(",", "")
+    cents_txt = num2words(cents, lang='en').upper().replace(",", "")
+    if "RM" in str(currency):
+        return f"{dollars_txt} RINGGIT AND {cents_txt} SEN ONLY" if cents > 0 else f"{dollars_txt} RINGGIT ONLY"
+    return f"{dollars_txt} DOLLARS AND {cents_txt} CENTS ONLY" if cents > 0 else f"{dollars_txt} DOLLARS ONLY"
+
+
+def verify(exhaustive, samples, seed=0):
+    rng = random.Random(seed)
+    for n in range(exhaustive + 1):
+        if cardinal(n) != num2words(n, lang='en'): return f"cardinal({n}) = {cardinal(n)!r}, num2words: {num2words(n, lang='en')!r}"
+    for _ in range(samples):
+        n = rng.randrange(10 ** rng.randint(1, 18)) * rng.choice([1, 1, 1, -1])
+        if cardinal(n) != num2words(n, lang='en'): return f"cardinal({n}) = {cardinal(n)!r}, num2words: {num2words(n, lang='en')!r}"
+    for _ in range(samples):
+        # cents exactly, cents off by float noise, and half-cent edges
+        amount = rng.randrange(-10 ** 6, 10 ** 9) / 100 + rng.choice([0, 0, 1e-9, -1e-9, 0.005, -0.005])
+        for cur in CURRENCY_TEXTS:
+            if amount_in_words(amount, cur) != legacy_words(amount, cur):
+                return f"amount_in_words({amount!r}, {cur}) = {amount_in_words(amount, cur)!r}, was {legacy_words(amount, cur)!r}"
+    return None
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--employees", type=int, default=1000)
+    ap.add_argument("--months", type=int, default=24)
+    ap.add_argument("--verify", action="store_true")
+    ap.add_argument("--exhaustive", type=int, default=100000)
+    ap.add_argument("--samples", type=int, default=100000)
+    args = ap.parse_args()
+
+    if args.verify:
+        t0 = time.perf_counter(); err = verify(args.exhaustive, args.samples)
+        print(f"verify: 0..{args.exhaustive} + {args.samples} integers + {args.samples} amounts x {len(CURRENCY_TEXTS)} currencies "
+              f"({time.perf_counter() - t0:.1f} s): {err or 'identical'}")
+        sys.exit(1 if err else 0)
+
+    frames = make_workbook(args.employees * args.months, n_employees=args.employees, messy=False)
+    db = payroll_db.load_db(FrameConnection(frames))
+    jobs = [(r.net_salary, r.currency_text) for r in db['records']]
+    print(f"payslips={len(jobs)} distinct amounts={len(set(jobs))}")
+
+    t0 = time.perf_counter(); old = [legacy_words(a, c) for a, c in jobs]; t_old = time.perf_counter() - t0
+    payroll_words._spell.cache_clear()
+    t0 = time.perf_counter(); new = [amount_in_words(a, c) for a, c in jobs]; t_cold = time.perf_counter() - t0
+    last = max((r for r in db['records'] if r.payment_date), key=lambda r: r.payment_date)
+    month = [(r.net_salary, r.currency_text) for r in db['records'].for_month(last.year, last.month_label)]
+    t0 = time.perf_counter(); [legacy_words(a, c) for a, c in month]; t_month_old = time.perf_counter() - t0
+    [amount_in_words(a, c) for a, c in month]
+    t0 = time.perf_counter(); [amount_in_words(a, c) for a, c in month]; t_warm = time.perf_counter() - t0
+
+    same = old == new
+    print(f"num2words        : {t_old * 1000:9.1f} ms")
+    print(f"payroll_words    : {t_cold * 1000:9.1f} ms  ({t_old / t_cold:.0f}x, cold memo)")
+    print(f"one month ({len(month)}) : num2words {t_month_old * 1000:.1f} ms, warm memo {t_warm * 1000:.2f} ms "
+          f"({t_month_old / t_warm:.0f}x)")
+    print(f"identical output: {same}")
+    sys.exit(0 if same else 1)
+
+
+if __name__ == "__main__":
+    main()
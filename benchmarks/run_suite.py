@@ -0,0 +1,128 @@
+"""Timings for the payroll hot paths on a synthetic workbook; no Streamlit, no Google Sheets.
+
+    python benchmarks/run_suite.py [--employees 1000] [--months 24] [--out results.json]
+    python benchmarks/run_suite.py --compare before.json [--threshold 1.25]
+
+Every case runs --repeat times on the same data; best and median are in milliseconds.
+--out writes the results (plus commit, python and workload size) as JSON; --compare
+prints each case against an earlier file and exits 1 if any case is slower than
+threshold x its old best.
+"""
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import time
+from datetime import date
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+import payroll_db  # noqa: E402
+from payroll_bank import BANK_FORMATS, BankFormat, payment_file_bytes  # noqa: E402
+from payroll_engine import earnings_breakdown, generate_payroll, line_item_frame, MonthlyRollup  # noqa: E402
+from payroll_pdf import create_month_pdf, create_pdf  # noqa: E402
+from synthetic import FrameConnection, make_workbook  # noqa: E402
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+
+
+def _commit():
+    try: return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True, text=True).stdout.strip()
+    except OSError: return ""
+
+
+def _full_save(db):
+    # Every record touched and no row layout: the full Records rewrite (record_to_row + one update)
+    changes = payroll_db.ChangeTracker()
+    for r in db['records']: changes.upsert_record(r.id)
+    db['_sheets']['Records'] = payroll_db.SheetLayout([], [])
+    payroll_db.save_db(FrameConnection({}), db, changes)
+
+
+def _dashboard(db, year):
+    rollup = MonthlyRollup(db['records'])
+    total = rollup.myr(year, default_rate=db['settings']['usd_rate'])
+    earnings_breakdown(line_item_frame(db['records'].for_year(year)), db['settings']['usd_rate'])
+    return total
+
+
+def cases(frames, args):
+    """name -> (setup, fn): setup builds fresh state outside the timing, fn(state) is timed."""
+    db = payroll_db.load_db(FrameConnection(frames))
+    year = max(r.year for r in db['records'] if r.year)
+    emp_ids = list(db['employees'])
+    pdf_jobs = [(db['records'].latest(e), db['employees'][e]) for e in emp_ids[:args.pdfs]]
+    pdf_jobs = [(r, e) for r, e in pdf_jobs if r is not None]
+    # The busiest month, every record due whatever its status: the bank file's worst case
+    busiest = max({(r.year, r.month_label) for r in db['records'] if r.year}, key=lambda k: len(db['records'].for_month(*k)))
+    fixed = BANK_FORMATS["fixed"]
+    bank_fmt = BankFormat("bench", "fixed", fixed.detail, fixed.header, fixed.trailer, statuses=("Paid", "Unpaid"))
+    return {
+        "load_db": (lambda: FrameConnection(frames), payroll_db.load_db),
+        "save_db_full": (lambda: payroll_db.load_db(FrameConnection(frames)), _full_save),
+        "generate_payroll": (lambda: db, lambda d: generate_payroll(d, "January", year + 1, payment_date=date(year + 1, 1, 25),
+                                                                    dry_run=True)),
+        "dashboard": (lambda: db, lambda d: _dashboard(d, year)),
+        "get_last_record": (lambda: db, lambda d: [d['records'].latest(e) for e in emp_ids]),
+        "create_pdf": (lambda: pdf_jobs, lambda jobs: [create_pdf(r, e) for r, e in jobs]),
+        "create_month_pdf": (lambda: pdf_jobs, create_month_pdf),
+        "bank_file": (lambda: db, lambda d: payment_file_bytes(d, *busiest, bank_fmt)),
+    }
+
+
+def run(frames, args):
+    results = {}
+    for name, (setup, fn) in cases(frames, args).items():
+        if args.only and name not in args.only: continue
+        times = []
+        for _ in range(args.repeat):
+            state = setup()
+            t0 = time.perf_counter(); fn(state); times.append((time.perf_counter() - t0) * 1000)
+        results[name] = {"best_ms": round(min(times), 3), "median_ms": round(statistics.median(times), 3), "repeat": args.repeat}
+        print(f"{name:18s} best {min(times):10.2f} ms   median {statistics.median(times):10.2f} ms")
+    return results
+
+
+def compare(results, old_path, threshold):
+    with open(old_path, encoding="utf-8") as f: old = json.load(f)
+    print(f"\nvs {old_path} ({old['meta'].get('commit') or 'unknown commit'})")
+    slower = []
+    for name, res in results.items():
+        before = old["results"].get(name)
+        if before is None: print(f"{name:18s} (new)"); continue
+        ratio = res["best_ms"] / before["best_ms"] if before["best_ms"] else float("inf")
+        flag = "  SLOWER" if ratio > threshold else ""
+        print(f"{name:18s} {before['best_ms']:10.2f} -> {res['best_ms']:10.2f} ms  x{ratio:.2f}{flag}")
+        if flag: slower.append(name)
+    return slower
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--employees", type=int, default=1000)
+    ap.add_argument("--months", type=int, default=24)
+    ap.add_argument("--pdfs", type=int, default=50, help="payslips rendered by the create_pdf / create_month_pdf cases")
+    ap.add_argument("--repeat", type=int, default=3)
+    ap.add_argument("--only", nargs="*", help="run just these cases")
+    ap.add_argument("--out", help="write the results to this JSON file")
+    ap.add_argument("--compare", help="earlier --out file to compare against")
+    ap.add_argument("--threshold", type=float, default=1.25)
+    args = ap.parse_args()
+
+    frames = make_workbook(args.employees * args.months, n_employees=args.employees)
+    print(f"employees={args.employees} records={len(frames['Records'])} repeat={args.repeat}")
+    results = run(frames, args)
+
+    if args.out:
+        meta = {"commit": _commit(), "python": platform.python_version(), "platform": platform.platform(),
+                "time": time.strftime("%Y-%m-%dT%H:%M:%S"), "employees": args.employees,
+                "records": len(frames['Records']), "pdfs": args.pdfs}
+        with open(args.out, "w", encoding="utf-8") as f: json.dump({"meta": meta, "results": results}, f, indent=2)
+        print(f"wrote {args.out}")
+    if args.compare and compare(results, args.compare, args.threshold): sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
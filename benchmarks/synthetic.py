@@ -0,0 +1,81 @@
+import io
+import json
+import random
+import pandas as pd
+
+# ==========================================
+# SYNTHETIC WORKBOOK (same shape/dtypes conn.read returns)
+# ==========================================
+MONTHS = ["January", "February", "March", "April", "May", "June", "July", "August", "September", "October", "November", "December"]
+EMP_HEADER = ["name", "designation", "join_date", "date_of_birth", "currency", "bank_name", "account_number",
+              "basic_salary", "status", "master_remark", "last_increment", "last_bonus"]
+REC_HEADER = ["id", "employee_id", "month_label", "payment_date", "earnings_list", "deductions_list",
+              "net_salary", "currency", "remarks", "status", "exchange_rate"]
+
+
+def _sheet(header, rows):
+    # Round-trip through text so dtype inference matches what gspread_dataframe hands back
+    buf = io.StringIO()
+    pd.DataFrame(rows, columns=header).to_csv(buf, index=False)
+    buf.seek(0)
+    return pd.read_csv(buf)
+
+
+def make_workbook(n_records=50_000, n_employees=None, seed=7, messy=True):
+    rnd = random.Random(seed)
+    n_employees = n_employees or max(1, n_records // 60)
+    emps = []
+    for i in range(n_employees):
+        usd = rnd.random() < 0.3
+        emps.append([
+            f"Employee {i:05d}", rnd.choice(["Engineer", "Analyst", "Manager", "Designer"]),
+            f"{rnd.randint(1, 28):02d} {rnd.choice(['Jan', 'Mar', 'Jul', 'Oct'])} {rnd.randint(2010, 2024)}",
+            f"{rnd.randint(1, 28):02d} May {rnd.randint(1960, 2000)}",
+            "$ (USD)" if usd else "RM (MYR)", rnd.choice(["Maybank", "CIMB", "Public Bank", "HSBC"]),
+            "" if messy and rnd.random() < 0.02 else rnd.randint(10**9, 10**12),
+            round(rnd.uniform(2000, 15000), 2), "Active" if rnd.random() < 0.9 else "Inactive",
+            "" if rnd.random() < 0.8 else "Probation ended",
+            json.dumps({"date": "01 Jan 2024", "percentage": 5.0}) if rnd.random() < 0.3 else "",
+            json.dumps({"year": 2023, "amount": 1500.0}) if rnd.random() < 0.2 else "",
+        ])
+
+    recs = []
+    months_back = -(-n_records // n_employees)
+    for m in range(months_back):
+        year, month = 2024 - m // 12, 12 - m % 12
+        for e in emps:
+            if len(recs) >= n_records: break
+            basic = e[7]
+            earnings = [{"Description": "Basic Salary", "Amount": basic}]
+            if rnd.random() < 0.4: earnings.append({"Description": "Allowance", "Amount": round(rnd.uniform(100, 800), 2)})
+            deductions = [{"Description": "Unpaid Leave", "Amount": round(rnd.choice([0, 0, 0, 150.5]), 2)}]
+            net = sum(i["Amount"] for i in earnings) - sum(i["Amount"] for i in deductions)
+            usd = "USD" in e[4]
+            earn_txt = json.dumps(earnings)
+            if messy and rnd.random() < 0.001: earn_txt = earn_txt[:-3]
+            recs.append([
+                f"{e[0]}_{MONTHS[month - 1]}_{year}", e[0], MONTHS[month - 1], f"{year}-{month:02d}-{rnd.randint(20, 28)}",
+                earn_txt, json.dumps(deductions), "" if messy and rnd.random() < 0.001 else round(net, 2), e[4],
+                "" if rnd.random() < 0.9 else "Adjusted", "Paid" if m else rnd.choice(["Paid", "Unpaid"]),
+                round(rnd.uniform(4.2, 4.8), 3) if usd and rnd.random() < 0.95 else "",
+            ])
+
+    return {
+        "Settings": pd.DataFrame([{"usd_rate": 4.45}]),
+        "Employees": _sheet(EMP_HEADER, emps),
+        "Records": _sheet(REC_HEADER, recs),
+    }
+
+
+class FrameConnection:
+    """Stand-in for the gsheets connection backed by in-memory frames."""
+
+    def __init__(self, frames):
+        self.frames = frames
+
+    def read(self, worksheet=None, ttl=None, **kwargs):
+        return self.frames[worksheet].copy()
+
+    def update(self, worksheet=None, data=None, **kwargs):
+        self.frames[worksheet] = data.copy()
+        return data
@@ -1,131 +1,130 @@
+import time
 import streamlit as st
 import pandas as pd
-import json
-import numpy as np
-import streamlit.components.v1 as components
-from fpdf import FPDF
-from num2words import num2words
 from datetime import datetime, date
 import calendar
-from streamlit_gsheets import GSheetsConnection
+import tempfile
+import payroll_db
+from payroll_bank import BANK_FORMATS, bank_format, mark_paid, payment_file_bytes
+from payroll_db import LEAVE_TYPES, leave_id, leaves_from_frame
+from payroll_fx import default_rate_for, rates_from_frame
+from payroll_import import KINDS, import_file
+from payroll_metrics import METRICS, MeteredConnection, timed
+from payroll_models import Currency, Employee, LineItem, PayrollRecord, line_items, parse_date, safe_float
+from payroll_paging import PAGE_SIZES, employee_index, page_slice, sort_names
+from payroll_statutory import STATUTORY_LINES, age_on, applies_to, apply_statutory, calculate
+from payroll_engine import (apply_unpaid_leave, basic_from_earnings, earnings_breakdown, generate_payroll, line_item_frame,
+                            monthly_rollup, unpaid_leave_deduction)
+from payroll_storage import SheetsStorage, SQLiteStorage
+from payroll_snapshot import SNAPSHOT_DIR, RecordSnapshot, SnapshotStorage
+from payroll_writer import JOURNAL_PATH, WriteBehind
+from payroll_pdf import PayslipCache, create_month_pdf, export_payslips_zip, month_payslip_jobs
+from payroll_style import page_head
 
 # ==========================================
 # 0. APP CONFIGURATION & CSS
 # ==========================================
+rerun_started = time.perf_counter()
 st.set_page_config(page_title="SDG Tech Payroll", layout="wide", page_icon="🏢")
 
-# 建立连接 (全局)
-conn = st.connection("gsheets", type=GSheetsConnection)
-
-# --- 注入 JS 脚本：专门解决手机 Sidebar 不自动收回的问题 ---
-st.markdown("""
-<script>
-    const radios = window.parent.document.querySelectorAll('input[type="radio"]');
-    radios.forEach(radio => {
-        radio.addEventListener('click', () => {
-            const closeBtn = window.parent.document.querySelector('button[kind="header"]');
-            if (closeBtn) {
-                closeBtn.click();
-            }
-        });
-    });
-</script>
-<style>
-    /* --- GLOBAL FONT FIX --- */
-    html, body, [class*="css"] {
-        font-family: "Source Sans Pro", -apple-system, BlinkMacSystemFont, "Segoe UI", Roboto, "Helvetica Neue", Arial, sans-serif !important;
-    }
-    
-    /* --- TABLE SCROLL FIX (手机横向滚动) --- */
-    [data-testid="stDataFrame"] {
-        width: 100%;
-        overflow-x: auto;
-        display: block;
-        white-space: nowrap;
-    }
-    
-    /* --- SIDEBAR --- */
-    [data-testid="stSidebar"] { background-color: #1a1f36; }
-    [data-testid="stSidebar"] * { color: #ffffff !important; }
-    .stRadio > div[role="radiogroup"] > label {
-        background-color: transparent; color: white; padding: 10px 15px; border-radius: 8px; margin-bottom: 5px; border: 1px solid transparent;
-    }
-    .stRadio > div[role="radiogroup"] > label:hover { background-color: #2c3350; cursor: pointer; }
-
-    /* --- METRICS --- */
-    .metric-card-purple { background-color: #7f56d9; color: white; padding: 20px; border-radius: 12px; text-align: center; box-shadow: 0 4px 6px rgba(0,0,0,0.1); }
-    .metric-card-blue { background-color: #0070f3; color: white; padding: 20px; border-radius: 12px; text-align: center; box-shadow: 0 4px 6px rgba(0,0,0,0.1); }
-    .metric-label { font-size: 14px; font-weight: 500; opacity: 0.9; margin-bottom: 5px; }
-    .metric-value { font-size: 28px; font-weight: 700; }
-
-    /* --- COMPACT BUTTONS & ROWS --- */
-    .stButton button {
-        height: 32px !important; 
-        padding-top: 0px !important;
-        padding-bottom: 0px !important;
-        line-height: 1 !important;
-        border-radius: 4px;
-        white-space: nowrap !important;
-    }
-    
-    div[data-testid="column"] > div {
-        display: flex;
-        flex-direction: column;
-        justify-content: center;
-        height: 100%;
-    }
-
-    .input-label-spacer { height: 28px; } 
-
-    /* ====================================================================
-       MOBILE ULTRA-COMPACT LAYOUT (手机极度紧凑模式)
-       ==================================================================== */
-    @media (max-width: 800px) {
-        /* 1. 强制容器宽度变窄，消灭中间的空白 */
-        .main .block-container {
-            min-width: 380px !important; 
-            max-width: 100vw !important;
-            padding-left: 2px !important;
-            padding-right: 2px !important;
-            overflow-x: auto !important;
-        }
-        
-        html, body {
-            overflow-x: auto !important;
-        }
-
-        /* 2. 强制横向，且间距 (gap) 设为 0 */
-        div[data-testid="stHorizontalBlock"] {
-            flex-direction: row !important;
-            flex-wrap: nowrap !important;
-            gap: 0px !important; 
-        }
-        
-        /* 3. 允许列被压缩，并缩小字体 */
-        div[data-testid="column"] {
-            width: auto !important;
-            flex: 1 1 auto !important;
-            min-width: 0px !important;
-            padding: 0px !important;
-        }
-
-        /* 4. 缩小所有文字 */
-        div[data-testid="column"] p, 
-        div[data-testid="column"] span,
-        div[data-testid="column"] div {
-            font-size: 11px !important; 
-        }
-        
-        /* 5. 调整按钮大小 */
-        .stButton button {
-            padding: 0px 4px !important;
-            font-size: 10px !important;
-            height: 28px !important;
-            min-height: 28px !important;
-        }
-    }
-</style>
-""", unsafe_allow_html=True)
+# streamlit_gsheets (and its Google client stack) loads only when the Sheets backend is used
+@st.cache_resource
+def get_sheets_connection():
+    from streamlit_gsheets import GSheetsConnection
+    return MeteredConnection(st.connection("gsheets", type=GSheetsConnection))
+
+# 数据存储: Google Sheets (默认), or a local SQLite file via [storage] backend = "sqlite" / path = "payroll.db" in secrets
+@st.cache_resource
+def get_storage():
+    # Records are read for the last record_years payment years; older years load when a page asks for them
+    cfg = st.secrets.get("storage", {})
+    years = int(cfg.get("record_years", 2))
+    if cfg.get("backend") == "sqlite": storage = SQLiteStorage(cfg.get("path", "payroll.db"), record_years=years)
+    else: storage = SheetsStorage(get_sheets_connection(), record_years=years)
+    # Local Parquet copy of Records/Employees: fast cold start + analytics ([storage] snapshot = false to disable)
+    if not cfg.get("snapshot", True): return storage
+    sheet_url = st.secrets.get("connections", {}).get("gsheets", {}).get("spreadsheet", "")
+    source = f"{storage.name}:{getattr(storage, 'path', sheet_url)}"
+    return SnapshotStorage(storage, RecordSnapshot(cfg.get("snapshot_dir", SNAPSHOT_DIR), source),
+                           max_age=float(cfg.get("snapshot_max_age", 3600)))
+
+# One workbook per server process; every session reads and writes through it.
+# Saves are journaled locally and written in the background ([storage] write_behind = false to disable)
+@st.cache_resource
+def get_shared_db():
+    shared = payroll_db.SharedDB(get_storage())
+    cfg = st.secrets.get("storage", {})
+    if cfg.get("write_behind", True): shared.writer = WriteBehind(shared, cfg.get("journal", JOURNAL_PATH))
+    return shared
+
+def save_db():
+    shared = get_shared_db()
+    shared.commit(st.session_state.changes)
+    st.session_state.db_version = shared.version
+
+def get_last_record(emp_id, db):
+    return db['records'].latest(emp_id)
+
+def format_date_short(date_str):
+    try:
+        if isinstance(date_str, (datetime, type(date.today()))):
+            return date_str.strftime("%d %b %Y")
+        return datetime.strptime(str(date_str), "%Y-%m-%d").strftime("%d %b %Y")
+    except: return str(date_str)
+
+def calculate_tenure(join_date_str):
+    try:
+        start_date = datetime.strptime(join_date_str, "%d %b %Y").date()
+        today = date.today()
+        years = today.year - start_date.year
+        months = today.month - start_date.month
+        if months < 0: years -= 1; months += 12
+        return f"{years}y{months}m"
+    except: return "0y0m"
+
+def employee_idx():
+    return employee_index(st.session_state.db['employees'], get_shared_db().versions['employees'])
+
+# Search / sort / page row above a one-row-per-employee table. Only the returned page of names
+# becomes table rows; sort_keys maps a label to key(name) (None = name order).
+def paged_names(key, names_for, sort_keys):
+    c_q, c_s, c_o, c_n, c_p = st.columns([3, 2, 1, 1, 1])
+    query = c_q.text_input("🔍 Search", key=f"{key}_q", placeholder="Name or role")
+    sort_by = c_s.selectbox("Sort by", list(sort_keys), key=f"{key}_sort")
+    desc = c_o.selectbox("Order", ["↑", "↓"], key=f"{key}_order") == "↓"
+    size = c_n.selectbox("Rows", PAGE_SIZES, key=f"{key}_size")
+    names = sort_names(names_for(query), sort_keys[sort_by], desc)
+    n_pages = max(1, -(-len(names) // size))
+    # A new search/sort starts at page 1; a shrinking list never leaves the page past the end
+    if st.session_state.get(f"{key}_view") != (query, sort_by, desc, size):
+        st.session_state[f"{key}_view"] = (query, sort_by, desc, size); st.session_state[f"{key}_page"] = 1
+    elif st.session_state.get(f"{key}_page", 1) > n_pages: st.session_state[f"{key}_page"] = n_pages
+    page = c_p.number_input("Page", min_value=1, max_value=n_pages, step=1, key=f"{key}_page")
+    start, stop, _, _ = page_slice(len(names), page, size)
+    st.caption(f"{start + 1 if names else 0}–{stop} of {len(names)}" + (f" · page {page} / {n_pages}" if n_pages > 1 else ""))
+    return names[start:stop], start
+
+# Rendered payslips, shared by all sessions; optional disk tier via [pdf_cache] in secrets
+@st.cache_resource
+def get_pdf_cache():
+    cfg = st.secrets.get("pdf_cache", {})
+    return PayslipCache(max_entries=int(cfg.get("max_entries", 256)), disk_dir=cfg.get("dir"),
+                        disk_max_bytes=int(cfg.get("max_mb", 200)) * 1024 * 1024)
+
+# Bank payment file layouts: the built-in csv / fixed plus the bank's own under [bank_formats.<name>] in secrets
+@st.cache_resource
+def get_bank_formats():
+    return dict(BANK_FORMATS, **{n: bank_format(n, cfg) for n, cfg in st.secrets.get("bank_formats", {}).items()})
+
+# [NEW] POP-UP DIALOG FOR DOWNLOAD
+@st.dialog("📄 Download Payslip")
+def show_download_dialog(record, emp_static, file_name):
+    st.write(f"Ready to download payslip for **{emp_static.name}**")
+    pdf_bytes = get_pdf_cache().get_or_render(record, emp_static)
+    st.download_button("Click to Download PDF", data=pdf_bytes, file_name=file_name, mime="application/pdf", type="primary", use_container_width=True)
+
+# Page CSS + sidebar JS (payroll_style), minified once per process
+st.markdown(page_head(), unsafe_allow_html=True)
 
 # ==========================================
 # 1. AUTHENTICATION LOGIC (SECURE)
@@ -134,6 +133,7 @@ def check_password():
     def password_entered():
         if st.session_state["username"] == st.secrets["credentials"]["username"] and st.session_state["password"] == st.secrets["credentials"]["password"]:
             st.session_state["password_correct"] = True
+            st.session_state["user"] = st.session_state["username"]
             del st.session_state["password"]; del st.session_state["username"]
         else: st.session_state["password_correct"] = False
 
@@ -164,261 +164,39 @@ if check_password():
     # 2. MAIN APPLICATION
     # ==========================================
     
-    # [FIX 1] 强力数字清洗函数
-    def safe_float(val):
-        try:
-            if val is None: return 0.0
-            if isinstance(val, (float, int)):
-                if np.isnan(val) or np.isinf(val): return 0.0
-                return float(val)
-            val_str = str(val).strip().lower()
-            if val_str in ['nan', 'inf', '-inf', 'none', '']: return 0.0
-            return float(val)
-        except:
-            return 0.0
-
-    # [FIX 2] 列表清洗函数
-    def clean_list_for_json(data_list):
-        if not isinstance(data_list, list): return "[]"
-        cleaned_list = []
-        for item in data_list:
-            if isinstance(item, dict):
-                new_item = {}
-                for k, v in item.items():
-                    if k == 'Amount':
-                        new_item[k] = safe_float(v)
-                    else:
-                        new_item[k] = str(v) if v is not None else ""
-                cleaned_list.append(new_item)
-        return json.dumps(cleaned_list)
-
-    def load_db():
-        default_db = {"employees": {}, "records": [], "leave_records": [], "settings": {"usd_rate": 4.45}}
-        try:
-            df_settings = conn.read(worksheet="Settings", ttl=0)
-            if not df_settings.empty and 'usd_rate' in df_settings.columns:
-                default_db['settings']['usd_rate'] = safe_float(df_settings.iloc[0]['usd_rate'])
-
-            df_emp = conn.read(worksheet="Employees", ttl=0)
-            if not df_emp.empty:
-                for _, row in df_emp.iterrows():
-                    emp_name = row['name']
-                    try: l_inc = json.loads(row['last_increment']) if row['last_increment'] else None
-                    except: l_inc = None
-                    try: l_bon = json.loads(row['last_bonus']) if row['last_bonus'] else None
-                    except: l_bon = None
-
-                    default_db['employees'][emp_name] = {
-                        "name": row['name'],
-                        "designation": row['designation'],
-                        "join_date": row['join_date'],
-                        "date_of_birth": row['date_of_birth'],
-                        "currency": row['currency'],
-                        "bank_name": row['bank_name'],
-                        "account_number": str(row['account_number']).split('.')[0] if pd.notna(row['account_number']) else "",
-                        "basic_salary": safe_float(row['basic_salary']),
-                        "status": row['status'],
-                        "master_remark": row['master_remark'] if pd.notna(row['master_remark']) else "",
-                        "last_increment": l_inc,
-                        "last_bonus": l_bon
-                    }
-
-            df_rec = conn.read(worksheet="Records", ttl=0)
-            if not df_rec.empty:
-                for _, row in df_rec.iterrows():
-                    try: earn_list = json.loads(row['earnings_list'])
-                    except: earn_list = []
-                    try: ded_list = json.loads(row['deductions_list'])
-                    except: ded_list = []
-                    
-                    default_db['records'].append({
-                        "id": row['id'],
-                        "employee_id": row['employee_id'],
-                        "month_label": row['month_label'],
-                        "payment_date": row['payment_date'],
-                        "earnings_list": earn_list,
-                        "deductions_list": ded_list,
-                        "net_salary": safe_float(row['net_salary']),
-                        "currency": row['currency'],
-                        "remarks": row['remarks'] if pd.notna(row['remarks']) else "",
-                        "status": row['status'],
-                        "exchange_rate": safe_float(row['exchange_rate'])
-                    })
-            return default_db
-        except Exception as e:
-            return default_db
-
-    def save_db(data):
-        df_set = pd.DataFrame([{"usd_rate": safe_float(data['settings']['usd_rate'])}])
-        conn.update(worksheet="Settings", data=df_set)
-
-        emp_list = []
-        for name, info in data['employees'].items():
-            emp_list.append({
-                "name": info['name'],
-                "designation": info['designation'],
-                "join_date": info['join_date'],
-                "date_of_birth": info.get('date_of_birth', ''),
-                "currency": info['currency'],
-                "bank_name": info['bank_name'],
-                "account_number": info['account_number'],
-                "basic_salary": safe_float(info['basic_salary']),
-                "status": info['status'],
-                "master_remark": info.get('master_remark', ''),
-                "last_increment": json.dumps(info['last_increment']) if info['last_increment'] else None,
-                "last_bonus": json.dumps(info['last_bonus']) if info['last_bonus'] else None
-            })
-        if emp_list:
-            df_emp = pd.DataFrame(emp_list).fillna("")
-            conn.update(worksheet="Employees", data=df_emp)
-        
-        rec_list = []
-        for r in data['records']:
-            clean_net = safe_float(r['net_salary'])
-            clean_rate = safe_float(r['exchange_rate'])
-            rec_list.append({
-                "id": r['id'],
-                "employee_id": r['employee_id'],
-                "month_label": r['month_label'],
-                "payment_date": r['payment_date'],
-                "earnings_list": clean_list_for_json(r['earnings_list']),
-                "deductions_list": clean_list_for_json(r['deductions_list']),
-                "net_salary": clean_net,
-                "currency": r['currency'],
-                "remarks": r['remarks'],
-                "status": r['status'],
-                "exchange_rate": clean_rate
-            })
-        if rec_list:
-            df_rec = pd.DataFrame(rec_list).fillna("")
-            conn.update(worksheet="Records", data=df_rec)
-        st.cache_data.clear()
-
-    def get_last_record(emp_id, db):
-        emp_records = [r for r in db['records'] if r['employee_id'] == emp_id]
-        if not emp_records: return None
-        return sorted(emp_records, key=lambda x: x['payment_date'])[-1]
-
-    def convert_record_to_myr(record, default_rate):
-        try:
-            currency = str(record.get('currency', '')).upper()
-            net_pay = safe_float(record.get('net_salary', 0.0))
-            if "USD" in currency:
-                rate = safe_float(record.get('exchange_rate'))
-                if rate == 0: rate = default_rate
-                return net_pay * float(rate)
-            return net_pay
-        except: return 0.0
-
-    def format_date_short(date_str):
-        try:
-            if isinstance(date_str, (datetime, type(date.today()))):
-                return date_str.strftime("%d %b %Y")
-            return datetime.strptime(str(date_str), "%Y-%m-%d").strftime("%d %b %Y")
-        except: return str(date_str)
-
-    def calculate_tenure(join_date_str):
-        try:
-            start_date = datetime.strptime(join_date_str, "%d %b %Y").date()
-            today = date.today()
-            years = today.year - start_date.year
-            months = today.month - start_date.month
-            if months < 0: years -= 1; months += 12
-            return f"{years}y{months}m"
-        except: return "0y0m"
-
-    if "db" not in st.session_state: st.session_state.db = load_db()
-    if "edit_target" not in st.session_state: st.session_state.edit_target = None
-
-    # --- PDF GENERATOR (MODIFIED: Payment Date Removed) ---
-    def create_pdf(record, emp_static):
-        pdf = FPDF(orientation='P', unit='mm', format='A4')
-        pdf.add_page()
-        COLOR_NAVY = (33, 47, 61); COLOR_WHITE = (255, 255, 255); COLOR_TEXT = (50, 50, 50)
-        pdf.set_fill_color(*COLOR_NAVY); pdf.rect(0, 0, 210, 45, 'F') 
-        pdf.set_y(15); pdf.set_font("Times", 'B', 36); pdf.set_text_color(*COLOR_WHITE); pdf.cell(0, 10, "SDG Tech", 0, 1, 'C')
-        pdf.set_font("Arial", 'B', 9); pdf.set_text_color(200, 200, 200)
-        pay_year = record['payment_date'].split('-')[0]
-        pdf.cell(0, 8, f"PAYSLIP FOR {record['month_label'].upper()} {pay_year}", 0, 1, 'C'); pdf.ln(15)
-        pdf.set_text_color(*COLOR_TEXT); y_start = pdf.get_y(); left_x, right_x = 15, 110; line_h = 7
-        
-        # Left Side (Name, Designation, Join Date)
-        pdf.set_xy(left_x, y_start); pdf.set_font("Arial", 'B', 10); pdf.cell(35, line_h, "Name", 0, 0); pdf.set_font("Arial", '', 10); pdf.cell(50, line_h, f": {emp_static['name']}", 0, 1)
-        pdf.set_x(left_x); pdf.set_font("Arial", 'B', 10); pdf.cell(35, line_h, "Designation", 0, 0); pdf.set_font("Arial", '', 10); pdf.cell(50, line_h, f": {emp_static['designation']}", 0, 1)
-        pdf.set_x(left_x); pdf.set_font("Arial", 'B', 10); pdf.cell(35, line_h, "Join Date", 0, 0); pdf.set_font("Arial", '', 10); pdf.cell(50, line_h, f": {emp_static['join_date']}", 0, 1)
-        
-        # Right Side (MOVED UP: Currency, Bank, Account No - Payment Date Removed)
-        pdf.set_xy(right_x, y_start); pdf.set_font("Arial", 'B', 10); pdf.cell(35, line_h, "Currency", 0, 0); pdf.set_font("Arial", '', 10); pdf.cell(50, line_h, f": {emp_static['currency']}", 0, 1)
-        pdf.set_x(right_x); pdf.set_font("Arial", 'B', 10); pdf.cell(35, line_h, "Bank Name", 0, 0); pdf.set_font("Arial", '', 10); pdf.cell(50, line_h, f": {emp_static['bank_name']}", 0, 1)
-        pdf.set_x(right_x); pdf.set_font("Arial", 'B', 10); pdf.cell(35, line_h, "Account No.", 0, 0); pdf.set_font("Arial", '', 10); pdf.cell(50, line_h, f": {emp_static['account_number']}", 0, 1)
-        
-        if record.get('exchange_rate') and "USD" in record['currency']:
-            pdf.set_x(right_x); pdf.set_font("Arial", 'B', 10); pdf.cell(35, line_h, "Exchange Rate", 0, 0); pdf.set_font("Arial", '', 10); pdf.cell(50, line_h, f": 1 USD = {record['exchange_rate']:.3f} MYR", 0, 1)
-        pdf.ln(10)
-
-        w_desc, w_amt, h_row = 150, 30, 9
-        def draw_section(title, items, total_val, is_deduct=False):
-            pdf.set_fill_color(230, 230, 230); pdf.set_font("Arial", 'B', 10); 
-            pdf.cell(w_desc + w_amt, 8, f"  {title}", 0, 1, 'L', True); pdf.set_font("Arial", '', 10); 
-            for item in items:
-                if item.get('Amount', 0) > 0:
-                    pdf.cell(w_desc, h_row, "  " + item['Description'], 0, 0, 'L', False)
-                    pdf.cell(w_amt, h_row, f"{item['Amount']:,.2f}  ", 0, 1, 'R', False)
-            pdf.set_fill_color(255, 255, 255); pdf.set_font("Arial", 'B', 10); 
-            label = "Total Deductions" if is_deduct else "Total Earnings"; 
-            curr = emp_static['currency'].split("(")[0].strip()
-            pdf.cell(w_desc, 8, f"{label}  ", "T", 0, 'R', False); 
-            pdf.cell(w_amt, 8, f"{curr} {total_val:,.2f}  ", "T", 1, 'R', False); 
-            pdf.ln(5)
-
-        earn_items = [i for i in record['earnings_list'] if i.get('Amount', 0) > 0]; total_earn = sum(i['Amount'] for i in earn_items)
-        draw_section("EARNINGS", earn_items, total_earn, False)
-        deduct_items = [i for i in record['deductions_list'] if i.get('Amount', 0) > 0]; total_deduct = sum(i['Amount'] for i in deduct_items)
-        draw_section("DEDUCTIONS", deduct_items, total_deduct, True)
-        
-        net_pay = total_earn - total_deduct; curr = emp_static['currency'].split("(")[0].strip()
-        pdf.set_fill_color(33, 47, 61); pdf.set_text_color(255, 255, 255); pdf.set_font("Arial", 'B', 12)
-        pdf.cell(w_desc, 12, "  NET PAYABLE", 0, 0, 'L', True); pdf.cell(w_amt, 12, f"{curr} {net_pay:,.2f}  ", 0, 1, 'R', True)
-        pdf.set_text_color(*COLOR_TEXT); pdf.ln(5)
-        
-        try:
-            net_val = round(net_pay, 2)
-            dollars = int(net_val); cents = int(round((net_val - dollars) * 100))
-            dollars_txt = num2words(dollars, lang='en').upper().replace(",", "")
-            cents_txt = num2words(cents, lang='en').upper().replace(",", "")
-            if "RM" in emp_static['currency']:
-                amount_in_words = f"{dollars_txt} RINGGIT AND {cents_txt} SEN ONLY" if cents > 0 else f"{dollars_txt} RINGGIT ONLY"
-            else:
-                amount_in_words = f"{dollars_txt} DOLLARS AND {cents_txt} CENTS ONLY" if cents > 0 else f"{dollars_txt} DOLLARS ONLY"
-            pdf.set_font("Arial", 'B', 9); pdf.cell(35, 5, "Amount in Words:", 0, 0, 'L')
-            pdf.set_font("Arial", 'I', 9); pdf.multi_cell(0, 5, amount_in_words, 0, 'L')
-        except Exception as e: pdf.set_font("Arial", 'I', 9); pdf.multi_cell(0, 5, f"ERROR: {str(e)}", 0, 'L')
-        
-        if record.get('remarks'):
-            pdf.ln(5); pdf.set_font("Arial", 'B', 9); pdf.cell(20, 5, "Comment:", 0, 0, 'L')
-            pdf.set_font("Arial", '', 9); pdf.multi_cell(0, 5, record['remarks'], 0, 'L')
-
-        pdf.ln(15); pdf.set_font("Arial", 'I', 8); pdf.set_text_color(150, 150, 150); 
-        pdf.cell(0, 5, "This is computer generated no signature required.", 0, 1, 'C')
-        return pdf.output(dest='S').encode('latin-1', errors='replace')
+    shared = get_shared_db()
 
-    # [NEW] POP-UP DIALOG FOR DOWNLOAD
-    @st.dialog("📄 Download Payslip")
-    def show_download_dialog(record, emp_static, file_name):
-        st.write(f"Ready to download payslip for **{emp_static['name']}**")
-        pdf_bytes = create_pdf(record, emp_static)
-        st.download_button("Click to Download PDF", data=pdf_bytes, file_name=file_name, mime="application/pdf", type="primary", use_container_width=True)
+    # Per-session view: a reference to the shared workbook + this session's pending edits
+    st.session_state.db = shared.get()
+    if st.session_state.get("db_version", shared.version) != shared.version: st.toast("🔄 Data updated by another user")
+    st.session_state.db_version = shared.version
+    if "changes" not in st.session_state: st.session_state.changes = payroll_db.ChangeTracker()
+    if "edit_target" not in st.session_state: st.session_state.edit_target = None
+    # Records rows that share an id: the last one is shown, the others stay in the sheet untouched
+    if st.session_state.db.is_loaded('records') and st.session_state.db['records'].duplicates:
+        dup_ids = sorted({r.id for r in st.session_state.db['records'].duplicates})
+        st.warning(f"⚠️ {len(dup_ids)} record id(s) appear more than once in the Records sheet; only the last row is shown. "
+                   f"Fix them in the sheet: {', '.join(dup_ids[:20])}{' …' if len(dup_ids) > 20 else ''}")
 
     # --- SIDEBAR NAV (JS Optimized) ---
     with st.sidebar:
         st.markdown("<h1>SDG Tech</h1>", unsafe_allow_html=True)
         st.markdown("<br>", unsafe_allow_html=True)
         # ⚠️ 注意：这里去掉了 on_change=st.rerun，解决了 Warning
-        page = st.radio("MENU", ["Dashboard", "Payroll Center", "Leave Tracker", "Manage Employees", "⚙️ Settings"], label_visibility="collapsed")
+        # Diagnostics is for [diagnostics] admins in secrets (default: the credentials user)
+        admins = st.secrets.get("diagnostics", {}).get("admins", [st.secrets["credentials"]["username"]])
+        is_admin = st.session_state.get("user") in admins
+        menu = ["Dashboard", "Payroll Center", "Leave Tracker", "Manage Employees", "⚙️ Settings"] + (["🩺 Diagnostics"] if is_admin else [])
+        page = st.radio("MENU", menu, label_visibility="collapsed")
         st.markdown("<br><br><br>", unsafe_allow_html=True)
         if st.button("Log Out"):
             del st.session_state["password_correct"]
             st.rerun()
+        if shared.writer is not None:
+            w = shared.writer.status()
+            if w['state'] == "failed": st.caption(f"⚠️ Save failed, retrying ({w['pending']} pending): {w['error']}")
+            elif w['state'] == "saving": st.caption(f"💾 Saving… ({w['pending']} pending)")
+            else: st.caption("✅ All changes saved")
         st.caption("v17.11 Final JS")
 
     today = date.today(); default_month_idx = (today.month - 2) % 12 
@@ -426,145 +204,156 @@ if check_password():
 
     # --- DASHBOARD ---
     if page == "Dashboard":
-        st.markdown("<h2>Executive Dashboard</h2>", unsafe_allow_html=True)
-        current_global_rate = st.session_state.db['settings']['usd_rate']
+        # A fragment: changing the month or year reruns this section only, not the whole script
+        @st.fragment
+        @timed("fragment.dashboard")
+        def dashboard_view():
+            st.markdown("<h2>Executive Dashboard</h2>", unsafe_allow_html=True)
+            current_global_rate = st.session_state.db['settings']['usd_rate']
         
-        col_d1, col_d2 = st.columns([1, 4])
-        dash_month = col_d1.selectbox("View Month", month_list, index=default_month_idx)
-        dash_year = col_d2.number_input("Year", value=today.year, step=1)
+            col_d1, col_d2 = st.columns([1, 4])
+            dash_month = col_d1.selectbox("View Month", month_list, index=default_month_idx)
+            dash_year = col_d2.number_input("Year", value=today.year, step=1)
         
-        all_recs = st.session_state.db['records']
-        month_recs = [r for r in all_recs if r['month_label'] == dash_month and str(dash_year) in r['payment_date']]
+            all_recs = st.session_state.db['records']
+            all_recs.ensure_year(int(dash_year))
+            month_recs = all_recs.for_month(dash_year, dash_month)
         
-        total_payout_myr = sum(convert_record_to_myr(r, current_global_rate) for r in month_recs if r['status'] == 'Paid')
+            fx_rates = st.session_state.db['settings']['fx_rates']
+            rollup = monthly_rollup(all_recs, fx_rates)
+            total_payout_myr = rollup.myr(dash_year, dash_month, 'Paid', current_global_rate)
         
-        paid_recs_count = sum(1 for r in month_recs if r['status'] == 'Paid')
-        active_emp_count = sum(1 for e in st.session_state.db['employees'].values() if e.get('status') == 'Active')
+            paid_recs_count = rollup.count(dash_year, dash_month, 'Paid')
+            active_emp_count = sum(1 for e in st.session_state.db['employees'].values() if e.is_active)
         
-        m1, m2 = st.columns(2)
-        with m1: st.markdown(f'<div class="metric-card-purple"><div class="metric-label">TOTAL PAYOUT (Est. MYR)</div><div class="metric-value">RM {total_payout_myr:,.2f}</div></div>', unsafe_allow_html=True)
-        with m2: st.markdown(f'<div class="metric-card-blue"><div class="metric-label">PAID EMPLOYEES ({dash_month})</div><div class="metric-value">{paid_recs_count} / {active_emp_count}</div></div>', unsafe_allow_html=True)
-        st.markdown("<br>", unsafe_allow_html=True)
+            m1, m2 = st.columns(2)
+            with m1: st.markdown(f'<div class="metric-card-purple"><div class="metric-label">TOTAL PAYOUT (Est. MYR)</div><div class="metric-value">RM {total_payout_myr:,.2f}</div></div>', unsafe_allow_html=True)
+            with m2: st.markdown(f'<div class="metric-card-blue"><div class="metric-label">PAID EMPLOYEES ({dash_month})</div><div class="metric-value">{paid_recs_count} / {active_emp_count}</div></div>', unsafe_allow_html=True)
+            st.markdown("<br>", unsafe_allow_html=True)
         
-        c_chart, c_summary = st.columns([3, 1])
-        with c_chart:
-            st.markdown('<div class="chart-box"><div style="font-size:16px; font-weight:600; margin-bottom:15px;">Payroll Cost Overview (MYR)</div>', unsafe_allow_html=True)
-            chart_data = {"Month": [], "Expense (MYR)": []}
-            for i, m_short in enumerate([calendar.month_abbr[i] for i in range(1, 13)]):
-                m_full = month_list[i]; m_total = 0.0
-                for r in all_recs:
-                    if r['month_label'] == m_full and r['status'] == 'Paid' and str(dash_year) in r['payment_date']:
-                        m_total += convert_record_to_myr(r, current_global_rate)
-                chart_data["Month"].append(m_short); chart_data["Expense (MYR)"].append(m_total)
-            st.bar_chart(pd.DataFrame(chart_data), x="Month", y="Expense (MYR)", color="#7f56d9", use_container_width=True)
-            st.markdown('</div>', unsafe_allow_html=True)
-
-        with c_summary:
-            year_total_myr = sum(convert_record_to_myr(r, current_global_rate) for r in all_recs if r['status'] == 'Paid' and str(dash_year) in r['payment_date'])
-            st.markdown(f'<div class="summary-card-right"><div class="summary-title">TOTAL PAID {dash_year}</div><div class="summary-val">RM {year_total_myr:,.0f}</div><div style="color:#888; font-size:12px; margin-top:5px;">Est. in MYR</div></div>', unsafe_allow_html=True)
-
-        # [DASHBOARD TABLE]
-        st.markdown("<br>", unsafe_allow_html=True)
-        st.markdown("### Payroll Data")
+            c_chart, c_summary = st.columns([3, 1])
+            with c_chart:
+                st.markdown('<div class="chart-box"><div style="font-size:16px; font-weight:600; margin-bottom:15px;">Payroll Cost Overview (MYR)</div>', unsafe_allow_html=True)
+                chart_data = {"Month": [], "Expense (MYR)": []}
+                for i, m_short in enumerate([calendar.month_abbr[i] for i in range(1, 13)]):
+                    m_full = month_list[i]; m_total = rollup.myr(dash_year, m_full, 'Paid', current_global_rate)
+                    chart_data["Month"].append(m_short); chart_data["Expense (MYR)"].append(m_total)
+                st.bar_chart(pd.DataFrame(chart_data), x="Month", y="Expense (MYR)", color="#7f56d9", use_container_width=True)
+                st.markdown('</div>', unsafe_allow_html=True)
+
+            with c_summary:
+                year_total_myr = rollup.myr(dash_year, None, 'Paid', current_global_rate)
+                st.markdown(f'<div class="summary-card-right"><div class="summary-title">TOTAL PAID {dash_year}</div><div class="summary-val">RM {year_total_myr:,.0f}</div><div style="color:#888; font-size:12px; margin-top:5px;">Est. in MYR</div></div>', unsafe_allow_html=True)
+
+            with st.expander(f"📊 Basic salary vs allowances {dash_year} (paid, Est. MYR)"):
+                # Straight from the columnar snapshot when there is one (as of the last save), else from memory
+                snap = getattr(shared.storage, "snapshot", None)
+                if snap is not None and snap.has("records") and snap.has("line_items"): items = snap.line_items(int(dash_year))
+                else: items = line_item_frame(all_recs.for_year(int(dash_year)))
+                breakdown = earnings_breakdown(items, current_global_rate, rates=fx_rates)
+                if breakdown.empty: st.info("No paid payslips this year.")
+                else:
+                    st.bar_chart(breakdown[["Basic Salary", "Allowances"]], use_container_width=True)
+                    st.dataframe(breakdown.style.format("{:,.2f}"), use_container_width=True)
+
+            # [DASHBOARD TABLE]
+            st.markdown("<br>", unsafe_allow_html=True)
+            st.markdown("### Payroll Data")
         
-        if st.session_state.db['employees']:
-            month_rec_map = {r['employee_id']: r for r in month_recs}
-            table_data = []
-            idx_counter = 1 
-            for emp_id, info in st.session_state.db['employees'].items():
-                if info.get('status') != 'Active' and emp_id not in month_rec_map: continue
-                rec = month_rec_map.get(emp_id)
+            if st.session_state.db['employees']:
+                emps = st.session_state.db['employees']
+                month_rec_map = {r.employee_id: r for r in month_recs}
+                page_names, offset = paged_names("dash", lambda q: employee_idx().search(q, keep=lambda n: emps[n].is_active or n in month_rec_map), {
+                    "Employee": None,
+                    "Net Pay": lambda n: month_rec_map[n].net_salary if n in month_rec_map else float("-inf"),
+                    "Status": lambda n: month_rec_map[n].status if n in month_rec_map else "Pending"})
+                table_data = []
+                idx_counter = offset + 1
+                for emp_id in page_names:
+                    info = emps[emp_id]
+                    rec = month_rec_map.get(emp_id)
                 
-                row = {"No.": idx_counter, "Employee": emp_id, "Role": info["designation"]}
-                if rec:
-                    curr_sym = info['currency'].split('(')[0]
-                    row["Net Pay"] = f"{curr_sym} {rec['net_salary']:,.2f}"
-                    # [Removed Date Here]
-                    row["Status"] = rec['status']
-                else:
-                    row["Net Pay"] = "-"
-                    # [Removed Date Here]
-                    row["Status"] = "Pending"
-                table_data.append(row)
-                idx_counter += 1
+                    row = {"No.": idx_counter, "Employee": emp_id, "Role": info.designation}
+                    if rec:
+                        row["Net Pay"] = f"{info.currency.symbol} {rec.net_salary:,.2f}"
+                        # [Removed Date Here]
+                        row["Status"] = rec.status
+                    else:
+                        row["Net Pay"] = "-"
+                        # [Removed Date Here]
+                        row["Status"] = "Pending"
+                    table_data.append(row)
+                    idx_counter += 1
             
-            if table_data:
-                # [Auto-Expand Table]
-                df_dash = pd.DataFrame(table_data)
-                h_dash = (len(df_dash) + 1) * 35 + 3 
-                st.dataframe(df_dash, use_container_width=True, hide_index=True, height=h_dash)
-            else:
-                st.info("No data available.")
-        else: st.info("No data available.")
+                if table_data:
+                    # [Auto-Expand Table]
+                    df_dash = pd.DataFrame(table_data)
+                    h_dash = (len(df_dash) + 1) * 35 + 3 
+                    st.dataframe(df_dash, use_container_width=True, hide_index=True, height=h_dash)
+                else:
+                    st.info("No data available.")
+            else: st.info("No data available.")
+
+        dashboard_view()
 
     # --- PAYROLL CENTER ---
     elif page == "Payroll Center":
         st.header("Payroll Center")
         
-        c_month, c_year, c_btn = st.columns([2, 1.5, 3])
+        c_month, c_year, c_btn, c_prev = st.columns([2, 1.5, 3, 1.2])
         with c_month: sel_month = st.selectbox("Month", month_list, index=default_month_idx)
         with c_year: sel_year = st.selectbox("Year", [today.year - 1, today.year, today.year + 1], index=1)
+        st.session_state.db['records'].ensure_year(sel_year)
+        gen_statutory = st.checkbox("🧮 Calculate EPF / SOCSO / EIS / PCB for ringgit-paid staff", key="gen_statutory")
         
-        active_emps_only = [e for e, d in st.session_state.db['employees'].items() if d.get('status') == 'Active']
         btn_text = f"Generate {sel_month[:3]} Payroll"
         
         with c_btn:
             st.markdown('<div class="input-label-spacer"></div>', unsafe_allow_html=True)
             if st.button(btn_text, type="primary", use_container_width=True):
-                count_gen = 0
-                default_rate = st.session_state.db['settings']['usd_rate']
-                current_recs_ids = [r['employee_id'] for r in st.session_state.db['records'] if r['month_label'] == sel_month and str(sel_year) in r['payment_date']]
-                
-                for emp_id in active_emps_only:
-                    if emp_id in current_recs_ids: continue 
-                    emp_data = st.session_state.db['employees'][emp_id]
-                    last_rec = get_last_record(emp_id, st.session_state.db)
-                    
-                    # [FIX] Force numeric values to prevent NaN propagation
-                    default_basic = safe_float(emp_data.get('basic_salary', 0.0))
-                    new_earnings = last_rec['earnings_list'] if last_rec else [{"Description": "Basic Salary", "Amount": default_basic}]
-                    new_deductions = last_rec['deductions_list'] if last_rec else [{"Description": "Unpaid Leave", "Amount": 0.0}]
-                    use_rate = safe_float(last_rec['exchange_rate']) if last_rec else default_rate
-                    
-                    # Calculate Net with safe math
-                    total_earn = sum(safe_float(e.get('Amount', 0)) for e in new_earnings)
-                    total_deduct = sum(safe_float(d.get('Amount', 0)) for d in new_deductions)
-                    net = total_earn - total_deduct
-                    
-                    st.session_state.db['records'].append({
-                        "id": f"{emp_id}_{sel_month}_{sel_year}", "employee_id": emp_id, "month_label": sel_month, "payment_date": str(date.today()),
-                        "earnings_list": new_earnings, "deductions_list": new_deductions,
-                        "net_salary": net, "currency": emp_data['currency'], "remarks": "", "status": "Unpaid", "exchange_rate": use_rate
-                    })
-                    count_gen += 1
-                save_db(st.session_state.db)
+                result = generate_payroll(st.session_state.db, sel_month, sel_year, statutory=gen_statutory)
+                for rec in result.created: st.session_state.changes.upsert_record(rec.id)
+                count_gen = len(result.created)
+                save_db()
                 if count_gen > 0: st.success(f"Generated {count_gen} records!")
                 else: st.warning("No new records.")
-                st.rerun()
+        with c_prev:
+            st.markdown('<div class="input-label-spacer"></div>', unsafe_allow_html=True)
+            show_preview = st.button("👁️ Preview", use_container_width=True)
+        if show_preview:
+            preview = generate_payroll(st.session_state.db, sel_month, sel_year, dry_run=True, statutory=gen_statutory)
+            if preview.created: st.dataframe(preview.preview(), use_container_width=True, hide_index=True)
+            st.caption(f"{len(preview.created)} new records would be created, {len(preview.skipped)} already exist.")
 
         st.markdown("<div style='margin-bottom: 5px'></div>", unsafe_allow_html=True)
 
-        all_emps = [e_id for e_id, e_data in st.session_state.db['employees'].items() if e_data.get('status', 'Active') == 'Active']
-        
-        if not all_emps: st.warning("No 'Active' employees found.")
-        else:
+        # Workbench and Payslip Records are fragments: picking an employee, ticking a box in the grid
+        # or editing a line reruns that section only. Anything that changes both reruns the page.
+        @st.fragment
+        @timed("fragment.workbench")
+        def workbench(sel_month, sel_year, all_emps):
             st.subheader("1. Workbench (Edit/Create)")
-            c_emp1, c_emp2 = st.columns([1, 2])
+            c_find, c_emp1, c_emp2 = st.columns([1, 1, 2])
             edit_target_id = st.session_state.get('edit_target')
-            try: sel_idx = all_emps.index(edit_target_id) if edit_target_id in all_emps else 0
-            except: sel_idx = 0
-            with c_emp1: sel_emp = st.selectbox("Select Employee:", all_emps, index=sel_idx)
+            # Type-ahead: the list holds the first matches for what is typed, not the whole staff list
+            emps = st.session_state.db['employees']
+            emp_query = c_find.text_input("🔍 Find employee", key="wb_find", placeholder="Type a name or role")
+            options = employee_idx().suggest(emp_query, 50, keep=lambda n: emps[n].is_active)
+            if edit_target_id in all_emps and edit_target_id not in options: options.insert(0, edit_target_id)
+            if not options: c_emp1.warning("No active employee matches."); return
+            sel_idx = options.index(edit_target_id) if edit_target_id in options else 0
+            with c_emp1: sel_emp = st.selectbox("Select Employee:", options, index=sel_idx)
             
             if edit_target_id and sel_emp != edit_target_id:
                 st.session_state.edit_target = None
-                st.rerun()
+                st.rerun(scope="fragment")
 
-            emp_leaves = [l for l in st.session_state.db['leave_records'] if l['employee_id'] == sel_emp]
+            leaves = st.session_state.db['leave_records']
+            last_leave = leaves.latest(sel_emp)
+            unpaid_days = leaves.unpaid_days(sel_emp, sel_year, month_list.index(sel_month) + 1)
             leave_txt = "No recent leaves."
-            if emp_leaves:
-                l_df = pd.DataFrame(emp_leaves); l_df['dt'] = pd.to_datetime(l_df['date'])
-                last_leave = l_df.sort_values('dt', ascending=False).iloc[0]
-                leave_txt = f"Recent: {last_leave['date']} ({last_leave['reason']}, {last_leave['days']}d)"
+            if last_leave: leave_txt = f"Recent: {last_leave['date']} ({last_leave['reason']}, {last_leave['days']}d)"
+            if unpaid_days: leave_txt += f" · Unpaid in {sel_month}: {unpaid_days:g}d"
             
             with c_emp2:
                 st.markdown('<div class="input-label-spacer"></div>', unsafe_allow_html=True)
@@ -572,27 +361,30 @@ if check_password():
 
             emp_static = st.session_state.db['employees'][sel_emp]
             last_rec = get_last_record(sel_emp, st.session_state.db)
-            curr_rec = next((r for r in st.session_state.db['records'] if r['employee_id'] == sel_emp and r['month_label'] == sel_month and str(sel_year) in r['payment_date']), None)
+            curr_rec = next(iter(st.session_state.db['records'].find(sel_emp, sel_year, sel_month)), None)
             
-            master_basic = safe_float(emp_static.get('basic_salary', 0.0))
-            default_earnings = [{"Description": "Basic Salary", "Amount": master_basic}]
-            d_earn = curr_rec['earnings_list'] if curr_rec else (last_rec['earnings_list'] if last_rec else default_earnings)
-            d_deduct = curr_rec['deductions_list'] if curr_rec else (last_rec['deductions_list'] if last_rec else [{"Description": "Unpaid Leave", "Amount": 0.0}])
-            rem_val = curr_rec.get('remarks', "") if curr_rec else ""
-            default_rate = st.session_state.db['settings']['usd_rate']
-            saved_rate = safe_float(curr_rec.get('exchange_rate', default_rate)) if curr_rec else default_rate
-            
-            try: val_date = datetime.strptime(curr_rec['payment_date'], "%Y-%m-%d").date() if curr_rec else date.today()
-            except: val_date = date.today()
+            master_basic = emp_static.basic_salary
+            default_earnings = [LineItem("Basic Salary", master_basic)]
+            d_earn = curr_rec.earnings if curr_rec else (last_rec.earnings if last_rec else default_earnings)
+            d_deduct = curr_rec.deductions if curr_rec else (last_rec.deductions if last_rec else [LineItem("Unpaid Leave", 0.0)])
+            if unpaid_days:
+                leave_amt = unpaid_leave_deduction(basic_from_earnings(d_earn, master_basic), unpaid_days)
+                if not curr_rec: d_deduct = apply_unpaid_leave(d_deduct, leave_amt)
+                elif not any(d.description == "Unpaid Leave" and d.amount == leave_amt for d in d_deduct):
+                    st.caption(f"ℹ️ {unpaid_days:g} unpaid leave day(s) logged this month ≈ {leave_amt:,.2f} deduction.")
+            rem_val = curr_rec.remarks if curr_rec else ""
+            val_date = (curr_rec.payment_date if curr_rec else None) or date.today()
+            # New payslips start from the rate history on the payment date (Settings), else the default rate
+            saved_rate = curr_rec.exchange_rate if curr_rec else default_rate_for(emp_static.currency, val_date, st.session_state.db['settings'])
 
             with st.form("payroll_form"):
-                if "USD" in emp_static['currency']:
+                if emp_static.currency is not Currency.MYR:
                     c_rate, c_space = st.columns([1, 3])
-                    txn_rate = c_rate.number_input("💱 Exchange Rate (1 USD = ? MYR)", value=float(saved_rate), step=0.01)
+                    txn_rate = c_rate.number_input(f"💱 Exchange Rate (1 {emp_static.currency.code} = ? MYR)", value=float(saved_rate), step=0.01)
                 else: txn_rate = 1.0
                 ce1, ce2 = st.columns(2)
-                with ce1: st.caption("Earnings (+)"); e_earn = st.data_editor(pd.DataFrame(d_earn), num_rows="dynamic", key=f"e_{sel_emp}", column_config={"Amount": st.column_config.NumberColumn(format="%.2f")}, use_container_width=True)
-                with ce2: st.caption("Deductions (-)"); e_deduct = st.data_editor(pd.DataFrame(d_deduct), num_rows="dynamic", key=f"d_{sel_emp}", column_config={"Amount": st.column_config.NumberColumn(format="%.2f")}, use_container_width=True)
+                with ce1: st.caption("Earnings (+)"); e_earn = st.data_editor(pd.DataFrame([i.to_dict() for i in d_earn], columns=["Description", "Amount"]), num_rows="dynamic", key=f"e_{sel_emp}", column_config={"Amount": st.column_config.NumberColumn(format="%.2f")}, use_container_width=True)
+                with ce2: st.caption("Deductions (-)"); e_deduct = st.data_editor(pd.DataFrame([i.to_dict() for i in d_deduct], columns=["Description", "Amount"]), num_rows="dynamic", key=f"d_{sel_emp}", column_config={"Amount": st.column_config.NumberColumn(format="%.2f")}, use_container_width=True)
                 cr1, cr2 = st.columns([3, 1])
                 rem = cr1.text_input("Remarks (Press Enter to Save)", value=rem_val)
                 pay_date = cr2.date_input("Payment Date", value=val_date)
@@ -601,7 +393,14 @@ if check_password():
                 calc_earn = e_earn['Amount'].sum()
                 calc_deduct = e_deduct['Amount'].sum()
                 calc_net = calc_earn - calc_deduct
-                disp_curr = emp_static['currency'].split('(')[0].strip()
+                disp_curr = emp_static.currency.symbol
+                if applies_to(emp_static):
+                    stat = calculate([calc_earn], [age_on(emp_static.date_of_birth, pay_date)])
+                    recalc_stat = st.checkbox("🧮 Recalculate EPF / SOCSO / EIS / PCB on save",
+                                              value=any(d.description in STATUTORY_LINES for d in d_deduct))
+                    st.caption("Statutory for these earnings: " + " · ".join(f"{k} {v:,.2f}" for k, v in stat.deductions(0).items())
+                               + " | Employer: " + " · ".join(f"{k} {v:,.2f}" for k, v in stat.employer(0).items()))
+                else: recalc_stat = False
                 
                 st.markdown(f"""
                 <div style="background-color: #f0f2f6; padding: 15px; border-radius: 8px; text-align: right; margin-bottom: 10px; border: 1px solid #e0e0e0;">
@@ -613,39 +412,108 @@ if check_password():
                 
                 if st.form_submit_button("💾 Save Calculation", type="primary"):
                     net = calc_net
-                    st.session_state.db['records'] = [r for r in st.session_state.db['records'] if not (r['employee_id'] == sel_emp and r['month_label'] == sel_month and str(sel_year) in r['payment_date'])]
-                    st.session_state.db['records'].append({
-                        "id": f"{sel_emp}_{sel_month}_{sel_year}", "employee_id": sel_emp, "month_label": sel_month, "payment_date": str(pay_date),
-                        "earnings_list": e_earn.to_dict('records'), "deductions_list": e_deduct.to_dict('records'),
-                        "net_salary": net, "currency": emp_static['currency'], "remarks": rem, "status": "Unpaid", "exchange_rate": txn_rate
-                    })
+                    if recalc_stat:
+                        new_deduct = apply_statutory(line_items(e_deduct.to_dict('records')), stat.deductions(0))
+                        e_deduct = pd.DataFrame([i.to_dict() for i in new_deduct], columns=["Description", "Amount"])
+                        net = calc_earn - e_deduct['Amount'].sum()
+                    for r in st.session_state.db['records'].find(sel_emp, sel_year, sel_month):
+                        st.session_state.db['records'].delete(r.id); st.session_state.changes.delete_record(r.id)
+                    st.session_state.db['records'].upsert(PayrollRecord(
+                        f"{sel_emp}_{sel_month}_{sel_year}", sel_emp, sel_month, pay_date,
+                        e_earn.to_dict('records'), e_deduct.to_dict('records'),
+                        net, emp_static.currency, rem, "Unpaid", txn_rate))
+                    st.session_state.changes.upsert_record(f"{sel_emp}_{sel_month}_{sel_year}")
                     st.session_state.edit_target = None
-                    save_db(st.session_state.db); st.success(f"Saved for {sel_emp}!"); st.rerun()
+                    save_db(); st.success(f"Saved for {sel_emp}!"); st.rerun()
 
-            st.markdown("---")
+        @st.fragment
+        @timed("fragment.payslip_records")
+        def payslip_records(sel_month, sel_year, all_emps):
             # ------------------------------------------------------------------
             # 2. PAYSLIP RECORDS (EXCEL-STYLE + POPUP DOWNLOAD)
             # ------------------------------------------------------------------
             st.subheader(f"2. Payslip Records ({sel_month} {sel_year})")
-            month_recs = {r['employee_id']: r for r in st.session_state.db['records'] if r['month_label'] == sel_month and str(sel_year) in r['payment_date']}
-            
+            month_recs = st.session_state.db['records'].month_by_employee(sel_year, sel_month)
+
+            # [BULK] whole month -> one ZIP (rendered on a process pool, streamed to a temp file)
+            bulk_key = f"{sel_month}_{sel_year}"
+            c_bulk1, c_bulk2 = st.columns([2, 3])
+            if c_bulk1.button(f"📦 Download all payslips for {sel_month} {sel_year}", disabled=not month_recs):
+                jobs = month_payslip_jobs(st.session_state.db, sel_year, sel_month)
+                bar = st.progress(0.0, text="Rendering payslips...")
+                with tempfile.TemporaryFile() as tmp:
+                    export_payslips_zip(jobs, tmp, cache=get_pdf_cache(), progress=lambda d, t: bar.progress(d / t, text=f"Rendering payslips... {d}/{t}"))
+                    tmp.seek(0); st.session_state.bulk_zip = (bulk_key, tmp.read())
+                bar.empty()
+            bulk_zip = st.session_state.get("bulk_zip")
+            if bulk_zip and bulk_zip[0] == bulk_key:
+                c_bulk2.download_button("⬇️ Save ZIP", data=bulk_zip[1], file_name=f"Payslips_{sel_month}_{sel_year}.zip", mime="application/zip")
+            # [PRINT] whole month -> one PDF, a page per employee in name order
+            c_print1, c_print2 = st.columns([2, 3])
+            if c_print1.button(f"🖨️ One PDF for printing ({sel_month} {sel_year})", disabled=not month_recs):
+                jobs = sorted(month_payslip_jobs(st.session_state.db, sel_year, sel_month), key=lambda j: j[2].name.lower())
+                bar = st.progress(0.0, text="Rendering payslips...")
+                pdf_bytes = create_month_pdf([(rec, emp) for _, rec, emp in jobs], progress=lambda d, t: bar.progress(d / t, text=f"Rendering payslips... {d}/{t}"))
+                st.session_state.bulk_pdf = (bulk_key, pdf_bytes); bar.empty()
+            bulk_pdf = st.session_state.get("bulk_pdf")
+            if bulk_pdf and bulk_pdf[0] == bulk_key:
+                c_print2.download_button("⬇️ Save PDF", data=bulk_pdf[1], file_name=f"Payslips_{sel_month}_{sel_year}.pdf", mime="application/pdf")
+            # [BANK] the month's unpaid records -> one bulk payment file for the bank portal (payroll_bank)
+            with st.expander(f"🏦 Bank payment file ({sel_month} {sel_year})"):
+                formats = get_bank_formats()
+                c_fmt, c_vd, c_mark = st.columns([2, 2, 2])
+                fmt_name = c_fmt.selectbox("Format", list(formats), key="bank_fmt")
+                value_date = c_vd.date_input("Value date", value=date.today(), key="bank_date")
+                flip = c_mark.checkbox("Mark included records as Paid", key="bank_mark")
+                if st.button("Build payment file", disabled=not month_recs):
+                    fmt, cfg = formats[fmt_name], st.secrets.get("bank", {})
+                    try: data, batch, problems = payment_file_bytes(st.session_state.db, sel_year, sel_month, fmt, company=cfg.get("company", ""),
+                                                                    company_account=cfg.get("account", ""), value_date=value_date)
+                    except ValueError as e: data, batch, problems = None, None, [str(e)]
+                    # Only a file that passed its own totals/hash check flips records, in one save
+                    marked = bool(flip and batch and batch.count and not problems)
+                    if marked:
+                        get_shared_db().commit(mark_paid(st.session_state.db, batch.record_ids))
+                        st.session_state.db_version = get_shared_db().version
+                    st.session_state.bank_file = (bulk_key, fmt_name, data, batch, problems, marked)
+                bank_file = st.session_state.get("bank_file")
+                if bank_file and bank_file[0] == bulk_key:
+                    _, b_name, data, batch, problems, marked = bank_file
+                    if problems: st.error("Payment file not usable: " + "; ".join(problems))
+                    else:
+                        b_fmt = formats[b_name]
+                        st.write(f"✅ {batch.summary()} · account hash {batch.hash}" + (" · marked Paid" if marked else ""))
+                        if batch.errors: st.dataframe(pd.DataFrame(batch.errors, columns=["Employee", "Left out because"]), hide_index=True, use_container_width=True)
+                        if batch.count:
+                            st.download_button("⬇️ Save payment file", data=data, mime="text/plain",
+                                               file_name=f"Payout_{sel_month}_{sel_year}_{b_fmt.currency.code}.{'csv' if b_fmt.kind == 'csv' else 'txt'}")
+
+            emps = st.session_state.db['employees']
+            page_names, offset = paged_names("slips", lambda q: employee_idx().search(q, keep=lambda n: emps[n].is_active), {
+                "Employee": None,
+                "Net Pay": lambda n: month_recs[n].net_salary if n in month_recs else 0.0,
+                "Paid": lambda n: n in month_recs and month_recs[n].status == 'Paid'})
             table_data_list = []
-            idx_counter = 1
-            for emp_id in all_emps:
-                emp_static = st.session_state.db['employees'][emp_id]
+            idx_counter = offset + 1
+            for emp_id in page_names:
                 rec = month_recs.get(emp_id)
                 row_data = {"No.": idx_counter, "Employee": emp_id, "Net Pay": 0.0, "Paid": False, "✏️": False, "📥": False}
                 if rec:
-                    row_data["Net Pay"] = float(rec['net_salary'])
-                    row_data["Paid"] = True if rec['status'] == 'Paid' else False
+                    row_data["Net Pay"] = rec.net_salary
+                    row_data["Paid"] = rec.status == 'Paid'
                 table_data_list.append(row_data)
                 idx_counter += 1
             
             if table_data_list:
                 df_payslip = pd.DataFrame(table_data_list)
                 h_payslip = (len(df_payslip) + 1) * 35 + 3
-                edited_payslip = st.data_editor(
-                    df_payslip, use_container_width=True, height=h_payslip,
+                # The key follows the rendered rows and their Paid ticks, and moves on after every applied edit or
+                # ✏️/📥 action: the browser keeps a grid's edits per key, so an old tick would otherwise be applied
+                # again on a later run, e.g. after a Workbench save or another session set the record back to Unpaid
+                rendered = tuple((r["Employee"], r["Paid"]) for r in table_data_list)
+                grid_key = f"payslips_{sel_month}_{sel_year}_{hash(rendered)}_{st.session_state.get('grid_nonce', 0)}"
+                st.data_editor(
+                    df_payslip, use_container_width=True, height=h_payslip, key=grid_key,
                     column_config={
                         "No.": st.column_config.NumberColumn(width="small", disabled=True),
                         "Employee": st.column_config.TextColumn(width="medium", disabled=True),
@@ -656,27 +524,111 @@ if check_password():
                     }, hide_index=True
                 )
                 
-                # LOGIC
+                # LOGIC: only the rows touched in the grid, {row position: {column: new value}}
+                edits = st.session_state[grid_key]["edited_rows"]
                 status_changed = False
-                for index, row in edited_payslip.iterrows():
-                    emp_name = row['Employee']; new_paid = row['Paid']; rec = month_recs.get(emp_name)
-                    if rec:
-                        if new_paid and rec['status'] != 'Paid': rec['status'] = 'Paid'; status_changed = True
-                        elif not new_paid and rec['status'] == 'Paid': rec['status'] = 'Unpaid'; status_changed = True
-                if status_changed: save_db(st.session_state.db); st.toast("Status Updated!")
-
-                rows_to_edit = edited_payslip[edited_payslip['✏️'] == True]
-                if not rows_to_edit.empty: st.session_state.edit_target = rows_to_edit.iloc[0]['Employee']; st.rerun()
+                for i, cols in edits.items():
+                    rec = month_recs.get(page_names[i])
+                    if rec is None or "Paid" not in cols or cols["Paid"] == (rec.status == 'Paid'): continue
+                    st.session_state.db['records'].update(rec.id, status='Paid' if cols["Paid"] else 'Unpaid'); status_changed = True
+                    st.session_state.changes.upsert_record(rec.id)
+                if status_changed: save_db(); st.toast("Status Updated!")
+
+                # ✏️ / 📥 are one-shot actions: a fresh editor next run clears the tick
+                rows_to_edit = [page_names[i] for i, cols in edits.items() if cols.get("✏️")]
+                rows_to_download = [page_names[i] for i, cols in edits.items() if cols.get("📥")]
+                if status_changed or rows_to_edit or rows_to_download: st.session_state.grid_nonce = st.session_state.get('grid_nonce', 0) + 1
+                if rows_to_edit: st.session_state.edit_target = rows_to_edit[0]; st.rerun()
                 
                 # [POP-UP DOWNLOAD LOGIC]
-                rows_to_download = edited_payslip[edited_payslip['📥'] == True]
-                if not rows_to_download.empty:
-                    target = rows_to_download.iloc[0]['Employee']
+                if rows_to_download:
+                    target = rows_to_download[0]
                     if target in month_recs:
                         rec = month_recs[target]
                         safe_name = target.replace(" ", "_")
                         show_download_dialog(rec, st.session_state.db['employees'][target], f"Payslip_{safe_name}.pdf")
 
+        all_emps = [e_id for e_id, e_data in st.session_state.db['employees'].items() if e_data.is_active]
+        
+        if not all_emps: st.warning("No 'Active' employees found.")
+        else:
+            workbench(sel_month, sel_year, all_emps)
+            st.markdown("---")
+            payslip_records(sel_month, sel_year, all_emps)
+
+    # --- LEAVE TRACKER ---
+    elif page == "Leave Tracker":
+        st.header("Leave Tracker")
+        leaves = st.session_state.db['leave_records']
+        emp_names = list(st.session_state.db['employees'].keys())
+
+        st.markdown("### Log Leave")
+        with st.form("leave_form", clear_on_submit=True):
+            l1, l2, l3, l4 = st.columns([2, 1.3, 0.8, 1.5])
+            l_emp = l1.selectbox("Employee", emp_names)
+            l_date = l2.date_input("Date", value=today)
+            l_days = l3.number_input("Days", value=1.0, min_value=0.5, step=0.5)
+            l_type = l4.selectbox("Type", LEAVE_TYPES)
+            l_notes = st.text_input("Notes")
+            if st.form_submit_button("Save Leave", type="primary") and l_emp:
+                d_txt = l_date.strftime("%Y-%m-%d")
+                new_leave = {"id": leave_id(l_emp, d_txt, l_type), "employee_id": l_emp, "date": d_txt, "days": float(l_days), "reason": l_type, "notes": l_notes}
+                leaves.upsert(new_leave); st.session_state.changes.upsert_leave(new_leave['id'])
+                save_db(); st.success(f"Saved {l_type} for {l_emp}"); st.rerun()
+
+        with st.expander("📤 Bulk Import (CSV / Excel)"):
+            st.caption("Columns: employee_id, date (YYYY-MM-DD, DD Mon YYYY or DD/MM/YYYY), days, reason, notes (optional). The same employee/date/type overwrites the existing entry.")
+            up = st.file_uploader("Leave file", type=["csv", "xlsx"], key="leave_upload")
+            if up is not None:
+                try: df_up = pd.read_csv(up, dtype=str) if up.name.lower().endswith(".csv") else pd.read_excel(up, dtype=str)
+                except Exception as e: st.error(f"Could not read file: {e}"); df_up = None
+                if df_up is not None:
+                    new_leaves, errors = leaves_from_frame(df_up, st.session_state.db['employees'])
+                    st.write(f"✅ {len(new_leaves)} valid row(s) · ❌ {len(errors)} error(s)")
+                    if errors: st.dataframe(pd.DataFrame(errors, columns=["Row", "Error"]), hide_index=True, use_container_width=True)
+                    if new_leaves and st.button(f"Import {len(new_leaves)} leave entries", type="primary"):
+                        for l in new_leaves: leaves.upsert(l); st.session_state.changes.upsert_leave(l['id'])
+                        save_db(); st.success(f"Imported {len(new_leaves)} leave entries"); st.rerun()
+
+        st.markdown("---")
+        st.subheader("Leave Records")
+        f1, f2, f3 = st.columns([2, 2, 2])
+        f_emps = f1.multiselect("Employee", emp_names)
+        f_types = f2.multiselect("Type", LEAVE_TYPES)
+        f_range = f3.date_input("Date range", value=(date(today.year, 1, 1), date(today.year, 12, 31)))
+        d_from, d_to = (str(f_range[0]), str(f_range[1])) if len(f_range) == 2 else ("", "9999")
+        shown = [l for e in (f_emps or leaves.employees()) for l in leaves.for_employee(e)
+                 if d_from <= l['date'] <= d_to and (not f_types or l['reason'] in f_types)]
+        shown.sort(key=lambda l: l['date'], reverse=True)
+
+        if not shown: st.info("No leave records for this filter.")
+        else:
+            st.caption(f"{len(shown)} entries · {sum(safe_float(l['days']) for l in shown):g} day(s)")
+            l_table = pd.DataFrame([{"🗑️": False, "Employee": l['employee_id'], "Date": l['date'], "Days": l['days'], "Type": l['reason'], "Notes": l.get('notes', ""), "id": l['id']} for l in shown])
+            edited_leaves = st.data_editor(l_table, hide_index=True, use_container_width=True, key="leave_table",
+                column_config={"🗑️": st.column_config.CheckboxColumn("🗑️", width="small"), "id": None},
+                disabled=["Employee", "Date", "Days", "Type", "Notes"])
+            to_delete = edited_leaves.loc[edited_leaves['🗑️'] == True, 'id'].tolist()
+            if to_delete and st.button(f"Delete {len(to_delete)} selected", type="primary"):
+                for lid in to_delete: leaves.delete(lid); st.session_state.changes.delete_leave(lid)
+                save_db(); st.rerun()
+
+        st.markdown("---")
+        st.subheader("Unpaid Leave by Month")
+        u1, u2, _ = st.columns([2, 1.5, 2.5])
+        u_month = u1.selectbox("Month", month_list, index=default_month_idx, key="leave_month")
+        u_year = u2.selectbox("Year", [today.year - 1, today.year, today.year + 1], index=1, key="leave_year")
+        unpaid = leaves.unpaid_for_month(u_year, month_list.index(u_month) + 1)
+        if not unpaid: st.info(f"No unpaid leave in {u_month} {u_year}.")
+        else:
+            emps = st.session_state.db['employees']
+            st.dataframe(pd.DataFrame([{"Employee": e, "Unpaid Days": d,
+                                        "Est. Deduction": unpaid_leave_deduction(emps[e].basic_salary if e in emps else 0.0, d)}
+                                       for e, d in sorted(unpaid.items())]),
+                         hide_index=True, use_container_width=True,
+                         column_config={"Est. Deduction": st.column_config.NumberColumn(format="%.2f")})
+            st.caption("Generating the month's payroll sets each employee's 'Unpaid Leave' line from these days (basic / 26 per day).")
+
     # --- MANAGE EMPLOYEES ---
     elif page == "Manage Employees":
         st.header("Manage Employees")
@@ -689,115 +641,159 @@ if check_password():
             c7, c8 = st.columns(2); acc = c7.text_input("A/C No"); 
             if st.button("Save New Employee", type="primary"):
                 if name:
-                    st.session_state.db['employees'][name] = {
-                        "name": name, "designation": role, "join_date": join.strftime("%d %b %Y"), "date_of_birth": dob.strftime("%d %b %Y"),
-                        "currency": curr, "bank_name": bank, "account_number": acc,
-                        "basic_salary": 0.0, "status": "Active", "master_remark": "",
-                        "last_increment": None, "last_bonus": None
-                    }
-                    save_db(st.session_state.db); st.success("Added!"); st.rerun()
+                    st.session_state.db['employees'][name] = Employee(
+                        name, role, join.strftime("%d %b %Y"), dob.strftime("%d %b %Y"), curr, bank, acc,
+                        basic_salary=0.0, status="Active")
+                    st.session_state.changes.upsert_employee(name)
+                    save_db(); st.success("Added!")
+
+        with st.expander("📤 Bulk Import Employees / Payroll History (CSV / Excel)"):
+            imp_kind = st.radio("File holds", ["employees", "records"], horizontal=True, key="imp_kind",
+                                format_func=lambda k: "Employees" if k == "employees" else "Payroll records")
+            st.caption("Employees: name, designation, join_date, date_of_birth, currency, bank_name, account_number, basic_salary, "
+                       "status, master_remark — blank cells keep the existing value." if imp_kind == "employees" else
+                       "Records: employee_id, payment_date, month_label, basic_salary or earnings_list / deductions_list (JSON as in "
+                       "the sheet), net_salary (checked), currency, exchange_rate, status, remarks, id. The same id overwrites.")
+            up = st.file_uploader("Import file", type=["csv", "xlsx"], key="bulk_upload")
+            if up is not None:
+                # Validated once per file; the check reruns only when the file or the kind changes
+                check_key = (up.file_id, imp_kind)
+                if st.session_state.get("imp_check", (None,))[0] != check_key:
+                    up.seek(0)
+                    with st.spinner("Checking file..."):
+                        st.session_state.imp_check = (check_key, import_file(up, KINDS[imp_kind], st.session_state.db, dry_run=True, name=up.name))
+                check = st.session_state.imp_check[1]
+                st.write(f"✅ {check.imported} valid row(s) ({check.created} new, {check.updated} updated) · ❌ {check.error_count} error(s)")
+                if check.errors: st.dataframe(pd.DataFrame(check.errors, columns=["Row", "Error"]), hide_index=True, use_container_width=True)
+                if check.imported and st.button(f"Import {check.imported} row(s)", type="primary"):
+                    bar = st.progress(0.0, text="Importing...")
+                    up.seek(0)
+                    result = import_file(up, KINDS[imp_kind], st.session_state.db, commit=lambda ch: get_shared_db().commit(ch), name=up.name,
+                                         progress=lambda r: bar.progress(min(r.rows / max(check.rows, 1), 1.0), text=f"{r.rows:,} / {check.rows:,} rows"))
+                    st.session_state.db_version = get_shared_db().version
+                    st.session_state.pop("imp_check", None)
+                    if result.save_error: bar.empty(); st.error(f"Import stopped: {result.summary()}")
+                    else: st.success(f"Imported: {result.summary()}"); st.rerun()
 
         st.markdown("---")
-        st.subheader("Employee Details")
-        data_list = []
-        for e_id, e in st.session_state.db['employees'].items():
-            inc_txt = f"{e['last_increment']['date']} (+{e['last_increment']['percentage']}%)" if e.get("last_increment") else "-"
-            bon_txt = f"{e['last_bonus']['year']}: {e['last_bonus']['amount']:,.0f}" if e.get("last_bonus") else "-"
-            st_flag = "🟢" if e.get('status') == 'Active' else "⚪"
-            dob_txt = e.get('date_of_birth', '-')
-
-            data_list.append({
-                "Status": st_flag, "Name": e['name'], "Role": e['designation'],
-                "Basic Salary": safe_float(e.get('basic_salary', 0.0)), "Join Date": e['join_date'],
-                "Tenure": calculate_tenure(e['join_date']), "Date of Birth": dob_txt,
-                "Last Increment": inc_txt, "Last Bonus": bon_txt,
-                "Remark": e.get('master_remark', ''), "✏️": False, "🗑️": False
-            })
+        @st.fragment
+        @timed("fragment.employee_details")
+        def employee_details():
+            st.subheader("Employee Details")
+            emps = st.session_state.db['employees']
+            names, _ = paged_names("emps", lambda q: employee_idx().search(q), {
+                "Name": None, "Role": lambda n: emps[n].designation.lower(), "Basic Salary": lambda n: emps[n].basic_salary,
+                "Join Date": lambda n: parse_date(emps[n].join_date) or date.min, "Status": lambda n: emps[n].status})
+            data_list = []
+            for e in (emps[n] for n in names):
+                inc_txt = f"{e.last_increment['date']} (+{e.last_increment['percentage']}%)" if e.last_increment else "-"
+                bon_txt = f"{e.last_bonus['year']}: {e.last_bonus['amount']:,.0f}" if e.last_bonus else "-"
+                st_flag = "🟢" if e.is_active else "⚪"
+
+                data_list.append({
+                    "Status": st_flag, "Name": e.name, "Role": e.designation,
+                    "Basic Salary": e.basic_salary, "Join Date": e.join_date,
+                    "Tenure": calculate_tenure(e.join_date), "Date of Birth": e.date_of_birth,
+                    "Last Increment": inc_txt, "Last Bonus": bon_txt,
+                    "Remark": e.master_remark, "✏️": False, "🗑️": False
+                })
         
-        if data_list:
-            # [Auto-Expand Table] Dynamic Height Calculation
-            df = pd.DataFrame(data_list)
-            h_manage = (len(df) + 1) * 35 + 3
-            edited_df = st.data_editor(
-                df, use_container_width=True, height=h_manage,
-                column_config={
-                    "Status": st.column_config.TextColumn(width="small", help="Green=Active, Grey=Inactive"),
-                    "Basic Salary": st.column_config.NumberColumn(format="%.2f", disabled=True),
-                    "Join Date": st.column_config.TextColumn(disabled=True),
-                    "Date of Birth": st.column_config.TextColumn(disabled=True),
-                    "Last Increment": st.column_config.TextColumn(disabled=True),
-                    "Last Bonus": st.column_config.TextColumn(disabled=True),
-                    "Tenure": st.column_config.TextColumn(help="YearsMonths", disabled=True),
-                    "✏️": st.column_config.CheckboxColumn(label="✏️", help="Edit Details"),
-                    "🗑️": st.column_config.CheckboxColumn(label="🗑️", help="Delete Employee")
-                },
-                disabled=["Status", "Name", "Role"], hide_index=True
-            )
+            if data_list:
+                # [Auto-Expand Table] Dynamic Height Calculation
+                df = pd.DataFrame(data_list)
+                h_manage = (len(df) + 1) * 35 + 3
+                # The key follows the rendered names and remarks and moves on after every applied edit or delete,
+                # so a remark changed later (here or elsewhere) is never overwritten by the old edit
+                rendered = tuple((r["Name"], r["Remark"]) for r in data_list)
+                table_key = f"employees_{hash(rendered)}_{st.session_state.get('emp_nonce', 0)}"
+                st.data_editor(
+                    df, use_container_width=True, height=h_manage, key=table_key,
+                    column_config={
+                        "Status": st.column_config.TextColumn(width="small", help="Green=Active, Grey=Inactive"),
+                        "Basic Salary": st.column_config.NumberColumn(format="%.2f", disabled=True),
+                        "Join Date": st.column_config.TextColumn(disabled=True),
+                        "Date of Birth": st.column_config.TextColumn(disabled=True),
+                        "Last Increment": st.column_config.TextColumn(disabled=True),
+                        "Last Bonus": st.column_config.TextColumn(disabled=True),
+                        "Tenure": st.column_config.TextColumn(help="YearsMonths", disabled=True),
+                        "✏️": st.column_config.CheckboxColumn(label="✏️", help="Edit Details"),
+                        "🗑️": st.column_config.CheckboxColumn(label="🗑️", help="Delete Employee")
+                    },
+                    disabled=["Status", "Name", "Role"], hide_index=True
+                )
             
-            changes_detected = False
-            for index, row in edited_df.iterrows():
-                nm = row['Name']
-                orig = st.session_state.db['employees'][nm]
-                if row['Remark'] != orig.get('master_remark', ''):
-                    orig['master_remark'] = row['Remark']; changes_detected = True
-            if changes_detected: save_db(st.session_state.db); st.toast("Updated remarks!")
-
-            rows_to_delete = edited_df[edited_df['🗑️'] == True]
-            if not rows_to_delete.empty:
-                st.error(f"⚠️ Deleting {len(rows_to_delete)} employees.")
-                if st.button("🚨 Confirm Delete"):
-                    for idx, row in rows_to_delete.iterrows():
-                        target = row['Name']
-                        if target in st.session_state.db['employees']: del st.session_state.db['employees'][target]
-                    save_db(st.session_state.db); st.success("Deleted!"); st.rerun()
-
-            rows_to_edit = edited_df[edited_df['✏️'] == True]
-            if not rows_to_edit.empty:
-                st.markdown("### ✏️ Edit Employee Details")
-                for idx, row in rows_to_edit.iterrows():
-                    target_emp = row['Name']
-                    curr_data = st.session_state.db['employees'][target_emp]
-                    st.info(f"Editing: **{target_emp}**")
-                    with st.form(f"edit_full_{target_emp}"):
-                        c_a, c_b = st.columns(2)
-                        status_opts = ["Active", "Inactive"]
-                        c_stat = curr_data.get('status')
-                        if c_stat == 'Resigned': c_stat = 'Inactive'
-                        curr_status_idx = 0 if c_stat == 'Active' else 1
-                        new_status = c_a.selectbox("Status", status_opts, index=curr_status_idx)
-                        new_salary = c_b.number_input("Basic Salary", value=safe_float(curr_data.get('basic_salary', 0.0)), step=100.0)
+                # Only the rows touched in the table, {row position: {column: new value}}
+                edits = st.session_state[table_key]["edited_rows"]
+                changes_detected = False
+                for i, cols in edits.items():
+                    nm = names[i]
+                    orig = st.session_state.db['employees'][nm]
+                    if "Remark" in cols and (cols['Remark'] or "") != orig.master_remark:
+                        orig.master_remark = cols['Remark'] or ""; changes_detected = True
+                        st.session_state.changes.upsert_employee(nm)
+                if changes_detected:
+                    st.session_state.emp_nonce = st.session_state.get('emp_nonce', 0) + 1
+                    save_db(); st.toast("Updated remarks!")
+
+                rows_to_delete = [names[i] for i, cols in edits.items() if cols.get('🗑️')]
+                if rows_to_delete:
+                    st.error(f"⚠️ Deleting {len(rows_to_delete)} employees.")
+                    if st.button("🚨 Confirm Delete"):
+                        for target in rows_to_delete:
+                            if target in st.session_state.db['employees']:
+                                del st.session_state.db['employees'][target]; st.session_state.changes.delete_employee(target)
+                        st.session_state.emp_nonce = st.session_state.get('emp_nonce', 0) + 1
+                        save_db(); st.success("Deleted!"); st.rerun(scope="fragment")
+
+                rows_to_edit = [names[i] for i, cols in edits.items() if cols.get('✏️')]
+                if rows_to_edit:
+                    st.markdown("### ✏️ Edit Employee Details")
+                    for target_emp in rows_to_edit:
+                        curr_data = st.session_state.db['employees'][target_emp]
+                        st.info(f"Editing: **{target_emp}**")
+                        with st.form(f"edit_full_{target_emp}"):
+                            c_a, c_b = st.columns(2)
+                            status_opts = ["Active", "Inactive"]
+                            c_stat = curr_data.status
+                            if c_stat == 'Resigned': c_stat = 'Inactive'
+                            curr_status_idx = 0 if c_stat == 'Active' else 1
+                            new_status = c_a.selectbox("Status", status_opts, index=curr_status_idx)
+                            new_salary = c_b.number_input("Basic Salary", value=curr_data.basic_salary, step=100.0)
                         
-                        try: def_join = datetime.strptime(curr_data['join_date'], "%d %b %Y").date()
-                        except: def_join = date.today()
-                        new_join = st.date_input("Join Date", value=def_join)
+                            try: def_join = datetime.strptime(curr_data.join_date, "%d %b %Y").date()
+                            except: def_join = date.today()
+                            new_join = st.date_input("Join Date", value=def_join)
                         
-                        try: def_dob = datetime.strptime(curr_data.get('date_of_birth', ''), "%d %b %Y").date()
-                        except: def_dob = date.today()
-                        # [DATE FIX]
-                        new_dob = st.date_input("Date of Birth", value=def_dob, min_value=date(1900,1,1), max_value=date.today())
-
-                        st.markdown("**Last Increment**"); ci1, ci2 = st.columns(2)
-                        try: def_inc_date = datetime.strptime(curr_data['last_increment']['date'], "%d %b %Y").date()
-                        except: def_inc_date = date.today()
-                        def_inc_pct = safe_float(curr_data['last_increment']['percentage']) if curr_data.get('last_increment') else 0.0
-                        new_inc_date = ci1.date_input("Date", value=def_inc_date, key=f"id_{target_emp}")
-                        new_inc_pct = ci2.number_input("Percentage (%)", value=def_inc_pct, step=1.0, key=f"ip_{target_emp}")
+                            try: def_dob = datetime.strptime(curr_data.date_of_birth, "%d %b %Y").date()
+                            except: def_dob = date.today()
+                            # [DATE FIX]
+                            new_dob = st.date_input("Date of Birth", value=def_dob, min_value=date(1900,1,1), max_value=date.today())
+
+                            st.markdown("**Last Increment**"); ci1, ci2 = st.columns(2)
+                            try: def_inc_date = datetime.strptime(curr_data.last_increment['date'], "%d %b %Y").date()
+                            except: def_inc_date = date.today()
+                            def_inc_pct = safe_float(curr_data.last_increment['percentage']) if curr_data.last_increment else 0.0
+                            new_inc_date = ci1.date_input("Date", value=def_inc_date, key=f"id_{target_emp}")
+                            new_inc_pct = ci2.number_input("Percentage (%)", value=def_inc_pct, step=1.0, key=f"ip_{target_emp}")
                         
-                        st.markdown("**Last Bonus**"); cb1, cb2 = st.columns(2)
-                        def_bon_year = int(curr_data['last_bonus']['year']) if curr_data.get('last_bonus') else date.today().year
-                        def_bon_amt = safe_float(curr_data['last_bonus']['amount']) if curr_data.get('last_bonus') else 0.0
-                        new_bon_year = cb1.number_input("Year", value=def_bon_year, step=1, key=f"by_{target_emp}")
-                        new_bon_amt = cb2.number_input("Amount", value=def_bon_amt, step=100.0, key=f"ba_{target_emp}")
+                            st.markdown("**Last Bonus**"); cb1, cb2 = st.columns(2)
+                            def_bon_year = int(curr_data.last_bonus['year']) if curr_data.last_bonus else date.today().year
+                            def_bon_amt = safe_float(curr_data.last_bonus['amount']) if curr_data.last_bonus else 0.0
+                            new_bon_year = cb1.number_input("Year", value=def_bon_year, step=1, key=f"by_{target_emp}")
+                            new_bon_amt = cb2.number_input("Amount", value=def_bon_amt, step=100.0, key=f"ba_{target_emp}")
                         
-                        if st.form_submit_button("💾 Save Changes"):
-                            curr_data['status'] = new_status
-                            curr_data['basic_salary'] = new_salary
-                            curr_data['join_date'] = new_join.strftime("%d %b %Y")
-                            curr_data['date_of_birth'] = new_dob.strftime("%d %b %Y")
-                            if new_inc_pct > 0: curr_data['last_increment'] = {"date": new_inc_date.strftime("%d %b %Y"), "percentage": new_inc_pct}
-                            if new_bon_amt > 0: curr_data['last_bonus'] = {"year": int(new_bon_year), "amount": new_bon_amt}
-                            save_db(st.session_state.db); st.success("Updated!"); st.rerun()
-        else: st.info("No employees found.")
+                            if st.form_submit_button("💾 Save Changes"):
+                                curr_data.status = new_status
+                                curr_data.basic_salary = new_salary
+                                curr_data.join_date = new_join.strftime("%d %b %Y")
+                                curr_data.date_of_birth = new_dob.strftime("%d %b %Y")
+                                if new_inc_pct > 0: curr_data.last_increment = {"date": new_inc_date.strftime("%d %b %Y"), "percentage": new_inc_pct}
+                                if new_bon_amt > 0: curr_data.last_bonus = {"year": int(new_bon_year), "amount": new_bon_amt}
+                                st.session_state.changes.upsert_employee(target_emp)
+                                save_db(); st.success("Updated!"); st.rerun(scope="fragment")
+            else: st.info("No employees found.")
+
+        employee_details()
 
     elif page == "⚙️ Settings":
         st.header("System Settings")
@@ -807,4 +803,102 @@ if check_password():
         new_rate = st.number_input("Rate", value=current, step=0.01)
         if st.button("Update Rate", type="primary"):
             st.session_state.db['settings']['usd_rate'] = new_rate
-            save_db(st.session_state.db); st.success("Updated!")
+            st.session_state.changes.touch_settings()
+            save_db(); st.success("Updated!")
+
+        st.divider()
+        st.subheader("💱 Exchange Rate History")
+        st.caption("MYR per 1 unit, effective from the date until the next entry. Dashboard totals price each payslip "
+                   "with its own saved rate, else the rate on its payment date, else the default above (USD).")
+        rates = st.session_state.db['settings']['fx_rates']
+        with st.form("rate_form", clear_on_submit=True):
+            r1, r2, r3 = st.columns(3)
+            r_code = r1.text_input("Currency", value="USD", max_chars=3)
+            r_date = r2.date_input("Effective from", value=today)
+            r_rate = r3.number_input("Rate (MYR)", value=float(st.session_state.db['settings']['usd_rate']), min_value=0.0001, step=0.01, format="%.4f")
+            if st.form_submit_button("Add Rate", type="primary"):
+                new_rows, errors = rates_from_frame(pd.DataFrame([{"currency": r_code, "effective_date": r_date, "rate": r_rate}]))
+                if errors: st.error(errors[0][1])
+                else:
+                    rates.set(*new_rows[0]); st.session_state.changes.touch_settings()
+                    save_db(); st.success(f"Saved {new_rows[0][0]} from {r_date}"); st.rerun()
+
+        with st.expander("📤 Bulk Import Rate History (CSV / Excel)"):
+            st.caption("Columns: currency (3-letter code), effective_date (or date), rate. The same currency/date overwrites the existing rate.")
+            up = st.file_uploader("Rate file", type=["csv", "xlsx"], key="rate_upload")
+            if up is not None:
+                try: df_up = pd.read_csv(up, dtype=str) if up.name.lower().endswith(".csv") else pd.read_excel(up, dtype=str)
+                except Exception as e: st.error(f"Could not read file: {e}"); df_up = None
+                if df_up is not None:
+                    new_rows, errors = rates_from_frame(df_up)
+                    st.write(f"✅ {len(new_rows)} valid row(s) · ❌ {len(errors)} error(s)")
+                    if errors: st.dataframe(pd.DataFrame(errors, columns=["Row", "Error"]), hide_index=True, use_container_width=True)
+                    if new_rows and st.button(f"Import {len(new_rows)} rates", type="primary"):
+                        for row in new_rows: rates.set(*row)
+                        st.session_state.changes.touch_settings()
+                        save_db(); st.success(f"Imported {len(new_rows)} rates"); st.rerun()
+
+        if len(rates):
+            r_table = rates.frame().sort_values(["currency", "effective_date"], ascending=[True, False])
+            r_table.insert(0, "🗑️", False)
+            # Keyed by the table version: ticks left from before a delete never land on the rows that moved up
+            edited_rates = st.data_editor(r_table, hide_index=True, use_container_width=True, key=f"rate_table_{rates.version}",
+                column_config={"🗑️": st.column_config.CheckboxColumn("🗑️", width="small"),
+                               "rate": st.column_config.NumberColumn(format="%.4f")},
+                disabled=["currency", "effective_date", "rate"])
+            to_delete = edited_rates.loc[edited_rates['🗑️'] == True, ['currency', 'effective_date']].values.tolist()
+            if to_delete and st.button(f"Delete {len(to_delete)} selected rate(s)", type="primary"):
+                for code, on in to_delete: rates.remove(code, on)
+                st.session_state.changes.touch_settings()
+                save_db(); st.rerun()
+
+        st.divider()
+        storage = shared.storage
+        source = "Google Sheets" if storage.name == "sheets" else f"SQLite ({storage.path})"
+        st.caption(f"Storage: {source} · data cache version {shared.version} (shared by all sessions on this server)")
+        snap = getattr(storage, "snapshot", None)
+        if snap is not None:
+            age = snap.age("records")
+            st.caption(f"Local snapshot: {snap.path} · records last read from storage "
+                       + (f"{age / 60:.0f} min ago" if age is not None else "— next load reads storage"))
+        # Only when another page already loaded Records; Settings itself never reads that sheet
+        recs = st.session_state.db['records'] if st.session_state.db.is_loaded('records') else None
+        if recs is not None and recs.since_year is not None:
+            st.caption(f"Payroll records from {recs.since_year} onwards are loaded; older years load when you open them.")
+            if st.button("📚 Load all years"): recs.load_all(); st.rerun()
+        if st.button(f"🔄 Reload from {'Google Sheets' if storage.name == 'sheets' else 'database'}"):
+            shared.invalidate(); st.rerun()
+
+    elif page == "🩺 Diagnostics":
+        st.header("Diagnostics")
+        st.caption(f"This server process since {datetime.fromtimestamp(METRICS.started):%d %b %Y %H:%M}. "
+                   f"p50 / p95 are over each operation's last {METRICS.window} calls.")
+        rows = METRICS.summary()
+        if not rows: st.info("Nothing measured yet.")
+        else:
+            df_m = pd.DataFrame(rows)
+            sheets = df_m[df_m['operation'].str.startswith("sheets.")]
+            m1, m2, m3 = st.columns(3)
+            m1.metric("Google Sheets calls", f"{int(sheets['calls'].sum()):,}")
+            m2.metric("Sent to Google Sheets", f"{sheets['bytes_sent'].sum() / 1024:,.1f} KB")
+            m3.metric("Time in Google Sheets", f"{sheets['total_s'].sum():,.1f} s")
+            st.dataframe(df_m, hide_index=True, use_container_width=True, column_config={
+                "p50_ms": st.column_config.NumberColumn("p50 (ms)", format="%.1f"),
+                "p95_ms": st.column_config.NumberColumn("p95 (ms)", format="%.1f"),
+                "max_ms": st.column_config.NumberColumn("max (ms)", format="%.1f"),
+                "total_s": st.column_config.NumberColumn("total (s)", format="%.2f"),
+                "bytes_sent": st.column_config.NumberColumn("bytes sent", format="%d")})
+
+        st.subheader("Slowest recent reruns")
+        slow = METRICS.slowest_reruns()
+        if slow:
+            st.dataframe(pd.DataFrame([{"At": datetime.fromtimestamp(t).strftime("%d %b %H:%M:%S"), "Page": p, "Seconds": round(s, 3)}
+                                       for t, p, s in slow]), hide_index=True, use_container_width=True)
+        else: st.caption("No reruns recorded yet.")
+
+        c1, c2 = st.columns(2)
+        c1.download_button("⬇️ Prometheus metrics", METRICS.prometheus(), file_name="payroll_metrics.prom", mime="text/plain")
+        if c2.button("Reset counters"): METRICS.reset(); st.rerun()
+
+    # Whole-script time for this page (reruns cut short by st.rerun() are not counted)
+    METRICS.rerun(page, time.perf_counter() - rerun_started)
@@ -0,0 +1,236 @@
+"""Bank payment (bulk payout) files from a month's payroll records.
+
+    fmt = BANK_FORMATS["fixed"]                   # or bank_format(cfg) from a [bank_formats.<name>] table
+    with open("payout.txt", "w", encoding="ascii", newline="") as f:
+        batch = write_payment_file(f, db, 2024, "May", fmt, company="SDG Tech", value_date=date(2024, 5, 25))
+    problems = verify_payment_file("payout.txt", fmt, batch)
+    changes = mark_paid(db, batch.record_ids)      # optional, then one storage.save / SharedDB.commit
+
+A format is a header line, one detail line per payee and a trailer line, each a list of fields:
+a name from HEADER_FIELDS / DETAIL_FIELDS / TRAILER_FIELDS or a "=literal", with a width for
+fixed-width files. The file is written in one pass over the records: each payee line goes out as
+it is read and only the running count, amount total and account hash are kept, so totals belong
+in the trailer, never the header.
+"""
+import csv
+import io
+import os
+import re
+import unicodedata
+from datetime import date
+
+from payroll_db import ChangeTracker
+from payroll_models import Currency
+
+HEADER_FIELDS = {"company", "company_account", "value_date", "batch_ref", "currency"}
+DETAIL_FIELDS = {"employee_id", "name", "bank", "account", "amount", "amount_cents", "reference", "currency"}
+TRAILER_FIELDS = HEADER_FIELDS | {"count", "total", "total_cents", "hash"}
+NUMERIC = {"amount", "amount_cents", "count", "total", "total_cents", "hash"}
+
+
+class BankFormat:
+    """kind "csv" or "fixed"; header / detail / trailer are field names (CSV) or [name, width] pairs.
+    Only records in currency, with a status in statuses, go in the file."""
+
+    def __init__(self, name, kind="csv", detail=(), header=(), trailer=(), currency="MYR", statuses=("Unpaid",),
+                 delimiter=",", titles=False, account_digits=(6, 20), hash_digits=15, newline="\r\n"):
+        if kind not in ("csv", "fixed"): raise ValueError(f"{name}: kind must be 'csv' or 'fixed', not {kind!r}")
+        self.name, self.kind, self.currency, self.statuses = name, kind, Currency.parse(currency), tuple(statuses)
+        self.delimiter, self.titles, self.newline = delimiter, bool(titles), newline
+        self.account_digits, self.hash_digits = tuple(account_digits), int(hash_digits)
+        self.header = self._fields(header, HEADER_FIELDS, "header")
+        self.detail = self._fields(detail, DETAIL_FIELDS, "detail")
+        self.trailer = self._fields(trailer, TRAILER_FIELDS, "trailer")
+        if not self.detail: raise ValueError(f"{name}: the detail line has no fields")
+        # A fixed-width account column never truncates: longer numbers are rejected per payee instead
+        width = dict(self.detail).get("account")
+        if kind == "fixed" and width: self.account_digits = (self.account_digits[0], min(self.account_digits[1], width))
+
+    def _fields(self, spec, allowed, part):
+        out = []
+        for f in spec:
+            field, width = (f, 0) if isinstance(f, str) else (f[0], int(f[1]))
+            if not field.startswith("=") and field not in allowed:
+                hint = " (totals go in the trailer: the file is written in one pass)" if field in TRAILER_FIELDS else ""
+                raise ValueError(f"{self.name}: unknown {part} field {field!r}{hint}")
+            if self.kind == "fixed" and width <= 0: raise ValueError(f"{self.name}: {part} field {field!r} needs a width")
+            out.append((field, width))
+        return out
+
+
+# Built-in layouts; deployments add their bank's own under [bank_formats.<name>] in secrets
+BANK_FORMATS = {
+    "csv": BankFormat("csv", "csv", titles=True,
+                      detail=["employee_id", "name", "bank", "account", "amount", "reference"],
+                      trailer=["=TOTAL", "count", "total", "hash"]),
+    "fixed": BankFormat("fixed", "fixed",
+                        header=[("=H", 1), ("company", 40), ("company_account", 20), ("value_date", 8), ("batch_ref", 20), ("currency", 3)],
+                        detail=[("=D", 1), ("account", 20), ("name", 40), ("amount_cents", 15), ("bank", 20), ("reference", 30)],
+                        trailer=[("=T", 1), ("count", 6), ("total_cents", 15), ("hash", 15)]),
+}
+
+
+def bank_format(name, cfg):
+    """BankFormat from a config table, e.g. {"kind": "fixed", "detail": [["account", 16], ...], ...}."""
+    return BankFormat(name, **dict(cfg))
+
+
+# ==========================================
+# PAYEES
+# ==========================================
+class PaymentBatch:
+    def __init__(self):
+        self.count = self.total_cents = self.hash = self.skipped = 0
+        self.record_ids = []
+        self.errors = []        # (employee, message): records left out of the file
+
+    @property
+    def total(self):
+        return self.total_cents / 100
+
+    def summary(self):
+        return f"{self.count} payee(s), {self.total:,.2f} total, {len(self.errors)} rejected, {self.skipped} not due"
+
+
+def _ascii(v):
+    # Bank portals take plain ASCII; accents are folded, line breaks and control characters dropped
+    txt = unicodedata.normalize("NFKD", str(v or "")).encode("ascii", "ignore").decode()
+    return re.sub(r"[\x00-\x1f\x7f]+", " ", txt).strip()
+
+
+def payees(db, year, month_label, fmt, batch):
+    """Detail values per record of the month that is due in fmt's currency, in employee order.
+    Records that cannot be paid are added to batch.errors; the rest are counted into batch."""
+    lo, hi = fmt.account_digits
+    needs_bank = any(f == "bank" for f, _ in fmt.detail)
+    for rec in sorted(db['records'].for_month(year, month_label), key=lambda r: (r.employee_id.lower(), r.id)):
+        if rec.status not in fmt.statuses or rec.currency is not fmt.currency:
+            batch.skipped += 1; continue
+        emp = db['employees'].get(rec.employee_id)
+        if emp is None:
+            batch.errors.append((rec.employee_id, "Employee no longer on file")); continue
+        account = re.sub(r"[\s-]", "", str(emp.account_number or ""))
+        cents = int(round(rec.net_salary * 100))
+        if not account.isdigit() or not lo <= len(account) <= hi:
+            batch.errors.append((rec.employee_id, f"Account number '{emp.account_number}' is not {lo}-{hi} digits")); continue
+        if needs_bank and not _ascii(emp.bank_name):
+            batch.errors.append((rec.employee_id, "No bank name")); continue
+        if cents <= 0:
+            batch.errors.append((rec.employee_id, f"Net pay {rec.net_salary:,.2f} is not a payout")); continue
+        batch.count += 1; batch.total_cents += cents
+        batch.hash = (batch.hash + int(account)) % 10 ** fmt.hash_digits
+        batch.record_ids.append(rec.id)
+        yield {"employee_id": _ascii(rec.employee_id), "name": _ascii(emp.name).upper(), "bank": _ascii(emp.bank_name),
+               "account": account, "amount": f"{cents / 100:.2f}", "amount_cents": str(cents),
+               "reference": _ascii(f"SALARY {rec.month_label[:3]} {year} {rec.employee_id}").upper(),
+               "currency": fmt.currency.code}
+
+
+# ==========================================
+# WRITING / CHECKING
+# ==========================================
+def _line(fmt, fields, values, writer):
+    cells = []
+    for field, width in fields:
+        v = field[1:] if field.startswith("=") else str(values[field])
+        if fmt.kind == "fixed":
+            if field in NUMERIC:
+                if len(v) > width: raise ValueError(f"{field} {v} does not fit in {width} characters")
+                v = v.rjust(width, "0")
+            else: v = v[:width].ljust(width)
+        cells.append(v)
+    if fmt.kind == "csv": writer.writerow(cells)
+    else: writer.write("".join(cells) + fmt.newline)
+
+
+def write_payment_file(out, db, year, month_label, fmt, company="", company_account="", value_date=None, batch_ref=None):
+    """Writes the month's payment file for fmt to the text stream out and returns the PaymentBatch."""
+    value_date = value_date or date.today()
+    batch = PaymentBatch()
+    static = {"company": _ascii(company).upper(), "company_account": re.sub(r"[\s-]", "", str(company_account or "")),
+              "value_date": value_date.strftime("%Y%m%d"), "currency": fmt.currency.code,
+              "batch_ref": _ascii(batch_ref or f"SAL{year}{month_label[:3].upper()}")}
+    writer = csv.writer(out, delimiter=fmt.delimiter, lineterminator=fmt.newline) if fmt.kind == "csv" else out
+    if fmt.header: _line(fmt, fmt.header, static, writer)
+    if fmt.titles: writer.writerow([f.lstrip("=") for f, _ in fmt.detail])
+    for values in payees(db, year, month_label, fmt, batch): _line(fmt, fmt.detail, values, writer)
+    if fmt.trailer:
+        _line(fmt, fmt.trailer, dict(static, count=batch.count, total=f"{batch.total:.2f}", total_cents=batch.total_cents,
+                                     hash=batch.hash), writer)
+    return batch
+
+
+def _cells(fmt, fields, line):
+    if fmt.kind == "csv": return dict(zip((f for f, _ in fields), next(csv.reader([line], delimiter=fmt.delimiter))))
+    cells, pos = {}, 0
+    for field, width in fields:
+        cells[field] = line[pos:pos + width].strip(); pos += width
+    return cells
+
+
+def verify_payment_file(source, fmt, batch=None):
+    """Re-reads a payment file (path or text stream) line by line and returns its problems (empty list = good):
+    detail lines whose count, amount total or account hash disagree with the trailer, or with batch if given."""
+    f = open(source, encoding="ascii", newline="") if isinstance(source, (str, os.PathLike)) else source
+    problems, count, cents, hashed, trailer = [], 0, 0, 0, None
+    try:
+        lines = (ln.rstrip("\r\n") for ln in f)
+        if fmt.header: next(lines, None)
+        if fmt.titles: next(lines, None)
+        pending = None
+        for n, line in enumerate(lines, start=1 + bool(fmt.header) + fmt.titles):
+            if pending is not None:
+                # A line behind it means pending was a detail line, not the trailer
+                count, cents, hashed = _add(fmt, pending, count, cents, hashed, problems)
+            pending = (n, line)
+        if pending is not None and fmt.trailer: trailer = _cells(fmt, fmt.trailer, pending[1])
+        elif pending is not None: count, cents, hashed = _add(fmt, pending, count, cents, hashed, problems)
+    finally:
+        if f is not source: f.close()
+    found = {"count": count, "total_cents": cents, "hash": hashed}
+    if trailer is not None:
+        given = {"count": trailer.get("count"), "hash": trailer.get("hash"),
+                 "total_cents": trailer.get("total_cents") or (_cents(trailer["total"]) if "total" in trailer else None)}
+        for key, value in found.items():
+            if given[key] not in (None, "") and _int(given[key]) != value: problems.append(f"Trailer {key} {given[key]}, lines add up to {value}")
+    elif fmt.trailer: problems.append("No trailer line")
+    if batch is not None:
+        for key, value in found.items():
+            if getattr(batch, key) != value: problems.append(f"{key}: wrote {getattr(batch, key)}, file has {value}")
+    return problems
+
+
+def _int(v):
+    try: return int(str(v).strip())
+    except ValueError: return None
+
+
+def _cents(v):
+    try: return int(round(float(str(v).strip()) * 100))
+    except ValueError: return None
+
+
+def _add(fmt, numbered, count, cents, hashed, problems):
+    n, line = numbered
+    cells = _cells(fmt, fmt.detail, line)
+    amount = _int(cells["amount_cents"]) if "amount_cents" in cells else _cents(cells.get("amount", ""))
+    if amount is None: problems.append(f"Line {n}: unreadable amount")
+    account = _int(cells.get("account", "0"))
+    if account is None: problems.append(f"Line {n}: unreadable account number")
+    return count + 1, cents + (amount or 0), (hashed + (account or 0)) % 10 ** fmt.hash_digits
+
+
+def payment_file_bytes(db, year, month_label, fmt, **kwargs):
+    """(file bytes, PaymentBatch, problems) with the file checked against its own trailer and batch."""
+    buf = io.StringIO(newline="")
+    batch = write_payment_file(buf, db, year, month_label, fmt, **kwargs)
+    buf.seek(0)
+    return buf.getvalue().encode("ascii"), batch, verify_payment_file(buf, fmt, batch)
+
+
+def mark_paid(db, record_ids):
+    """Flips the records to Paid; returns the ChangeTracker to save in one write."""
+    changes = ChangeTracker()
+    for rec_id in record_ids:
+        db['records'].update(rec_id, status="Paid"); changes.upsert_record(rec_id)
+    return changes
@@ -0,0 +1,869 @@
+import bisect
+import json
+import threading
+from datetime import date, datetime
+import numpy as np
+import pandas as pd
+
+from payroll_fx import RATE_COLUMNS, RateTable
+from payroll_metrics import timed
+from payroll_models import Currency, Employee, PayrollRecord, currency_cell, date_cell, line_items, parse_date, safe_float
+
+# ==========================================
+# DATA LAYER: cleaning, (de)serialisation, persistence
+# ==========================================
+
+EMP_COLUMNS = ["name", "designation", "join_date", "date_of_birth", "currency", "bank_name", "account_number",
+               "basic_salary", "status", "master_remark", "last_increment", "last_bonus"]
+REC_COLUMNS = ["id", "employee_id", "month_label", "payment_date", "earnings_list", "deductions_list",
+               "net_salary", "currency", "remarks", "status", "exchange_rate"]
+LEAVE_COLUMNS = ["id", "employee_id", "date", "days", "reason", "notes"]
+LEAVE_TYPES = ["Annual Leave", "Medical Leave", "Unpaid Leave", "Emergency Leave", "Other"]
+UNPAID_LEAVE = "Unpaid Leave"
+
+
+def employee_to_row(info):
+    return {
+        "name": info.name,
+        "designation": info.designation,
+        "join_date": info.join_date,
+        "date_of_birth": info.date_of_birth,
+        "currency": info.currency_text,
+        "bank_name": info.bank_name,
+        "account_number": info.account_number,
+        "basic_salary": info.basic_salary,
+        "status": info.status,
+        "master_remark": info.master_remark,
+        "last_increment": json.dumps(info.last_increment) if info.last_increment else None,
+        "last_bonus": json.dumps(info.last_bonus) if info.last_bonus else None
+    }
+
+
+def record_to_row(r):
+    return {
+        "id": r.id,
+        "employee_id": r.employee_id,
+        "month_label": r.month_label,
+        "payment_date": r.payment_date_text,
+        "earnings_list": json.dumps([i.to_dict() for i in r.earnings]),
+        "deductions_list": json.dumps([i.to_dict() for i in r.deductions]),
+        "net_salary": r.net_salary,
+        "currency": r.currency_text,
+        "remarks": r.remarks,
+        "status": r.status,
+        "exchange_rate": r.exchange_rate
+    }
+
+
+def leave_to_row(l):
+    return {
+        "id": l['id'],
+        "employee_id": l['employee_id'],
+        "date": l['date'],
+        "days": safe_float(l['days']),
+        "reason": l['reason'],
+        "notes": l.get('notes', '')
+    }
+
+
+def leave_id(employee_id, leave_date, reason):
+    # Natural key: re-importing the same leave updates it instead of duplicating it
+    return f"{employee_id}_{leave_date}_{reason}"
+
+
+LEAVE_DATE_FORMATS = ["%Y-%m-%d", "%d %b %Y", "%d/%m/%Y"]
+
+
+def leaves_from_frame(df, employees):
+    """Validates an uploaded leave sheet. Returns (leaves, [(row number, error)])."""
+    leaves, errors = [], []
+    cols = {c.strip().lower(): c for c in df.columns}
+    missing = [c for c in ("employee_id", "date", "days", "reason") if c not in cols]
+    if missing: return [], [(0, f"Missing column(s): {', '.join(missing)}")]
+    for i, row in enumerate(df.to_dict('records'), start=2):
+        emp = str(row[cols['employee_id']]).strip()
+        if emp not in employees: errors.append((i, f"Unknown employee '{emp}'")); continue
+        raw_date, parsed = row[cols['date']], None
+        if isinstance(raw_date, (datetime, date)): parsed = raw_date.strftime("%Y-%m-%d")
+        else:
+            for fmt in LEAVE_DATE_FORMATS:
+                try: parsed = datetime.strptime(str(raw_date).strip(), fmt).strftime("%Y-%m-%d"); break
+                except ValueError: pass
+        if parsed is None: errors.append((i, f"Unreadable date '{raw_date}'")); continue
+        days = safe_float(row[cols['days']])
+        if days <= 0: errors.append((i, "Days must be greater than 0")); continue
+        reason = str(row[cols['reason']]).strip()
+        if reason not in LEAVE_TYPES: errors.append((i, f"Unknown leave type '{reason}'")); continue
+        note = row.get(cols['notes'], "") if 'notes' in cols else ""
+        leaves.append({"id": leave_id(emp, parsed, reason), "employee_id": emp, "date": parsed, "days": days,
+                       "reason": reason, "notes": "" if pd.isna(note) else str(note)})
+    return leaves, errors
+
+
+# ==========================================
+# RECORD STORE (hash indexes over the payroll history)
+# ==========================================
+def _date_key(rec):
+    return rec.payment_date or date.min
+
+
+class RecordStore:
+    """Payroll records indexed by id, by employee and by (year, month_label).
+
+    The year comes from payment_date. Records are keyed by id: when the loaded rows repeat
+    an id, the last one is indexed and the others are kept in duplicates, so a full sheet
+    rewrite writes them back instead of dropping them (the sheet owner has to resolve them)."""
+
+    def __init__(self, records=()):
+        self._by_id = {}
+        self._keys = {}        # id -> (employee_id, year, month_label) it is indexed under
+        self._by_emp = {}      # employee_id -> {id: rec}
+        self._by_period = {}   # (year, month_label) -> {employee_id: {id: rec}}
+        self._latest = {}      # employee_id -> rec with the greatest payment_date
+        self.listeners = []    # fn(old, new) after every change; old/new is None on insert/delete
+        self.views = {}        # derived structures kept in sync through listeners (see payroll_engine)
+        self.since_year = None     # earliest payment year in memory when the load was windowed, None = all
+        self.fetch_older = None    # fn(from_year or None, before_year) -> records, set by the windowed reader
+        self.fetch_employees = None    # fn(emp_ids, before_year) -> those employees' older records, same
+        self._complete = set()     # employees whose older records are already in memory (or who have none)
+        self.duplicates = []       # loaded rows whose id a later row also uses; never indexed, never dropped
+        for r in records:
+            if r.id in self._by_id: self.duplicates.append(self._by_id[r.id])
+            self.upsert(r)
+
+    def __len__(self): return len(self._by_id)
+    def __iter__(self): return iter(list(self._by_id.values()))
+    def __contains__(self, rec_id): return rec_id in self._by_id
+    def get(self, rec_id): return self._by_id.get(rec_id)
+
+    def upsert(self, rec):
+        rec_id = rec.id
+        old = self._by_id.get(rec_id)
+        if old is not None: self._unindex(rec_id)
+        key = (rec.employee_id, rec.year, rec.month_label)
+        self._by_id[rec_id] = rec
+        self._keys[rec_id] = key
+        self._by_emp.setdefault(key[0], {})[rec_id] = rec
+        self._by_period.setdefault(key[1:], {}).setdefault(key[0], {})[rec_id] = rec
+        best = self._latest.get(key[0])
+        if best is not None and _date_key(rec) >= _date_key(best):
+            self._latest[key[0]] = rec
+        self._notify(old, rec)
+        return rec
+
+    def update(self, rec_id, **fields):
+        """In-place field change (e.g. status) that keeps indexes and listeners in step."""
+        rec = self._by_id[rec_id]
+        old = rec.copy()
+        for name, value in fields.items(): setattr(rec, name, value)
+        if any(f in fields for f in ('employee_id', 'payment_date', 'month_label')):
+            self._unindex(rec_id); self._by_id.pop(rec_id)
+            self.listeners, listeners = [], self.listeners
+            try: self.upsert(rec)
+            finally: self.listeners = listeners
+        self._notify(old, rec)
+        return rec
+
+    def delete(self, rec_id):
+        if rec_id not in self._by_id: return None
+        self._unindex(rec_id)
+        old = self._by_id.pop(rec_id)
+        self._notify(old, None)
+        return old
+
+    def _notify(self, old, new):
+        for fn in self.listeners: fn(old, new)
+
+    def _unindex(self, rec_id):
+        emp, year, month = self._keys.pop(rec_id)
+        self._by_emp[emp].pop(rec_id, None)
+        if not self._by_emp[emp]: del self._by_emp[emp]
+        period = self._by_period[(year, month)]
+        period[emp].pop(rec_id, None)
+        if not period[emp]: del period[emp]
+        if not period: del self._by_period[(year, month)]
+        # Recomputed lazily on the next latest() call
+        self._latest.pop(emp, None)
+
+    def for_employee(self, emp_id):
+        return list(self._by_emp.get(emp_id, {}).values())
+
+    def for_month(self, year, month_label):
+        return [r for recs in self._by_period.get((year, month_label), {}).values() for r in recs.values()]
+
+    def for_year(self, year):
+        return [r for (y, _), emps in self._by_period.items() if y == year
+                for recs in emps.values() for r in recs.values()]
+
+    def month_by_employee(self, year, month_label):
+        return {emp: list(recs.values())[-1] for emp, recs in self._by_period.get((year, month_label), {}).items()}
+
+    def find(self, emp_id, year, month_label):
+        return list(self._by_period.get((year, month_label), {}).get(emp_id, {}).values())
+
+    def ensure_year(self, year):
+        """Pulls older records into memory when a windowed load stopped after year."""
+        if self.since_year is None or year is None or year >= self.since_year: return
+        self._add_older(self.fetch_older(year, self.since_year))
+        self.since_year = year
+
+    def load_all(self):
+        if self.since_year is None: return
+        self._add_older(self.fetch_older(None, self.since_year))
+        self.since_year = None
+
+    def ensure_employees(self, emp_ids):
+        """Pulls the older records of those emp_ids with no record in the load window, so their
+        last payslip is found even when it predates the window. One lookup per employee: one
+        with no records at all (a new hire) is remembered and not looked up again."""
+        if self.since_year is None: return
+        missing = [e for e in emp_ids if e not in self._by_emp and e not in self._complete]
+        if not missing: return
+        if self.fetch_employees is None: return self.load_all()
+        self._add_older(self.fetch_employees(missing, self.since_year))
+        self._complete.update(missing)
+
+    def _add_older(self, records):
+        for r in records:
+            # ensure_employees already brought in every older row of these employees
+            if r.employee_id in self._complete: continue
+            if r.id not in self._by_id: self.upsert(r)
+            else: self.duplicates.append(r)
+
+    def latest(self, emp_id):
+        if emp_id not in self._latest:
+            self.ensure_employees([emp_id])
+            recs = self._by_emp.get(emp_id)
+            if not recs: return None
+            best = None
+            for r in recs.values():
+                if best is None or _date_key(r) >= _date_key(best): best = r
+            self._latest[emp_id] = best
+        return self._latest[emp_id]
+
+
+# ==========================================
+# LEAVE STORE (per-employee, kept sorted by date)
+# ==========================================
+def _year_month(date_txt):
+    txt = str(date_txt)
+    return (int(txt[:4]), int(txt[5:7])) if len(txt) >= 7 and txt[:4].isdigit() and txt[5:7].isdigit() else None
+
+
+class LeaveStore:
+    """Leave entries by id and per employee in date order, plus unpaid days per month.
+
+    latest() is the tail of the employee's sorted list; unpaid_days() is a dict lookup."""
+
+    def __init__(self, leaves=()):
+        self._by_id = {}
+        self._by_emp = {}      # employee_id -> (sorted [(date, id)], [leave]) in the same order
+        self._unpaid = {}      # (year, month) -> {employee_id: unpaid days}
+        for l in leaves: self.upsert(l)
+
+    def __len__(self): return len(self._by_id)
+    def __iter__(self): return iter(list(self._by_id.values()))
+    def __contains__(self, lid): return lid in self._by_id
+    def get(self, lid): return self._by_id.get(lid)
+
+    def upsert(self, leave):
+        if leave['id'] in self._by_id: self.delete(leave['id'])
+        self._by_id[leave['id']] = leave
+        keys, items = self._by_emp.setdefault(leave['employee_id'], ([], []))
+        pos = bisect.bisect_right(keys, (str(leave['date']), leave['id']))
+        keys.insert(pos, (str(leave['date']), leave['id'])); items.insert(pos, leave)
+        self._count_unpaid(leave, 1)
+        return leave
+
+    def delete(self, lid):
+        leave = self._by_id.pop(lid, None)
+        if leave is None: return None
+        keys, items = self._by_emp[leave['employee_id']]
+        pos = bisect.bisect_left(keys, (str(leave['date']), lid))
+        del keys[pos]; del items[pos]
+        if not keys: del self._by_emp[leave['employee_id']]
+        self._count_unpaid(leave, -1)
+        return leave
+
+    def _count_unpaid(self, leave, sign):
+        ym = _year_month(leave['date'])
+        if leave.get('reason') != UNPAID_LEAVE or ym is None: return
+        month = self._unpaid.setdefault(ym, {})
+        emp = leave['employee_id']
+        month[emp] = month.get(emp, 0.0) + sign * safe_float(leave['days'])
+        if abs(month[emp]) < 1e-9: del month[emp]
+        if not month: del self._unpaid[ym]
+
+    def employees(self):
+        return list(self._by_emp)
+
+    def for_employee(self, emp_id):
+        return list(self._by_emp.get(emp_id, ([], []))[1])
+
+    def latest(self, emp_id):
+        entry = self._by_emp.get(emp_id)
+        return entry[1][-1] if entry else None
+
+    def unpaid_days(self, emp_id, year, month):
+        return self._unpaid.get((year, month), {}).get(emp_id, 0.0)
+
+    def unpaid_for_month(self, year, month):
+        return dict(self._unpaid.get((year, month), {}))
+
+
+# ==========================================
+# CHANGE TRACKING
+# ==========================================
+UPSERT, DELETE = "upsert", "delete"
+
+
+class ChangeTracker:
+    """Pending edits since the last save. Last operation on a key wins."""
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.settings = False
+        self.employees = {}
+        self.records = {}
+        self.leaves = {}
+
+    def touch_settings(self): self.settings = True
+    def upsert_employee(self, name): self.employees[name] = UPSERT
+    def delete_employee(self, name): self.employees[name] = DELETE
+    def upsert_record(self, rec_id): self.records[rec_id] = UPSERT
+    def delete_record(self, rec_id): self.records[rec_id] = DELETE
+    def upsert_leave(self, leave_id): self.leaves[leave_id] = UPSERT
+    def delete_leave(self, leave_id): self.leaves[leave_id] = DELETE
+
+    def is_empty(self):
+        return not (self.settings or self.employees or self.records or self.leaves)
+
+    def merge(self, other):
+        # Later batch wins per key, same rule as successive edits
+        self.settings = self.settings or other.settings
+        self.employees.update(other.employees); self.records.update(other.records); self.leaves.update(other.leaves)
+
+
+def snapshot_changes(data, changes):
+    """The rows a change batch writes (None = delete), JSON-ready for the write-behind journal."""
+    def rows(ops, items, to_row):
+        return {k: to_row(items.get(k)) if op == UPSERT and items.get(k) is not None else None for k, op in ops.items()}
+    return {
+        "settings": settings_to_snapshot(data['settings']) if changes.settings else None,
+        "employees": rows(changes.employees, data['employees'], employee_to_row),
+        "records": rows(changes.records, data['records'], record_to_row),
+        "leaves": rows(changes.leaves, data['leave_records'], leave_to_row),
+    }
+
+
+def settings_to_snapshot(settings):
+    rates = [[code, str(on), rate] for code, on, rate in settings['fx_rates'].rows()]
+    return {"usd_rate": safe_float(settings['usd_rate']), "fx_rates": rates}
+
+
+def settings_from_snapshot(snap):
+    settings = dict(snap)
+    # Journals written before the rate table have no fx_rates: keep the loaded one
+    if "fx_rates" in settings: settings['fx_rates'] = RateTable(settings['fx_rates'])
+    return settings
+
+
+def apply_snapshot(data, snap, changes):
+    """Replays a journaled snapshot onto a freshly loaded db and marks it in changes."""
+    if snap.get("settings"):
+        data['settings'].update(settings_from_snapshot(snap["settings"])); changes.touch_settings()
+    for k, row in snap.get("employees", {}).items():
+        if row is None: data['employees'].pop(k, None); changes.delete_employee(k)
+        else: data['employees'].update(parse_employees(pd.DataFrame([row], columns=EMP_COLUMNS))); changes.upsert_employee(k)
+    for k, row in snap.get("records", {}).items():
+        if row is None: data['records'].delete(k); changes.delete_record(k)
+        else: data['records'].upsert(parse_records(pd.DataFrame([row], columns=REC_COLUMNS))[0]); changes.upsert_record(k)
+    for k, row in snap.get("leaves", {}).items():
+        if row is None: data['leave_records'].delete(k); changes.delete_leave(k)
+        else: data['leave_records'].upsert(parse_leaves(pd.DataFrame([row], columns=LEAVE_COLUMNS))[0]); changes.upsert_leave(k)
+    return changes
+
+
+class SheetLayout:
+    """Where each key currently lives in a worksheet (row 1 is the header)."""
+
+    def __init__(self, header, keys):
+        self.header = list(header)
+        self.reset(keys)
+
+    def reset(self, keys):
+        self.keys = [k for k in keys]
+        self.rows = {k: i + 2 for i, k in enumerate(self.keys)}
+        # Duplicate keys make row patching ambiguous -> only full rewrites are safe
+        self.ambiguous = len(self.rows) != len(self.keys)
+
+    def remove(self, dead_keys):
+        self.reset([k for k in self.keys if k not in dead_keys])
+
+    def append(self, new_keys):
+        for k in new_keys:
+            self.rows[k] = len(self.keys) + 2
+            self.keys.append(k)
+
+
+def _col_letter(n):
+    s = ""
+    while n > 0:
+        n, rem = divmod(n - 1, 26)
+        s = chr(65 + rem) + s
+    return s
+
+
+def _cell(v):
+    # Same representation gspread_dataframe uses for conn.update
+    if v is None: return ""
+    if isinstance(v, float) and np.isnan(v): return ""
+    if isinstance(v, (int, float, np.integer, np.floating)): return v
+    return str(v)
+
+
+def _open_worksheet(conn, name):
+    # Row-level writes need the gspread worksheet (service-account client only)
+    select = getattr(getattr(conn, "client", None), "_select_worksheet", None)
+    if select is None: return None
+    try: return select(worksheet=name)
+    except Exception: return None
+
+
+# ==========================================
+# LOAD / SAVE
+# ==========================================
+def coerce_float_column(col):
+    """Vectorised safe_float over a whole column."""
+    num = pd.to_numeric(col, errors='coerce').astype(float)
+    out = num.to_numpy(copy=True)
+    bad = ~np.isfinite(out)
+    if bad.any():
+        if col.dtype == object:
+            # Anything to_numeric could not settle goes through the scalar rules
+            out[bad] = [safe_float(v) for v in col.to_numpy()[bad]]
+        else:
+            out[bad] = 0.0
+    return out.tolist()
+
+
+def _json_candidates(col):
+    # Cells that look like one self-contained JSON array/object can be decoded together
+    s = col.str.strip()
+    return s.str[:1].isin(['[', '{']) & s.str[-1:].isin([']', '}']) & (s.str.count('"') % 2 == 0)
+
+
+def decode_json_column(col, fallback):
+    """json.loads for every cell of a column, with one parser call for the well-formed bulk.
+    Empty, non-string or invalid cells become fallback() -- same outcome as a per-cell try/except."""
+    values = col.tolist()
+    out = [None] * len(values)
+    is_str = np.array([isinstance(v, str) and v != "" for v in values], dtype=bool)
+    pending = []
+    if is_str.any():
+        strs = pd.Series([v if ok else "" for v, ok in zip(values, is_str)], dtype=object)
+        bulk = np.flatnonzero(is_str & _json_candidates(strs.astype(str)).to_numpy(dtype=bool))
+        decoded = None
+        if len(bulk):
+            try:
+                decoded = json.loads("[" + ",".join([values[i] for i in bulk]) + "]")
+                if len(decoded) != len(bulk): decoded = None
+            except Exception:
+                decoded = None
+        if decoded is not None:
+            for i, v in zip(bulk, decoded): out[i] = v
+            done = set(bulk.tolist())
+            pending = [i for i in np.flatnonzero(is_str) if i not in done]
+        else:
+            pending = np.flatnonzero(is_str).tolist()
+    for i in pending:
+        try: out[i] = json.loads(values[i])
+        except Exception: out[i] = fallback()
+    for i in np.flatnonzero(~is_str):
+        out[i] = fallback()
+    return out
+
+
+def _text_or_blank(col):
+    return col.astype(object).where(col.notna(), "").tolist()
+
+
+def parse_employees(df_emp):
+    acc = df_emp['account_number']
+    acc_txt = acc.astype(str).str.split('.', n=1).str[0].astype(object).where(acc.notna(), "")
+    l_inc = decode_json_column(df_emp['last_increment'], lambda: None)
+    l_bon = decode_json_column(df_emp['last_bonus'], lambda: None)
+    employees = {}
+    for name, desig, join, dob, curr, bank, acc_no, basic, status, remark, inc, bon in zip(
+            df_emp['name'].tolist(), df_emp['designation'].tolist(), df_emp['join_date'].tolist(),
+            df_emp['date_of_birth'].tolist(), df_emp['currency'].tolist(), df_emp['bank_name'].tolist(),
+            acc_txt.tolist(), coerce_float_column(df_emp['basic_salary']), df_emp['status'].tolist(),
+            _text_or_blank(df_emp['master_remark']), l_inc, l_bon):
+        employees[name] = Employee(name, desig, join, dob, curr, bank, acc_no, basic, status, remark, inc, bon)
+    return employees
+
+
+def parse_date_column(col):
+    """parse_date over a column: one vectorised pass for ISO dates, the scalar rules for the rest."""
+    iso = pd.to_datetime(col.astype(str).str[:10], format="%Y-%m-%d", errors='coerce')
+    out = [None if ts is pd.NaT else ts.date() for ts in iso.tolist()]
+    for i in np.flatnonzero(iso.isna().to_numpy()):
+        out[i] = parse_date(col.iat[i])
+    return out
+
+
+def _date_cells(col, dates):
+    # date_cell per row; only cells that are not plain ISO text can differ from their date
+    iso = col.astype(str).str.fullmatch(r"\d{4}-\d{2}-\d{2}").to_numpy()
+    cells = [None] * len(dates)
+    for i in np.flatnonzero(~iso | np.array([d is None for d in dates], dtype=bool)):
+        cells[i] = date_cell(col.iat[i], dates[i])
+    return cells
+
+
+def _currency_column(col):
+    """(Currency per row, currency_cell per row). A handful of distinct spellings -> parse each once."""
+    vals = col.astype(object).where(col.notna(), "")
+    lookup = {}
+    for v in vals.unique().tolist():
+        cur = Currency.parse(v); lookup[v] = (cur, currency_cell(v, cur))
+    pairs = [lookup[v] for v in vals.tolist()]
+    return [p[0] for p in pairs], [p[1] for p in pairs]
+
+
+def parse_records(df_rec, lazy=False):
+    """PayrollRecords from a Records frame. lazy keeps earnings/deductions as JSON text until read."""
+    if lazy: earn, ded = df_rec['earnings_list'].tolist(), df_rec['deductions_list'].tolist()
+    else: earn, ded = decode_json_column(df_rec['earnings_list'], list), decode_json_column(df_rec['deductions_list'], list)
+    earn = [e if isinstance(e, str) else line_items(e) for e in earn]
+    ded = [d if isinstance(d, str) else line_items(d) for d in ded]
+    dates = parse_date_column(df_rec['payment_date'])
+    currencies, currency_cells = _currency_column(df_rec['currency'])
+    return [PayrollRecord.from_clean(rid, emp, month, pay_date, e, d, net, curr, rem, status, rate, curr_cell, date_txt)
+            for rid, emp, month, pay_date, e, d, net, curr, rem, status, rate, curr_cell, date_txt in zip(
+                _text_or_blank(df_rec['id']), _text_or_blank(df_rec['employee_id']), _text_or_blank(df_rec['month_label']),
+                dates, earn, ded, coerce_float_column(df_rec['net_salary']), currencies, _text_or_blank(df_rec['remarks']),
+                _text_or_blank(df_rec['status']), coerce_float_column(df_rec['exchange_rate']), currency_cells,
+                _date_cells(df_rec['payment_date'], dates))]
+
+
+def parse_leaves(df_leave):
+    dates = [str(d)[:10] if d == d and d is not None else "" for d in df_leave['date'].tolist()]
+    notes = _text_or_blank(df_leave['notes']) if 'notes' in df_leave else [""] * len(df_leave)
+    return [{"id": lid, "employee_id": emp, "date": d, "days": days, "reason": reason, "notes": note}
+            for lid, emp, d, days, reason, note in zip(
+                df_leave['id'].tolist(), df_leave['employee_id'].tolist(), dates,
+                coerce_float_column(df_leave['days']), _text_or_blank(df_leave['reason']), notes)]
+
+
+def new_db():
+    return {"employees": {}, "records": RecordStore(), "leave_records": LeaveStore(), "settings": {"usd_rate": 4.45, "fx_rates": RateTable()},
+            "_sheets": {"Employees": SheetLayout([], []), "Records": SheetLayout([], []), "Leave": SheetLayout([], [])}}
+
+
+@timed("read_settings")
+def read_settings(conn):
+    settings = new_db()['settings']
+    df_settings = conn.read(worksheet="Settings", ttl=0)
+    if not df_settings.empty and 'usd_rate' in df_settings.columns:
+        settings['usd_rate'] = safe_float(df_settings.iloc[0]['usd_rate'])
+    # Older workbooks have no Rates sheet yet; it is created on the first rate save
+    try: df_rates = conn.read(worksheet="Rates", ttl=0)
+    except Exception: df_rates = None
+    if df_rates is not None and not df_rates.empty and set(RATE_COLUMNS) <= set(df_rates.columns):
+        settings['fx_rates'] = parse_rates(df_rates)
+    return settings
+
+
+def parse_rates(df_rates):
+    rows = zip(df_rates['currency'].tolist(), df_rates['effective_date'].tolist(), df_rates['rate'].tolist())
+    return RateTable((c, d, r) for c, d, r in rows if c == c and parse_date(d) is not None)
+
+
+@timed("read_employees")
+def read_employees(conn, data):
+    df_emp = conn.read(worksheet="Employees", ttl=0)
+    data['_sheets']['Employees'] = SheetLayout(df_emp.columns, df_emp['name'].tolist() if 'name' in df_emp else [])
+    return parse_employees(df_emp) if not df_emp.empty else {}
+
+
+def payment_years(df_rec):
+    # Same rule as PayrollRecord.year; rows without a readable date count as recent
+    return pd.Series([d.year if d else np.nan for d in parse_date_column(df_rec['payment_date'])], index=df_rec.index)
+
+
+@timed("read_records")
+def read_records(conn, data, since_year=None, lazy=False):
+    """The Records sheet as a RecordStore. With since_year only those payment years are parsed;
+    older rows stay in the raw frame until store.ensure_year()/load_all() asks for them."""
+    df_rec = conn.read(worksheet="Records", ttl=0)
+    data['_sheets']['Records'] = SheetLayout(df_rec.columns, df_rec['id'].tolist() if 'id' in df_rec else [])
+    if df_rec.empty: return RecordStore()
+    if since_year is None: return RecordStore(parse_records(df_rec, lazy))
+    years = payment_years(df_rec)
+    cold = (years < since_year).to_numpy()
+    store = RecordStore(parse_records(df_rec[~cold], lazy))
+    if cold.any():
+        cold_df, cold_years = df_rec[cold], years[cold].to_numpy()
+
+        def fetch_older(from_year, before_year):
+            mask = (cold_years < before_year) & (cold_years >= (from_year or 0))
+            return parse_records(cold_df[mask], lazy)
+
+        def fetch_employees(emp_ids, before_year):
+            mask = (cold_years < before_year) & cold_df['employee_id'].isin(emp_ids).to_numpy()
+            return parse_records(cold_df[mask], lazy)
+        store.since_year, store.fetch_older, store.fetch_employees = since_year, fetch_older, fetch_employees
+    return store
+
+
+@timed("read_leaves")
+def read_leaves(conn, data):
+    # Older workbooks have no Leave sheet yet; it is created on the first leave save
+    try: df_leave = conn.read(worksheet="Leave", ttl=0)
+    except Exception: return LeaveStore()
+    data['_sheets']['Leave'] = SheetLayout(df_leave.columns, df_leave['id'].tolist() if 'id' in df_leave else [])
+    return LeaveStore(parse_leaves(df_leave)) if not df_leave.empty else LeaveStore()
+
+
+@timed("load_db")
+def load_db(conn):
+    default_db = new_db()
+    try:
+        default_db['settings'] = read_settings(conn)
+        default_db['employees'] = read_employees(conn, default_db)
+        default_db['records'] = read_records(conn, default_db)
+        default_db['leave_records'] = read_leaves(conn, default_db)
+        return default_db
+    except Exception as e:
+        return default_db
+
+
+class LazyDB(dict):
+    """The db dict with each collection read from storage the first time something asks for it,
+    so a page only pays for what it shows (Settings never touches Records)."""
+
+    def __init__(self, loaders, lock=None):
+        super().__init__(_sheets=new_db()['_sheets'])
+        self._loaders = loaders     # key -> fn(db) returning the collection
+        self._lock = lock or threading.RLock()
+
+    def __missing__(self, key):
+        if key not in self._loaders: raise KeyError(key)
+        with self._lock:
+            if not dict.__contains__(self, key): dict.__setitem__(self, key, self._loaders[key](self))
+        return dict.__getitem__(self, key)
+
+    def is_loaded(self, key):
+        return dict.__contains__(self, key)
+
+    def wrap_loader(self, key, wrap):
+        """Replaces the loader of key with wrap(loader), e.g. to serve it from a local cache first."""
+        self._loaders[key] = wrap(self._loaders[key])
+
+
+def _rewrite_employees(conn, data):
+    emp_list = [employee_to_row(info) for info in data['employees'].values()]
+    if emp_list:
+        df_emp = pd.DataFrame(emp_list).fillna("")
+        conn.update(worksheet="Employees", data=df_emp)
+        data['_sheets']['Employees'] = SheetLayout(EMP_COLUMNS, list(data['employees'].keys()))
+
+
+def _rewrite_records(conn, data):
+    # A full rewrite replaces the sheet, so years outside the load window must be in memory first
+    data['records'].load_all()
+    # Rows that repeat an id go back too: a rewrite must not be what deletes them
+    recs = list(data['records']) + data['records'].duplicates
+    rec_list = [record_to_row(r) for r in recs]
+    if rec_list:
+        df_rec = pd.DataFrame(rec_list).fillna("")
+        conn.update(worksheet="Records", data=df_rec)
+        data['_sheets']['Records'] = SheetLayout(REC_COLUMNS, [r.id for r in recs])
+
+
+def _rewrite_leaves(conn, data):
+    df_leave = pd.DataFrame([leave_to_row(l) for l in data['leave_records']], columns=LEAVE_COLUMNS).fillna("")
+    try: conn.update(worksheet="Leave", data=df_leave)
+    except Exception: conn.create(worksheet="Leave", data=df_leave)
+    data['_sheets']['Leave'] = SheetLayout(LEAVE_COLUMNS, [l['id'] for l in data['leave_records']])
+
+
+def _key_text(k):
+    return "" if k is None or (isinstance(k, float) and k != k) else str(k).strip()
+
+
+def _trimmed(cells):
+    cells = list(cells)
+    while cells and cells[-1] == "": cells.pop()
+    return cells
+
+
+def _sheet_matches(ws, layout, columns, key):
+    """True when the live sheet still has the header and key order layout was read with.
+    A sort, insert or delete in the sheet, or a write from another server process, moves rows
+    under the cached row numbers; then only a full rewrite is safe."""
+    col = _col_letter(columns.index(key) + 1)
+    try: header, keys = ws.batch_get(["1:1", f"{col}2:{col}"])
+    except Exception: return False
+    live_header = _trimmed(_key_text(h) for h in (header[0] if header else []))
+    live_keys = _trimmed(_key_text(row[0]) if row else "" for row in keys)
+    return live_header == list(columns) and live_keys == _trimmed(_key_text(k) for k in layout.keys)
+
+
+def _patch_sheet(conn, worksheet, layout, columns, ops, rows_by_key, key):
+    """Applies {key: op} as row deletes, in-place row updates and one append.
+    Returns False when the sheet cannot be patched and needs a full rewrite."""
+    if layout.ambiguous or layout.header != columns: return False
+    ws = _open_worksheet(conn, worksheet)
+    if ws is None or not _sheet_matches(ws, layout, columns, key): return False
+
+    dead = sorted((layout.rows[k] for k, op in ops.items() if op == DELETE and k in layout.rows), reverse=True)
+    # Delete bottom-up in contiguous blocks so earlier row numbers stay valid
+    i = 0
+    while i < len(dead):
+        end = start = dead[i]
+        while i + 1 < len(dead) and dead[i + 1] == start - 1:
+            i += 1; start = dead[i]
+        ws.delete_rows(start, end)
+        i += 1
+    if dead: layout.remove({k for k, op in ops.items() if op == DELETE})
+
+    last_col = _col_letter(len(columns))
+    updates, appends, new_keys = [], [], []
+    for k, op in ops.items():
+        if op != UPSERT or k not in rows_by_key: continue
+        values = [_cell(rows_by_key[k][c]) for c in columns]
+        if k in layout.rows:
+            r = layout.rows[k]
+            updates.append({"range": f"A{r}:{last_col}{r}", "values": [values]})
+        else:
+            appends.append(values); new_keys.append(k)
+    if updates: ws.batch_update(updates, value_input_option="USER_ENTERED")
+    if appends:
+        ws.append_rows(appends, value_input_option="USER_ENTERED", table_range="A1")
+        layout.append(new_keys)
+    return True
+
+
+@timed("save_db")
+def save_db(conn, data, changes):
+    if changes.settings:
+        df_set = pd.DataFrame([{"usd_rate": safe_float(data['settings']['usd_rate'])}])
+        conn.update(worksheet="Settings", data=df_set)
+        rates = data['settings']['fx_rates']
+        if len(rates) or rates.version:
+            df_rates = rates.frame(); df_rates['effective_date'] = df_rates['effective_date'].astype(str)
+            try: conn.update(worksheet="Rates", data=df_rates)
+            except Exception: conn.create(worksheet="Rates", data=df_rates)
+
+    if changes.employees:
+        emp_rows = {k: employee_to_row(data['employees'][k]) for k, op in changes.employees.items()
+                    if op == UPSERT and k in data['employees']}
+        if not _patch_sheet(conn, "Employees", data['_sheets']['Employees'], EMP_COLUMNS, changes.employees, emp_rows, "name"):
+            _rewrite_employees(conn, data)
+
+    if changes.records:
+        # Only the touched records are serialised; the rest of the table is never converted
+        rec_rows = {k: record_to_row(data['records'].get(k)) for k, op in changes.records.items()
+                    if op == UPSERT and k in data['records']}
+        if not _patch_sheet(conn, "Records", data['_sheets']['Records'], REC_COLUMNS, changes.records, rec_rows, "id"):
+            _rewrite_records(conn, data)
+
+    if changes.leaves:
+        leave_rows = {k: leave_to_row(data['leave_records'].get(k)) for k, op in changes.leaves.items()
+                      if op == UPSERT and k in data['leave_records']}
+        if not _patch_sheet(conn, "Leave", data['_sheets']['Leave'], LEAVE_COLUMNS, changes.leaves, leave_rows, "id"):
+            _rewrite_leaves(conn, data)
+
+    changes.reset()
+
+
+# ==========================================
+# PROCESS-WIDE CACHE (shared by every browser session)
+# ==========================================
+class SharedDB:
+    """One loaded workbook per server process, read from and saved to a storage backend
+    (see payroll_storage).
+
+    Sessions hold a reference to the same db object plus the version they last saw, so a
+    save in one session is visible to the others on their next rerun without a reload.
+    Each collection has its own version stamp; caches derived from one collection only
+    need to be dropped when that stamp moves."""
+
+    COLLECTIONS = ("settings", "employees", "records", "leave")
+
+    def __init__(self, storage):
+        self.storage = storage
+        self.writer = None          # optional payroll_writer.WriteBehind
+        self.lock = threading.RLock()
+        self._stamp_lock = threading.Lock()
+        self.db = None
+        self.version = 0
+        self.versions = dict.fromkeys(self.COLLECTIONS, 0)
+
+    def get(self):
+        if self.db is None:
+            with self.lock:
+                if self.db is None:
+                    db = self.storage.open(self.lock)
+                    # Acknowledged writes that have not reached storage yet stay visible after a reload
+                    if self.writer is not None: self.writer.replay_into(db)
+                    self.db = db
+                    self._bump(self.COLLECTIONS)
+        return self.db
+
+    def commit(self, changes):
+        """Persists one session's pending changes and publishes them to everyone.
+        With a writer attached this only journals the batch; storage is written in the background."""
+        touched = [name for name, dirty in (("settings", changes.settings), ("employees", changes.employees),
+                                            ("records", changes.records), ("leave", changes.leaves)) if dirty]
+        if self.writer is not None:
+            self.writer.submit(self.get(), changes)
+        else:
+            with self.lock: self.storage.save(self.get(), changes)
+        self._bump(touched)
+        return touched
+
+    def invalidate(self):
+        """Drops the cached workbook; the next get() reloads it from storage."""
+        with self.lock:
+            self.db = None
+            # A storage with a local cache in front (payroll_snapshot) must go back to the source too
+            if hasattr(self.storage, "invalidate"): self.storage.invalidate()
+
+    def _bump(self, names):
+        if not names: return
+        with self._stamp_lock:
+            self.version += 1
+            for name in names: self.versions[name] = self.version
+
+
+# ==========================================
+# CONNECTIONS OUTSIDE THE APP (scripts / batch jobs)
+# ==========================================
+class WorkbookConnection:
+    """Same read/update surface as the gsheets connection, backed by an .xlsx file
+    (e.g. File > Download > Microsoft Excel of the live workbook)."""
+
+    def __init__(self, path):
+        self.path = path
+
+    def read(self, worksheet=None, ttl=None, **kwargs):
+        return pd.read_excel(self.path, sheet_name=worksheet)
+
+    def update(self, worksheet=None, data=None, **kwargs):
+        with pd.ExcelWriter(self.path, engine="openpyxl", mode="a", if_sheet_exists="replace") as writer:
+            data.to_excel(writer, sheet_name=worksheet, index=False)
+        return data
+
+
+def open_connection(source):
+    """'sheets' -> the live Google Sheet from .streamlit/secrets.toml, otherwise an .xlsx path."""
+    if source == "sheets":
+        import streamlit as st
+        from streamlit_gsheets import GSheetsConnection
+        return st.connection("gsheets", type=GSheetsConnection)
+    return WorkbookConnection(source)
@@ -0,0 +1,396 @@
+"""Payroll batch jobs that run with or without the Streamlit UI.
+
+    python payroll_engine.py generate --month May --year 2024 --source export.xlsx --dry-run
+    python payroll_engine.py export-payslips --month May --year 2024 --out payslips_may.zip
+    python payroll_engine.py migrate --source sheets --dest payroll.db
+    python payroll_engine.py import --kind employees --file staff.csv --source payroll.db --dry-run
+    python payroll_engine.py bank-file --month May --year 2024 --format fixed --out payout_may.txt --mark-paid
+"""
+import argparse
+import calendar
+import sys
+import threading
+from datetime import date
+
+import numpy as np
+import pandas as pd
+
+import payroll_db
+from payroll_fx import code_column, date_column, default_rate_for, myr_rates, record_rate, to_myr
+from payroll_metrics import timed
+from payroll_statutory import age_on, applies_to, apply_statutory, calculate
+from payroll_storage import migrate, open_storage
+from payroll_models import LineItem, PayrollRecord, parse_date
+
+MONTHS = ["January", "February", "March", "April", "May", "June", "July", "August", "September", "October", "November", "December"]
+
+
+# ==========================================
+# BATCH PAYROLL GENERATION
+# ==========================================
+def latest_by_employee(records):
+    """Latest record per employee in one pass (groupby employee_id, max payment_date)."""
+    latest = {}
+    for r in records:
+        best = latest.get(r.employee_id)
+        if best is None or (r.payment_date or date.min) >= (best.payment_date or date.min):
+            latest[r.employee_id] = r
+    return latest
+
+
+class GenerationResult:
+    def __init__(self, month_label, year, created, skipped):
+        self.month_label = month_label
+        self.year = year
+        self.created = created      # new PayrollRecords
+        self.skipped = skipped      # employee ids that already had a record for the month
+
+    def preview(self):
+        return pd.DataFrame([{"Employee": r.employee_id, "Currency": r.currency.value, "Net Pay": r.net_salary,
+                              "Exchange Rate": r.exchange_rate} for r in self.created],
+                            columns=["Employee", "Currency", "Net Pay", "Exchange Rate"])
+
+
+# Employment Act: the daily rate of a monthly-paid employee is the monthly wage / 26
+WORKING_DAYS_PER_MONTH = 26
+
+
+def basic_from_earnings(earnings, fallback=0.0):
+    for item in earnings:
+        if item.description == "Basic Salary": return item.amount
+    return fallback
+
+
+def unpaid_leave_deduction(basic_salary, unpaid_days):
+    return round(basic_salary / WORKING_DAYS_PER_MONTH * unpaid_days, 2)
+
+
+def apply_unpaid_leave(deductions, amount):
+    """Sets the 'Unpaid Leave' line (adding it if missing) without reordering the others."""
+    out = [LineItem(d.description, d.amount) for d in deductions]
+    for d in out:
+        if d.description == "Unpaid Leave":
+            d.amount = amount; return out
+    return out + [LineItem("Unpaid Leave", amount)]
+
+
+def record_id(emp_id, month_label, year):
+    return f"{emp_id}_{month_label}_{year}"
+
+
+def default_payment_date(month_label, year):
+    """Today when it falls in the month being run, else the month's last day, so the records
+    are indexed under the selected year (RecordStore keys by payment-date year)."""
+    month = MONTHS.index(month_label) + 1
+    today = date.today()
+    if (today.year, today.month) == (year, month): return today
+    return date(year, month, calendar.monthrange(year, month)[1])
+
+
+def build_record(emp_id, emp_data, last_rec, month_label, year, payment_date, default_rate, unpaid_days=0.0):
+    # Carries the previous month forward; first payslip starts from the master basic salary
+    if last_rec:
+        earnings = [LineItem(i.description, i.amount) for i in last_rec.earnings]
+        deductions = [LineItem(i.description, i.amount) for i in last_rec.deductions]
+        rate = last_rec.exchange_rate
+    else:
+        earnings = [LineItem("Basic Salary", emp_data.basic_salary)]
+        deductions = [LineItem("Unpaid Leave", 0.0)]
+        rate = default_rate
+    if unpaid_days:
+        basic = basic_from_earnings(earnings, emp_data.basic_salary)
+        deductions = apply_unpaid_leave(deductions, unpaid_leave_deduction(basic, unpaid_days))
+    net = sum(e.amount for e in earnings) - sum(d.amount for d in deductions)
+    return PayrollRecord(record_id(emp_id, month_label, year), emp_id, month_label, payment_date, earnings, deductions,
+                         net, emp_data.currency, "", "Unpaid", rate)
+
+
+def apply_statutory_batch(records, employees, on):
+    """Recomputes EPF/SOCSO/EIS/PCB lines and net pay for the ringgit records, priced in one vectorised call."""
+    recs = [r for r in records if r.employee_id in employees and applies_to(employees[r.employee_id])]
+    if not recs: return None
+    wages = np.array([sum(i.amount for i in r.earnings) for r in recs])
+    ages = np.array([age_on(employees[r.employee_id].date_of_birth, on) for r in recs], dtype=float)
+    result = calculate(wages, ages)
+    for i, r in enumerate(recs):
+        r.deductions = apply_statutory(r.deductions, result.deductions(i))
+        r.net_salary = sum(e.amount for e in r.earnings) - sum(d.amount for d in r.deductions)
+    return result
+
+
+@timed("generate_payroll")
+def generate_payroll(db, month_label, year, payment_date=None, dry_run=False, statutory=False):
+    """Creates the month's records for every active employee that has none yet.
+
+    O(E + R): one pass for each employee's latest record, set membership for the
+    existing check. An employee counts as done when the month has a record for them
+    or their record id is taken (a payment date in another year files it under that
+    year); existing payslips are never replaced. Unpaid leave logged for the month sets
+    the 'Unpaid Leave' line; with statutory the EPF/SOCSO/EIS/PCB lines are recalculated
+    (payroll_statutory). With dry_run the store is left untouched."""
+    payment_date = payment_date or str(default_payment_date(month_label, year))
+    settings, pay_day = db['settings'], parse_date(payment_date)
+    records = db['records']
+    # Ids of a windowed load only cover the loaded years; the id check needs both years in memory
+    records.ensure_year(min(year, pay_day.year) if pay_day else year)
+    existing = set(records.month_by_employee(year, month_label))
+    records.ensure_employees([e for e, d in db['employees'].items() if d.is_active])
+    latest = latest_by_employee(records)
+    unpaid = db['leave_records'].unpaid_for_month(year, MONTHS.index(month_label) + 1) if month_label in MONTHS else {}
+
+    created, skipped = [], []
+    for emp_id, emp_data in db['employees'].items():
+        if not emp_data.is_active: continue
+        if emp_id in existing or record_id(emp_id, month_label, year) in records: skipped.append(emp_id); continue
+        created.append(build_record(emp_id, emp_data, latest.get(emp_id), month_label, year, payment_date,
+                                    default_rate_for(emp_data.currency, pay_day, settings), unpaid.get(emp_id, 0.0)))
+    if statutory: apply_statutory_batch(created, db['employees'], pay_day or date.today())
+
+    if not dry_run:
+        for rec in created: records.upsert(rec)
+    return GenerationResult(month_label, year, created, skipped)
+
+
+# ==========================================
+# DASHBOARD AGGREGATES
+# ==========================================
+def convert_record_to_myr(record, default_rate, rates=None):
+    rate = record_rate(record, rates, default_rate)
+    return record.net_salary * rate if rate is not None else 0.0
+
+
+class MonthlyRollup:
+    """Net pay per (year, month_label, status, currency).
+
+    Each cell holds [net, myr_known, usd_unrated, count]: myr_known is priced with the
+    record's own exchange rate or the rate table on its payment date (payroll_fx),
+    usd_unrated is USD pay with neither, priced at query time with the current default
+    rate (same rule as convert_record_to_myr). Built for one version of the rate table."""
+
+    FIELDS = ["net", "myr_known", "usd_unrated"]
+
+    def __init__(self, records, rates=None):
+        recs = list(records)
+        self.rates, self.rates_version = rates, getattr(rates, "version", None)
+        frame = pd.DataFrame({
+            "year": pd.Series([r.year or 0 for r in recs], dtype=object),
+            "month": pd.Series([r.month_label for r in recs], dtype=object),
+            "status": pd.Series([r.status for r in recs], dtype=object),
+            "currency": pd.Series([r.currency.value for r in recs], dtype=object),
+            "net": np.array([r.net_salary for r in recs], dtype=float),
+        })
+        codes = code_column([r.currency for r in recs])
+        rate = myr_rates(codes, date_column([r.payment_date for r in recs]),
+                         np.array([r.exchange_rate for r in recs], dtype=float), rates)
+        net = frame["net"].to_numpy()
+        frame["myr_known"] = np.nan_to_num(net * rate)
+        frame["usd_unrated"] = np.where(np.isnan(rate) & (codes == "USD"), net, 0.0)
+        frame["count"] = 1
+        grouped = frame.groupby(["year", "month", "status", "currency"], sort=False)[self.FIELDS + ["count"]].sum()
+        self.cells = {key: list(vals) for key, vals in zip(grouped.index, grouped.to_numpy().tolist())}
+
+    def apply(self, old, new):
+        if old is not None: self._add(old, -1)
+        if new is not None: self._add(new, 1)
+
+    def _add(self, rec, sign):
+        key = (rec.year or 0, rec.month_label, rec.status, rec.currency.value)
+        net, rate = rec.net_salary, record_rate(rec, self.rates)
+        cell = self.cells.setdefault(key, [0.0, 0.0, 0.0, 0])
+        cell[0] += sign * net
+        cell[1] += sign * (net * rate if rate is not None else 0.0)
+        cell[2] += sign * (net if rate is None and rec.is_usd else 0.0)
+        cell[3] += sign
+        # Dropping empty cells keeps the sums exact instead of accumulating float residue
+        if cell[3] <= 0: del self.cells[key]
+
+    def _cells(self, year, month_label=None, status=None):
+        for (y, m, s, _), cell in self.cells.items():
+            if y == year and (month_label is None or m == month_label) and (status is None or s == status):
+                yield cell
+
+    def myr(self, year, month_label=None, status="Paid", default_rate=0.0):
+        return sum(c[1] + c[2] * default_rate for c in self._cells(year, month_label, status))
+
+    def count(self, year, month_label=None, status="Paid"):
+        return sum(c[3] for c in self._cells(year, month_label, status))
+
+
+ITEM_FRAME_COLUMNS = ["record_id", "kind", "description", "amount", "year", "month_label", "payment_date", "status",
+                      "currency", "exchange_rate"]
+
+
+def line_item_frame(records):
+    """Earnings/deductions as one long frame (same shape as payroll_snapshot.RecordSnapshot.line_items)."""
+    rows = [(r.id, kind, i.description, i.amount, r.year, r.month_label, r.payment_date, r.status, r.currency.value,
+             r.exchange_rate)
+            for r in records for kind, items in (("earning", r.earnings), ("deduction", r.deductions)) for i in items]
+    return pd.DataFrame(rows, columns=ITEM_FRAME_COLUMNS)
+
+
+@timed("dashboard.breakdown")
+def earnings_breakdown(items, default_rate, status="Paid", rates=None):
+    """MYR per month split into Basic Salary / Allowances (every other earning) / Deductions."""
+    df = items[items["status"] == status]
+    myr = to_myr(df["amount"], code_column(df["currency"].tolist()), date_column(df["payment_date"].tolist()),
+                 df["exchange_rate"], rates, default_rate)
+    part = np.where(df["kind"] == "deduction", "Deductions",
+                    np.where(df["description"] == "Basic Salary", "Basic Salary", "Allowances"))
+    out = pd.DataFrame({"Month": df["month_label"].to_numpy(), "part": part, "myr": myr})
+    table = out.pivot_table(index="Month", columns="part", values="myr", aggfunc="sum", fill_value=0.0)
+    table.columns.name = None
+    return table.reindex(index=[m for m in MONTHS if m in table.index],
+                         columns=["Basic Salary", "Allowances", "Deductions"], fill_value=0.0)
+
+
+_rollup_lock = threading.Lock()
+
+
+@timed("dashboard.rollup")
+def monthly_rollup(store, rates=None):
+    """The store's rollup, built once with a single groupby and then kept current by listener.
+    Rebuilt when the rate table changes (a new rate can reprice any past month)."""
+    with _rollup_lock:
+        view = store.views.get("monthly")
+        if view is not None and (view.rates is not rates or view.rates_version != getattr(rates, "version", None)):
+            store.listeners.remove(view.apply); view = None
+        if view is None:
+            view = store.views["monthly"] = MonthlyRollup(store, rates)
+            store.listeners.append(view.apply)
+        return view
+
+
+# ==========================================
+# COMMAND LINE
+# ==========================================
+def _cmd_generate(args):
+    storage = open_storage(args.source)
+    db = storage.load()
+    result = generate_payroll(db, args.month, args.year, payment_date=args.payment_date, dry_run=args.dry_run,
+                              statutory=args.statutory)
+    print(result.preview().to_string(index=False) if result.created else "No new records.")
+    print(f"{len(result.created)} to create, {len(result.skipped)} already on file for {args.month} {args.year}")
+    if args.dry_run or not result.created: return 0
+    changes = payroll_db.ChangeTracker()
+    for rec in result.created: changes.upsert_record(rec.id)
+    storage.save(db, changes)
+    print("Saved.")
+    return 0
+
+
+def _cmd_export_payslips(args):
+    from payroll_pdf import PayslipCache, export_payslips_zip, month_payslip_jobs
+    db = open_storage(args.source).load()
+    jobs = month_payslip_jobs(db, args.year, args.month)
+    if not jobs:
+        print(f"No records for {args.month} {args.year}."); return 1
+
+    def progress(done, total):
+        print(f"\r{done}/{total} payslips", end="", file=sys.stderr, flush=True)
+
+    out = args.out or f"Payslips_{args.month}_{args.year}.zip"
+    cache = PayslipCache(disk_dir=args.cache_dir) if args.cache_dir else None
+    export_payslips_zip(jobs, out, workers=args.workers, progress=progress, mp_context=None, cache=cache)
+    print(f"\nWrote {len(jobs)} payslips to {out}")
+    return 0
+
+
+def _cmd_migrate(args):
+    data = migrate(args.source, args.dest)
+    print(f"Copied {len(data['employees'])} employees, {len(data['records'])} records, "
+          f"{len(data['leave_records'])} leave entries to {args.dest}")
+    dups = sorted({r.id for r in data['records'].duplicates})
+    if dups:
+        # SQLite keys records by id: only the last row of each was copied
+        print(f"Warning: {len(dups)} record id(s) repeat in the source, only the last row of each was copied: {', '.join(dups)}")
+        return 1
+    return 0
+
+
+def _cmd_import(args):
+    from payroll_import import BATCH_ROWS, KINDS, import_file
+    storage = open_storage(args.source)
+    db = storage.load()
+
+    def progress(result):
+        print(f"\r{result.rows} rows read", end="", file=sys.stderr, flush=True)
+
+    result = import_file(args.file, KINDS[args.kind], db, commit=lambda changes: storage.save(db, changes),
+                         dry_run=args.dry_run, batch_rows=args.batch_rows or BATCH_ROWS, progress=progress)
+    print(f"\n{result.summary()}" + ("" if args.dry_run else f", {result.saved} saved in {result.batches} batch(es)"))
+    for row, message in result.errors[:20]: print(f"  row {row}: {message}")
+    if result.error_count > 20: print(f"  ... {result.error_count - 20} more")
+    return 1 if result.error_count or result.save_error else 0
+
+
+def _cmd_bank_file(args):
+    from payroll_bank import BANK_FORMATS, bank_format, mark_paid, payment_file_bytes
+    if args.format in BANK_FORMATS: fmt = BANK_FORMATS[args.format]
+    else:
+        import tomllib
+        with open(args.format, "rb") as f: fmt = bank_format(args.format, tomllib.load(f))
+    storage = open_storage(args.source)
+    db = storage.load()
+    value_date = parse_date(args.value_date) if args.value_date else date.today()
+    data, batch, problems = payment_file_bytes(db, args.year, args.month, fmt, company=args.company,
+                                               company_account=args.company_account, value_date=value_date)
+    for emp, message in batch.errors: print(f"  {emp}: {message}")
+    if problems:
+        print("File failed its own check, nothing written:\n  " + "\n  ".join(problems)); return 1
+    if not batch.count:
+        print(f"No {fmt.currency.code} payouts due for {args.month} {args.year} ({batch.summary()})."); return 1
+    out = args.out or f"Payout_{args.month}_{args.year}_{fmt.currency.code}.{'csv' if fmt.kind == 'csv' else 'txt'}"
+    with open(out, "wb") as f: f.write(data)
+    print(f"Wrote {out}: {batch.summary()}, account hash {batch.hash}")
+    if args.mark_paid:
+        storage.save(db, mark_paid(db, batch.record_ids)); print(f"Marked {batch.count} record(s) Paid.")
+    return 1 if batch.errors else 0
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="SDG Tech payroll batch jobs")
+    sub = ap.add_subparsers(dest="command", required=True)
+    g = sub.add_parser("generate", help="create a month's payroll for all active employees")
+    g.add_argument("--month", required=True, choices=MONTHS)
+    g.add_argument("--year", required=True, type=int)
+    g.add_argument("--source", default="sheets", help="'sheets' (uses .streamlit/secrets.toml), a .db SQLite file or an .xlsx export")
+    g.add_argument("--payment-date", help="YYYY-MM-DD, defaults to today in the current month, else the month's last day")
+    g.add_argument("--dry-run", action="store_true", help="preview only, nothing is written")
+    g.add_argument("--statutory", action="store_true", help="calculate EPF/SOCSO/EIS/PCB for ringgit-paid employees")
+    g.set_defaults(func=_cmd_generate)
+    x = sub.add_parser("export-payslips", help="render every payslip of a month into one ZIP")
+    x.add_argument("--month", required=True, choices=MONTHS)
+    x.add_argument("--year", required=True, type=int)
+    x.add_argument("--source", default="sheets", help="'sheets' (uses .streamlit/secrets.toml), a .db SQLite file or an .xlsx export")
+    x.add_argument("--out", help="ZIP path, defaults to Payslips_<Month>_<Year>.zip")
+    x.add_argument("--workers", type=int, help="worker processes, defaults to the CPU count")
+    x.add_argument("--cache-dir", help="reuse/keep rendered payslips in this directory between runs")
+    x.set_defaults(func=_cmd_export_payslips)
+    m = sub.add_parser("migrate", help="copy a Sheets workbook (or .xlsx export) into a SQLite file")
+    m.add_argument("--source", default="sheets", help="'sheets' (uses .streamlit/secrets.toml) or an .xlsx export")
+    m.add_argument("--dest", required=True, help="SQLite file, e.g. payroll.db (existing tables are replaced)")
+    m.set_defaults(func=_cmd_migrate)
+    i = sub.add_parser("import", help="bulk-load employees or payroll history from a CSV / XLSX file")
+    i.add_argument("--kind", required=True, choices=["employees", "records"])
+    i.add_argument("--file", required=True, help="CSV or XLSX with a header row (column names as in the sheet)")
+    i.add_argument("--source", default="sheets", help="'sheets' (uses .streamlit/secrets.toml) or a .db SQLite file")
+    i.add_argument("--dry-run", action="store_true", help="validate only, nothing is written")
+    i.add_argument("--batch-rows", type=int, help="rows per save, defaults to 5000")
+    i.set_defaults(func=_cmd_import)
+    b = sub.add_parser("bank-file", help="write a month's bulk payment file for the bank from its unpaid records")
+    b.add_argument("--month", required=True, choices=MONTHS)
+    b.add_argument("--year", required=True, type=int)
+    b.add_argument("--source", default="sheets", help="'sheets' (uses .streamlit/secrets.toml), a .db SQLite file or an .xlsx export")
+    b.add_argument("--format", default="csv", help="'csv', 'fixed' or a .toml file describing the bank's layout (see payroll_bank)")
+    b.add_argument("--out", help="defaults to Payout_<Month>_<Year>_<currency>.csv/.txt")
+    b.add_argument("--company", default="", help="payer name for the header line")
+    b.add_argument("--company-account", default="", help="payer account number for the header line")
+    b.add_argument("--value-date", help="YYYY-MM-DD, defaults to today")
+    b.add_argument("--mark-paid", action="store_true", help="set the records in the file to Paid (one save)")
+    b.set_defaults(func=_cmd_bank_file)
+    args = ap.parse_args(argv)
+    return args.func(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,149 @@
+"""Dated exchange rates (MYR per 1 unit of a currency) and column-wise conversion.
+
+A rate is effective from its date until the next entry for the same currency. Payment
+dates before a currency's first entry (or missing) use the nearest entry; a currency with
+no entries at all has no rate, and USD then falls back to settings['usd_rate'].
+A payslip's own saved exchange rate always wins: it is what was actually paid.
+"""
+import bisect
+
+import numpy as np
+import pandas as pd
+
+from payroll_models import Currency, parse_date, safe_float
+
+BASE = "MYR"
+RATE_COLUMNS = ["currency", "effective_date", "rate"]
+
+
+class RateTable:
+    """{currency code: sorted effective dates + rates}. version moves on every change,
+    so caches priced with the table know when to rebuild."""
+
+    def __init__(self, rows=()):
+        self._rates = {}       # code -> ([date], [rate]), dates ascending
+        self.version = 0
+        for code, on, rate in rows: self.set(code, on, rate)
+
+    def __len__(self): return sum(len(d) for d, _ in self._rates.values())
+
+    @staticmethod
+    def _key(code, on):
+        # " usd" and "USD", a date, datetime, Timestamp or sheet text all name the same entry
+        return str(code).strip().upper(), parse_date(on)
+
+    def set(self, code, on, rate):
+        code, on = self._key(code, on)
+        dates, rates = self._rates.setdefault(code, ([], []))
+        i = bisect.bisect_left(dates, on)
+        if i < len(dates) and dates[i] == on: rates[i] = safe_float(rate)
+        else: dates.insert(i, on); rates.insert(i, safe_float(rate))
+        self.version += 1
+
+    def remove(self, code, on):
+        code, on = self._key(code, on)
+        dates, rates = self._rates.get(code, ([], []))
+        i = bisect.bisect_left(dates, on)
+        if i < len(dates) and dates[i] == on:
+            del dates[i], rates[i]
+            if not dates: del self._rates[code]
+            self.version += 1
+
+    def currencies(self):
+        return sorted(self._rates)
+
+    def rate_on(self, code, on=None):
+        """MYR per 1 code on date on (None = latest); None when the table has no rate for code."""
+        if code == BASE: return 1.0
+        if code not in self._rates: return None
+        dates, rates = self._rates[code]
+        if on is None: return rates[-1]
+        return rates[max(bisect.bisect_right(dates, on) - 1, 0)]
+
+    def rates_on(self, codes, days):
+        """Vectorised rate_on: codes (object array) and days (datetime64[D], NaT = latest) -> float array, NaN = no rate."""
+        codes = np.asarray(codes, dtype=object)
+        days = np.asarray(days, dtype="datetime64[D]")
+        out = np.full(len(codes), np.nan)
+        out[codes == BASE] = 1.0
+        # One searchsorted per currency in the table (a handful), not one lookup per record
+        for code, (dates, rates) in self._rates.items():
+            mask = codes == code
+            if not mask.any(): continue
+            on = days[mask]
+            idx = np.searchsorted(np.array(dates, dtype="datetime64[D]"), on, side="right") - 1
+            idx = np.where(np.isnat(on), len(dates) - 1, np.maximum(idx, 0))
+            out[mask] = np.asarray(rates)[idx]
+        return out
+
+    def rows(self):
+        return [(code, on, rate) for code, (dates, rates) in sorted(self._rates.items()) for on, rate in zip(dates, rates)]
+
+    def frame(self):
+        return pd.DataFrame(self.rows(), columns=RATE_COLUMNS)
+
+
+def rates_from_frame(df):
+    """Validates an uploaded rate history. Returns ([(code, date, rate)], [(row number, error)])."""
+    rows, errors = [], []
+    cols = {c.strip().lower(): c for c in df.columns}
+    if "date" in cols and "effective_date" not in cols: cols["effective_date"] = cols["date"]
+    missing = [c for c in RATE_COLUMNS if c not in cols]
+    if missing: return [], [(0, f"Missing column(s): {', '.join(missing)}")]
+    for i, row in enumerate(df.to_dict('records'), start=2):
+        code = str(row[cols['currency']]).strip().upper()
+        if not (len(code) == 3 and code.isalpha()): errors.append((i, f"Currency must be a 3-letter code, got '{code}'")); continue
+        if code == BASE: errors.append((i, f"{BASE} is the base currency")); continue
+        on = parse_date(row[cols['effective_date']])
+        if on is None: errors.append((i, f"Unreadable date '{row[cols['effective_date']]}'")); continue
+        rate = safe_float(row[cols['rate']])
+        if rate <= 0: errors.append((i, "Rate must be greater than 0")); continue
+        rows.append((code, on, rate))
+    return rows, errors
+
+
+# ==========================================
+# CONVERSION
+# ==========================================
+def date_column(dates):
+    """[date or None] -> datetime64[D] array (None -> NaT)."""
+    return np.array([d if d is not None else np.datetime64("NaT") for d in dates], dtype="datetime64[D]")
+
+
+def code_column(currencies):
+    """Currency members or their sheet text -> ISO code array."""
+    lookup = {}
+    return np.array([lookup.setdefault(c, Currency.parse(c).code) for c in currencies], dtype=object)
+
+
+def myr_rates(codes, days, saved_rates, rates, usd_default=None):
+    """The MYR rate that applies to each payslip: its own saved rate, else the table rate on its
+    payment date, else usd_default for USD. NaN where none of them is known."""
+    codes = np.asarray(codes, dtype=object)
+    saved = np.asarray(saved_rates, dtype=float)
+    out = rates.rates_on(codes, days) if rates is not None else np.where(codes == BASE, 1.0, np.nan)
+    if usd_default is not None: out = np.where(np.isnan(out) & (codes == "USD"), usd_default, out)
+    return np.where((codes != BASE) & (saved != 0), saved, out)
+
+
+def to_myr(amounts, codes, days, saved_rates, rates, usd_default=None):
+    """Whole-column conversion; amounts with no known rate count as 0."""
+    return np.nan_to_num(np.asarray(amounts, dtype=float) * myr_rates(codes, days, saved_rates, rates, usd_default))
+
+
+def record_rate(record, rates, usd_default=None):
+    """Scalar myr_rates for one PayrollRecord (None when unknown)."""
+    code = record.currency.code
+    if code != BASE and record.exchange_rate: return record.exchange_rate
+    rate = rates.rate_on(code, record.payment_date) if rates is not None else (1.0 if code == BASE else None)
+    if rate is None and code == "USD": rate = usd_default
+    return rate
+
+
+def default_rate_for(currency, on, settings):
+    """Rate to prefill for a new payslip in currency paid on date on."""
+    code = Currency.parse(currency).code
+    table = settings.get('fx_rates')
+    # MYR payslips have always carried the USD default; it is never applied to them
+    rate = table.rate_on(code, on) if table is not None and code != BASE else None
+    return rate if rate is not None else settings['usd_rate']
@@ -0,0 +1,328 @@
+"""Bulk import of employees and payroll history from CSV / XLSX.
+
+    result = import_file(upload, EMPLOYEES, db, commit)      # then import_file(..., RECORDS, ...)
+
+The file is read chunk_rows rows at a time (csv.reader for CSV, openpyxl read-only rows for
+XLSX), so one chunk is in memory whatever the file size. Every row goes through the rules
+load_db applies to the sheet (safe_float amounts, the sheet's date formats, Currency.parse,
+default_rate_for) plus the checks a hand-made file needs; rejected rows are reported as
+(row number, error) like leaves_from_frame.
+
+Valid rows are upserted into db under the app's keys (employee name, record id) and collected in
+a ChangeTracker handed to commit(changes) every batch_rows rows: one storage write per batch
+(one append_rows on Sheets, one transaction on SQLite) instead of a save per row.
+"""
+import calendar
+import csv
+import io
+import json
+import os
+
+import pandas as pd
+
+from payroll_db import ChangeTracker
+from payroll_fx import default_rate_for
+from payroll_models import Currency, Employee, LineItem, PayrollRecord, line_items, parse_date, safe_float
+
+CHUNK_ROWS = 2000
+BATCH_ROWS = 5000
+MAX_ERRORS = 1000       # kept for the report; error_count keeps counting past it
+MONTHS = [m for m in calendar.month_name if m]
+EMPLOYEE_STATUSES = {"active": "Active", "inactive": "Inactive", "resigned": "Inactive"}
+RECORD_STATUSES = {"paid": "Paid", "unpaid": "Unpaid"}
+
+
+class ImportResult:
+    def __init__(self):
+        self.rows = self.created = self.updated = self.batches = self.saved = self.error_count = 0
+        self.errors = []        # (row number, message), the first MAX_ERRORS
+        self.save_error = None  # the storage error that stopped the import, if any
+
+    def error(self, row, message):
+        self.error_count += 1
+        if len(self.errors) < MAX_ERRORS: self.errors.append((row, message))
+
+    @property
+    def imported(self):
+        return self.created + self.updated
+
+    def summary(self):
+        txt = f"{self.rows} row(s): {self.created} new, {self.updated} updated, {self.error_count} rejected"
+        return txt + (f"; saving stopped after {self.saved} row(s): {self.save_error}" if self.save_error else "")
+
+
+# ==========================================
+# READING (chunked)
+# ==========================================
+def read_chunks(source, chunk_rows=CHUNK_ROWS, name=None):
+    """(DataFrame, [(row number, error)]) per chunk_rows rows. The frame is indexed by row number in
+    the file (header = row 1); the list holds rows that could not be made into a frame row (more
+    cells than the header has columns). source is a path or a file object; name (default: its
+    .name) picks CSV or XLSX by extension."""
+    name = str(name or getattr(source, "name", source)).lower()
+    header, rows = _xlsx_rows(source) if name.endswith((".xlsx", ".xlsm")) else _csv_rows(source)
+    width = len(header)
+    buf, numbers, bad = [], [], []
+    for n, values in rows:
+        if all(_blank(v) for v in values): continue       # blank lines keep their number but are not rows
+        if len(values) > width and not all(_blank(v) for v in values[width:]):
+            bad.append((n, f"{len(values)} cells, the header has {width} columns"))
+        else:
+            buf.append((list(values) + [None] * width)[:width]); numbers.append(n)
+        if len(buf) + len(bad) >= chunk_rows:
+            yield pd.DataFrame(buf, columns=header, index=numbers, dtype=object), bad
+            buf, numbers, bad = [], [], []
+    if buf or bad: yield pd.DataFrame(buf, columns=header, index=numbers, dtype=object), bad
+
+
+def _csv_rows(source):
+    # csv.reader streams the file and takes ragged rows, so one bad line is one row error
+    own = isinstance(source, (str, os.PathLike))
+    if own: f = open(source, newline="", encoding="utf-8-sig")
+    elif isinstance(source, io.TextIOBase): f = source
+    else: f = io.TextIOWrapper(source, encoding="utf-8-sig", newline="")
+    reader = csv.reader(f)
+    header = [h.strip() for h in next(reader, [])]
+
+    def rows():
+        try:
+            for values in reader: yield reader.line_num, values
+        finally:
+            if own: f.close()
+            elif f is not source: f.detach()        # the caller's binary file stays open
+    return header, rows()
+
+
+def _xlsx_rows(source):
+    # Read-only mode streams the sheet XML instead of building the whole workbook
+    from openpyxl import load_workbook
+    wb = load_workbook(source, read_only=True, data_only=True)
+    rows = wb.worksheets[0].iter_rows(values_only=True)
+    header = [str(h).strip() if h is not None else "" for h in next(rows, ())]
+
+    def numbered():
+        try:
+            for n, values in enumerate(rows, start=2): yield n, values
+        finally:
+            wb.close()
+    return header, numbered()
+
+
+# ==========================================
+# CELL RULES
+# ==========================================
+def _blank(v):
+    return v is None or (isinstance(v, float) and v != v) or (isinstance(v, str) and not v.strip())
+
+
+def _text(v):
+    return "" if _blank(v) else str(v).strip()
+
+
+def _number(v):
+    """safe_float's value for the cell, or None when it holds text that is not a number."""
+    if _blank(v) or isinstance(v, (int, float)): return safe_float(v)
+    try: float(str(v).strip())
+    except ValueError: return None
+    return safe_float(v)
+
+
+def _currency(v):
+    txt = _text(v).upper()
+    if "USD" in txt: return Currency.USD
+    if "MYR" in txt or "RM" in txt: return Currency.MYR
+    return None
+
+
+def _account(v):
+    # Spreadsheets hand account numbers back as floats; same rule as parse_employees
+    if isinstance(v, float) and v.is_integer(): return str(int(v))
+    return _text(v)
+
+
+class RowError(ValueError):
+    pass
+
+
+def _items(v, what):
+    # The Records sheet's own format: [{"Description": ..., "Amount": ...}, ...]
+    try: items = json.loads(v) if isinstance(v, str) else None
+    except ValueError: items = None
+    if not isinstance(items, list): raise RowError(f"{what} is not a JSON list")
+    return line_items(items)
+
+
+# ==========================================
+# ROW -> MODEL
+# ==========================================
+def _field(row, cols, name):
+    return row.get(cols[name]) if name in cols else None
+
+
+def employee_from_row(row, cols, db):
+    """(Employee, is_new). Columns the file leaves out or blank keep the existing employee's values."""
+    get = lambda c: _field(row, cols, c)
+    name = _text(get("name"))
+    if not name: raise RowError("Name is empty")
+    old = db['employees'].get(name)
+    new = Employee(name) if old is None else Employee.from_dict(old.to_dict())
+    if not _blank(get("designation")): new.designation = _text(get("designation"))
+    for col in ("join_date", "date_of_birth"):
+        if _blank(get(col)): continue
+        d = parse_date(get(col))
+        if d is None: raise RowError(f"Unreadable {col} '{get(col)}'")
+        setattr(new, col, d.strftime("%d %b %Y"))
+    if not _blank(get("currency")):
+        new.currency = _currency(get("currency"))
+        if new.currency is None: raise RowError(f"Unknown currency '{get('currency')}'")
+    if not _blank(get("bank_name")): new.bank_name = _text(get("bank_name"))
+    if not _blank(get("account_number")): new.account_number = _account(get("account_number"))
+    if not _blank(get("basic_salary")):
+        basic = _number(get("basic_salary"))
+        if basic is None or basic < 0: raise RowError(f"basic_salary '{get('basic_salary')}' is not an amount")
+        new.basic_salary = basic
+    if not _blank(get("status")):
+        new.status = EMPLOYEE_STATUSES.get(_text(get("status")).lower())
+        if new.status is None: raise RowError(f"Unknown status '{get('status')}' (Active / Inactive)")
+    if not _blank(get("master_remark")): new.master_remark = _text(get("master_remark"))
+    return new, old is None
+
+
+def record_from_row(row, cols, db):
+    """(PayrollRecord, is_new). The id defaults to <employee>_<Month>_<year>, as generate_payroll names them."""
+    get = lambda c: _field(row, cols, c)
+    emp_id = _text(get("employee_id"))
+    emp = db['employees'].get(emp_id)
+    if emp is None: raise RowError(f"Unknown employee '{emp_id}'")
+    pay_date = parse_date(get("payment_date"))
+    if pay_date is None: raise RowError(f"Unreadable payment_date '{get('payment_date')}'")
+    month = _text(get("month_label"))
+    if month:
+        month = next((m for m in MONTHS if m.lower() == month.lower() or m[:3].lower() == month.lower()), None)
+        if month is None: raise RowError(f"Unknown month_label '{get('month_label')}'")
+    else: month = MONTHS[pay_date.month - 1]
+
+    if not _blank(get("earnings_list")): earnings = _items(get("earnings_list"), "earnings_list")
+    elif not _blank(get("basic_salary")):
+        basic = _number(get("basic_salary"))
+        if basic is None: raise RowError(f"basic_salary '{get('basic_salary')}' is not an amount")
+        earnings = [LineItem("Basic Salary", basic)]
+    else: raise RowError("No earnings (earnings_list or basic_salary)")
+    deductions = _items(get("deductions_list"), "deductions_list") if not _blank(get("deductions_list")) else []
+    net = sum(i.amount for i in earnings) - sum(i.amount for i in deductions)
+    if not _blank(get("net_salary")):
+        given = _number(get("net_salary"))
+        if given is None or abs(given - net) > 0.005:
+            raise RowError(f"net_salary '{get('net_salary')}' is not earnings - deductions ({net:,.2f})")
+
+    currency = emp.currency
+    if not _blank(get("currency")):
+        currency = _currency(get("currency"))
+        if currency is None: raise RowError(f"Unknown currency '{get('currency')}'")
+    if _blank(get("exchange_rate")): rate = default_rate_for(currency, pay_date, db['settings'])
+    else:
+        rate = _number(get("exchange_rate"))
+        if rate is None or rate < 0: raise RowError(f"exchange_rate '{get('exchange_rate')}' is not a rate")
+    status = RECORD_STATUSES.get(_text(get("status")).lower() or "paid")
+    if status is None: raise RowError(f"Unknown status '{get('status')}' (Paid / Unpaid)")
+
+    rec_id = _text(get("id")) or f"{emp_id}_{month}_{pay_date.year}"
+    rec = PayrollRecord(rec_id, emp_id, month, pay_date, earnings, deductions, net, currency,
+                        _text(get("remarks")), status, rate)
+    return rec, rec_id not in db['records']
+
+
+def _put_employee(db, changes, emp):
+    old = db['employees'].get(emp.name)
+    db['employees'][emp.name] = emp; changes.upsert_employee(emp.name)
+    return emp.name, old
+
+
+def _undo_employee(db, name, old):
+    if old is None: db['employees'].pop(name, None)
+    else: db['employees'][name] = old
+
+
+def _put_record(db, changes, rec):
+    old = db['records'].get(rec.id)
+    db['records'].upsert(rec); changes.upsert_record(rec.id)
+    return rec.id, old
+
+
+def _undo_record(db, rec_id, old):
+    if old is None: db['records'].delete(rec_id)
+    else: db['records'].upsert(old)
+
+
+class Kind:
+    def __init__(self, name, required, from_row, put, undo):
+        self.name, self.required, self.from_row, self.put, self.undo = name, required, from_row, put, undo
+
+
+EMPLOYEES = Kind("employees", ("name",), employee_from_row, _put_employee, _undo_employee)
+RECORDS = Kind("records", ("employee_id", "payment_date"), record_from_row, _put_record, _undo_record)
+KINDS = {k.name: k for k in (EMPLOYEES, RECORDS)}
+
+
+# ==========================================
+# PIPELINE
+# ==========================================
+def import_file(source, kind, db, commit=None, dry_run=False, chunk_rows=CHUNK_ROWS, batch_rows=BATCH_ROWS,
+                name=None, progress=None):
+    """Validates every row of source and, unless dry_run, upserts the valid ones into db and passes
+    them to commit(ChangeTracker) every batch_rows rows. progress(result) runs after each chunk.
+    A batch whose commit raises is taken back out of db and ends the import (result.save_error);
+    earlier batches stay saved. Returns an ImportResult."""
+    result, batch = ImportResult(), _Batch(kind, db, commit)
+    chunks = read_chunks(source, chunk_rows, name)
+    while True:
+        # Only reading is guarded: a file that goes bad halfway (truncated, wrong encoding) keeps what was read
+        try: chunk, bad = next(chunks, (None, None))
+        except Exception as e:
+            result.error(0, f"Could not read file: {e}"); break
+        if chunk is None: break
+        result.rows += len(bad)
+        for row_no, message in bad: result.error(row_no, message)
+        cols = {str(c).strip().lower(): c for c in chunk.columns}
+        missing = [c for c in kind.required if c not in cols]
+        if missing:
+            result.error(0, f"Missing column(s): {', '.join(missing)}"); break
+        for row_no, row in zip(chunk.index.tolist(), chunk.to_dict('records')):
+            result.rows += 1
+            try: item, is_new = kind.from_row(row, cols, db)
+            except RowError as e:
+                result.error(row_no, str(e)); continue
+            if is_new: result.created += 1
+            else: result.updated += 1
+            if dry_run: continue
+            batch.put(item)
+            if len(batch) >= batch_rows and not batch.flush(result): return result
+        if progress: progress(result)
+    if len(batch): batch.flush(result)
+    return result
+
+
+class _Batch:
+    """Rows put into db since the last commit, with what they replaced so a failed commit can be undone."""
+
+    def __init__(self, kind, db, commit):
+        self.kind, self.db, self.commit = kind, db, commit
+        self.changes, self.undo = ChangeTracker(), []
+
+    def __len__(self):
+        return len(self.undo)
+
+    def put(self, item):
+        self.undo.append(self.kind.put(self.db, self.changes, item))
+
+    def flush(self, result):
+        """Commits the batch; on a storage error restores db and records it in result. True when saved."""
+        changes, undo = self.changes, self.undo
+        self.changes, self.undo = ChangeTracker(), []
+        try: self.commit(changes)
+        except Exception as e:
+            for key, old in reversed(undo): self.kind.undo(self.db, key, old)
+            result.save_error = str(e) or type(e).__name__
+            return False
+        result.batches += 1; result.saved += len(undo)
+        return True
@@ -0,0 +1,197 @@
+"""In-process latency metrics for the Diagnostics page.
+
+    with METRICS.time("dashboard.rollup"): ...
+    @timed("load_db")
+    def load_db(conn): ...
+
+Each operation keeps its last WINDOW samples (p50/p95 are taken over those) and running
+totals: calls, seconds, bytes sent, errors. Like the shared workbook they are per server
+process; payslips rendered by the export pool's worker processes are not counted.
+
+MeteredConnection wraps the gsheets connection so every read/update (and the row-level
+worksheet writes payroll_db makes through conn.client) is timed and its payload counted.
+
+Export: METRICS.prometheus() is the Prometheus text format; PAYROLL_METRICS_LOG=path
+appends every sample as one JSON line.
+"""
+import functools
+import json
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+import numpy as np
+
+WINDOW = 500
+RERUN_WINDOW = 200
+
+
+class Series:
+    __slots__ = ("samples", "count", "seconds", "bytes", "errors")
+
+    def __init__(self, window):
+        self.samples = deque(maxlen=window)
+        self.count, self.seconds, self.bytes, self.errors = 0, 0.0, 0, 0
+
+
+class Metrics:
+    def __init__(self, window=WINDOW, log_path=None):
+        self.window = window
+        self.log_path = log_path
+        self.series = {}
+        self.reruns = deque(maxlen=RERUN_WINDOW)      # (finished at, page, seconds)
+        self.started = time.time()
+        self._lock = threading.Lock()
+
+    def observe(self, name, seconds, nbytes=0, error=False):
+        with self._lock:
+            s = self.series.get(name)
+            if s is None: s = self.series[name] = Series(self.window)
+            s.samples.append(seconds); s.count += 1; s.seconds += seconds; s.bytes += nbytes; s.errors += error
+        if self.log_path: self._log({"op": name, "seconds": round(seconds, 6), "bytes": nbytes, "error": error})
+
+    @contextmanager
+    def time(self, name, nbytes=0):
+        t0, failed = time.perf_counter(), False
+        try: yield
+        except BaseException:
+            failed = True; raise
+        finally: self.observe(name, time.perf_counter() - t0, nbytes, failed)
+
+    def rerun(self, page, seconds):
+        with self._lock: self.reruns.append((time.time(), page, seconds))
+        self.observe("app.rerun", seconds)
+
+    def _log(self, entry):
+        entry["ts"] = round(time.time(), 3)
+        try:
+            with self._lock, open(self.log_path, "a", encoding="utf-8") as f: f.write(json.dumps(entry) + "\n")
+        except OSError:
+            pass        # diagnostics must never break the request being measured
+
+    # ---------- reading ----------
+    def summary(self):
+        """One row per operation, slowest p95 first."""
+        with self._lock: snap = {k: (np.array(s.samples), s.count, s.seconds, s.bytes, s.errors) for k, s in self.series.items()}
+        rows = []
+        for name, (samples, count, seconds, nbytes, errors) in snap.items():
+            p50, p95 = np.percentile(samples, [50, 95]) if len(samples) else (0.0, 0.0)
+            rows.append({"operation": name, "calls": count, "p50_ms": float(p50) * 1000, "p95_ms": float(p95) * 1000,
+                         "max_ms": float(samples.max()) * 1000 if len(samples) else 0.0, "total_s": seconds,
+                         "bytes_sent": nbytes, "errors": errors})
+        return sorted(rows, key=lambda r: -r["p95_ms"])
+
+    def slowest_reruns(self, n=10):
+        with self._lock: reruns = list(self.reruns)
+        return sorted(reruns, key=lambda r: -r[2])[:n]
+
+    def prometheus(self):
+        lines = ["# HELP payroll_op_seconds Latency of payroll operations (recent window quantiles).",
+                 "# TYPE payroll_op_seconds summary"]
+        rows = self.summary()
+        for r in rows:
+            op = _label(r["operation"])
+            lines += [f'payroll_op_seconds{{op="{op}",quantile="0.5"}} {r["p50_ms"] / 1000:.6f}',
+                      f'payroll_op_seconds{{op="{op}",quantile="0.95"}} {r["p95_ms"] / 1000:.6f}',
+                      f'payroll_op_seconds_sum{{op="{op}"}} {r["total_s"]:.6f}',
+                      f'payroll_op_seconds_count{{op="{op}"}} {r["calls"]}']
+        lines += ["# HELP payroll_op_bytes_sent_total Payload bytes sent to storage.", "# TYPE payroll_op_bytes_sent_total counter"]
+        lines += [f'payroll_op_bytes_sent_total{{op="{_label(r["operation"])}"}} {r["bytes_sent"]}' for r in rows if r["bytes_sent"]]
+        lines += ["# HELP payroll_op_errors_total Operations that raised.", "# TYPE payroll_op_errors_total counter"]
+        lines += [f'payroll_op_errors_total{{op="{_label(r["operation"])}"}} {r["errors"]}' for r in rows]
+        return "\n".join(lines) + "\n"
+
+    def reset(self):
+        with self._lock:
+            self.series.clear(); self.reruns.clear(); self.started = time.time()
+
+
+def _label(value):
+    return value.replace("\\", "\\\\").replace('"', '\\"')
+
+
+METRICS = Metrics(log_path=os.environ.get("PAYROLL_METRICS_LOG") or None)
+
+
+def timed(name):
+    """Decorator: every call of the function is one METRICS sample under name."""
+    def wrap(fn):
+        @functools.wraps(fn)
+        def inner(*args, **kwargs):
+            with METRICS.time(name): return fn(*args, **kwargs)
+        return inner
+    return wrap
+
+
+# ==========================================
+# METERED GSHEETS CONNECTION
+# ==========================================
+def frame_bytes(df):
+    # Roughly what goes over the wire: the cell values as text
+    try: return len(df.to_csv(index=False).encode("utf-8"))
+    except Exception: return 0
+
+
+def values_bytes(values):
+    return len(json.dumps(values, default=str).encode("utf-8"))
+
+
+class MeteredConnection:
+    """Same surface as the wrapped connection; read/update/create and worksheet writes are timed."""
+
+    def __init__(self, conn, metrics=METRICS):
+        self._conn = conn
+        self._metrics = metrics
+
+    def __getattr__(self, name):
+        return getattr(self._conn, name)
+
+    def read(self, worksheet=None, **kwargs):
+        with self._metrics.time(f"sheets.read:{worksheet}"): return self._conn.read(worksheet=worksheet, **kwargs)
+
+    def update(self, worksheet=None, data=None, **kwargs):
+        with self._metrics.time(f"sheets.update:{worksheet}", frame_bytes(data)):
+            return self._conn.update(worksheet=worksheet, data=data, **kwargs)
+
+    def create(self, worksheet=None, data=None, **kwargs):
+        with self._metrics.time(f"sheets.create:{worksheet}", frame_bytes(data)):
+            return self._conn.create(worksheet=worksheet, data=data, **kwargs)
+
+    @property
+    def client(self):
+        return _MeteredClient(self._conn.client, self._metrics)
+
+
+class _MeteredClient:
+    def __init__(self, client, metrics):
+        self._client, self._metrics = client, metrics
+
+    def __getattr__(self, name):
+        return getattr(self._client, name)
+
+    def _select_worksheet(self, worksheet=None, **kwargs):
+        return _MeteredWorksheet(self._client._select_worksheet(worksheet=worksheet, **kwargs), worksheet, self._metrics)
+
+
+class _MeteredWorksheet:
+    def __init__(self, ws, name, metrics):
+        self._ws, self._name, self._metrics = ws, name, metrics
+
+    def __getattr__(self, name):
+        return getattr(self._ws, name)
+
+    def batch_get(self, ranges, **kwargs):
+        with self._metrics.time(f"sheets.batch_get:{self._name}"): return self._ws.batch_get(ranges, **kwargs)
+
+    def delete_rows(self, *args, **kwargs):
+        with self._metrics.time(f"sheets.delete_rows:{self._name}"): return self._ws.delete_rows(*args, **kwargs)
+
+    def batch_update(self, data, **kwargs):
+        with self._metrics.time(f"sheets.batch_update:{self._name}", values_bytes(data)):
+            return self._ws.batch_update(data, **kwargs)
+
+    def append_rows(self, values, **kwargs):
+        with self._metrics.time(f"sheets.append_rows:{self._name}", values_bytes(values)):
+            return self._ws.append_rows(values, **kwargs)
@@ -0,0 +1,274 @@
+"""Typed payroll data.
+
+Sheet rows are validated and normalised once, when they are read: amounts are floats,
+payment_date is a date, currency is a Currency. Totals, MYR conversion, PDFs and the
+dashboard then read attributes instead of re-cleaning dict values on every use.
+
+A currency or payment_date cell that is not in the canonical form ("MYR", "SGD", "",
+"25/01/2024", "TBC") is kept as read next to its parsed value and written back as it was
+(currency_text / payment_date_text) until the value itself is changed.
+"""
+import json
+from datetime import date, datetime
+from enum import Enum
+from math import isfinite
+
+import numpy as np
+
+
+# [FIX 1] 强力数字清洗函数
+def safe_float(val):
+    try:
+        if val is None: return 0.0
+        if isinstance(val, (float, int)):
+            if np.isnan(val) or np.isinf(val): return 0.0
+            return float(val)
+        val_str = str(val).strip().lower()
+        if val_str in ['nan', 'inf', '-inf', 'none', '']: return 0.0
+        return float(val)
+    except:
+        return 0.0
+
+
+def clean_text(val):
+    return "" if val is None or (isinstance(val, float) and val != val) else str(val)
+
+
+PAYMENT_DATE_FORMATS = ["%Y-%m-%d", "%Y-%m-%d %H:%M:%S", "%d %b %Y", "%d/%m/%Y"]
+
+
+def parse_date(val):
+    """date from a date/datetime/Timestamp or one of the sheet's text formats; None if unreadable."""
+    if val is None or (isinstance(val, float) and val != val): return None
+    if isinstance(val, datetime): return val.date()
+    if isinstance(val, date): return val
+    txt = str(val).strip()
+    for fmt in PAYMENT_DATE_FORMATS:
+        try: return datetime.strptime(txt, fmt).date()
+        except ValueError: pass
+    return None
+
+
+class Currency(str, Enum):
+    MYR = "RM (MYR)"
+    USD = "$ (USD)"
+
+    # Prints and formats as the sheet text, e.g. "$ (USD)"
+    __str__ = str.__str__
+    __format__ = str.__format__
+
+    @classmethod
+    def parse(cls, val):
+        # Anything mentioning USD is paid in dollars, everything else in ringgit (as convert_record_to_myr always did).
+        # The payslip words test the sheet text for "RM" instead, so they take currency_text, not this
+        if isinstance(val, cls): return val
+        return cls.USD if "USD" in str(val or "").upper() else cls.MYR
+
+    @property
+    def symbol(self):
+        return self.value.split("(")[0].strip()
+
+    @property
+    def code(self):
+        # ISO code, the key of the payroll_fx rate table
+        return self.value.split("(")[1].rstrip(")")
+
+
+def currency_cell(val, parsed):
+    """The currency cell text when the sheet spells parsed some other way ("MYR", "", a typo), else None."""
+    if val is None or isinstance(val, Currency): return None
+    txt = clean_text(val)
+    return None if txt == parsed.value else txt
+
+
+def date_cell(val, parsed):
+    """The payment_date cell text when it is not the ISO date it was read as, else None."""
+    if val is None or isinstance(val, date) or (isinstance(val, float) and val != val): return None
+    txt = str(val)
+    return None if txt == "" or (parsed is not None and txt == str(parsed)) else txt
+
+
+class LineItem:
+    __slots__ = ("description", "amount")
+
+    def __init__(self, description="", amount=0.0):
+        # Decoded sheet JSON is nearly always str/finite float already; only the rest pays for cleaning
+        self.description = description if type(description) is str else clean_text(description)
+        self.amount = amount if type(amount) is float and isfinite(amount) else safe_float(amount)
+
+    @classmethod
+    def from_dict(cls, d):
+        return cls(d.get("Description", ""), d.get("Amount", 0.0))
+
+    def to_dict(self):
+        return {"Description": self.description, "Amount": self.amount}
+
+    def __eq__(self, other):
+        return isinstance(other, LineItem) and (self.description, self.amount) == (other.description, other.amount)
+
+    def __repr__(self):
+        return f"LineItem({self.description!r}, {self.amount!r})"
+
+
+def line_items(items):
+    """[LineItem] from LineItems, {"Description", "Amount"} dicts or their JSON text. Anything else is dropped."""
+    if isinstance(items, str):
+        try: items = json.loads(items) if items else []
+        except ValueError: items = []
+    if not isinstance(items, list): return []
+    return [LineItem(i.get("Description", ""), i.get("Amount", 0.0)) if type(i) is dict else i
+            for i in items if isinstance(i, (LineItem, dict))]
+
+
+def items_total(items):
+    return sum(i.amount for i in items)
+
+
+class PayrollRecord:
+    """One payslip. earnings/deductions may arrive as JSON text and are decoded on first access,
+    so lists and totals never pay for the line items of records nobody opens."""
+
+    __slots__ = ("id", "employee_id", "month_label", "payment_date", "net_salary", "currency", "remarks", "status",
+                 "exchange_rate", "_earnings", "_deductions", "_currency_cell", "_date_cell")
+
+    def __init__(self, id, employee_id, month_label, payment_date=None, earnings=(), deductions=(), net_salary=0.0,
+                 currency=Currency.MYR, remarks="", status="Unpaid", exchange_rate=0.0):
+        self.id = clean_text(id)
+        self.employee_id = clean_text(employee_id)
+        self.month_label = clean_text(month_label)
+        self.payment_date = parse_date(payment_date)
+        self.net_salary = safe_float(net_salary)
+        self.currency = Currency.parse(currency)
+        self._currency_cell = currency_cell(currency, self.currency)
+        self._date_cell = date_cell(payment_date, self.payment_date)
+        self.remarks = clean_text(remarks)
+        self.status = clean_text(status)
+        self.exchange_rate = safe_float(exchange_rate)
+        self._earnings = earnings if isinstance(earnings, str) else line_items(list(earnings))
+        self._deductions = deductions if isinstance(deductions, str) else line_items(list(deductions))
+
+    @property
+    def earnings(self):
+        if isinstance(self._earnings, str): self._earnings = line_items(self._earnings)
+        return self._earnings
+
+    @earnings.setter
+    def earnings(self, items): self._earnings = line_items(items)
+
+    @property
+    def deductions(self):
+        if isinstance(self._deductions, str): self._deductions = line_items(self._deductions)
+        return self._deductions
+
+    @deductions.setter
+    def deductions(self, items): self._deductions = line_items(items)
+
+    def line_items_json(self):
+        """(earnings, deductions) as JSON text; items that were never decoded are passed through as read."""
+        return tuple(v if isinstance(v, str) else json.dumps([i.to_dict() for i in v])
+                     for v in (self._earnings, self._deductions))
+
+    @property
+    def currency_text(self):
+        """The currency as the sheet has it: the cell as read while it still parses to currency."""
+        cell = self._currency_cell
+        return cell if cell is not None and Currency.parse(cell) is self.currency else self.currency.value
+
+    @property
+    def payment_date_text(self):
+        """payment_date as the sheet has it: the cell as read while it still parses to payment_date
+        (an unreadable date stays as typed), else the ISO date."""
+        cell = self._date_cell
+        if cell is not None and parse_date(cell) == self.payment_date: return cell
+        return str(self.payment_date) if self.payment_date else ""
+
+    @property
+    def year(self):
+        return self.payment_date.year if self.payment_date else None
+
+    @property
+    def is_usd(self):
+        return self.currency is Currency.USD
+
+    def myr(self, default_rate):
+        """Net pay in MYR; USD pay saved without a rate uses default_rate."""
+        if not self.is_usd: return self.net_salary
+        return self.net_salary * (self.exchange_rate or default_rate)
+
+    @classmethod
+    def from_clean(cls, *values):
+        """Skips the per-field cleaning for values that were already normalised column-wise
+        (payroll_db.parse_records); same order as __init__, earnings/deductions as JSON text or [LineItem],
+        then the currency and payment_date cells as read (currency_cell / date_cell, None when canonical)."""
+        rec = cls.__new__(cls)
+        (rec.id, rec.employee_id, rec.month_label, rec.payment_date, rec._earnings, rec._deductions, rec.net_salary,
+         rec.currency, rec.remarks, rec.status, rec.exchange_rate, rec._currency_cell, rec._date_cell) = values
+        return rec
+
+    def copy(self):
+        return PayrollRecord.from_clean(self.id, self.employee_id, self.month_label, self.payment_date, self._earnings,
+                                        self._deductions, self.net_salary, self.currency, self.remarks, self.status,
+                                        self.exchange_rate, self._currency_cell, self._date_cell)
+
+    @classmethod
+    def from_dict(cls, d):
+        return cls(d['id'], d['employee_id'], d['month_label'], d.get('payment_date'), d.get('earnings_list') or [],
+                   d.get('deductions_list') or [], d.get('net_salary'), d.get('currency'), d.get('remarks'),
+                   d.get('status'), d.get('exchange_rate'))
+
+    def to_dict(self):
+        return {
+            "id": self.id, "employee_id": self.employee_id, "month_label": self.month_label,
+            "payment_date": self.payment_date_text,
+            "earnings_list": [i.to_dict() for i in self.earnings], "deductions_list": [i.to_dict() for i in self.deductions],
+            "net_salary": self.net_salary, "currency": self.currency_text, "remarks": self.remarks,
+            "status": self.status, "exchange_rate": self.exchange_rate
+        }
+
+    def __eq__(self, other):
+        return isinstance(other, PayrollRecord) and self.to_dict() == other.to_dict()
+
+    def __repr__(self):
+        return f"PayrollRecord({self.id!r}, {self.status}, {self.net_salary:.2f} {self.currency.symbol})"
+
+
+class Employee:
+    __slots__ = ("name", "designation", "join_date", "date_of_birth", "currency", "bank_name", "account_number",
+                 "basic_salary", "status", "master_remark", "last_increment", "last_bonus", "_currency_cell")
+
+    def __init__(self, name, designation="", join_date="", date_of_birth="", currency=Currency.MYR, bank_name="",
+                 account_number="", basic_salary=0.0, status="Active", master_remark="", last_increment=None, last_bonus=None):
+        self.name = clean_text(name)
+        self.designation = clean_text(designation)
+        self.join_date = clean_text(join_date)           # "%d %b %Y", as shown and edited in the app
+        self.date_of_birth = clean_text(date_of_birth)
+        self.currency = Currency.parse(currency)
+        self._currency_cell = currency_cell(currency, self.currency)
+        self.bank_name = clean_text(bank_name)
+        self.account_number = clean_text(account_number)
+        self.basic_salary = safe_float(basic_salary)
+        self.status = clean_text(status)
+        self.master_remark = clean_text(master_remark)
+        self.last_increment = last_increment or None     # {"date", "percentage"}
+        self.last_bonus = last_bonus or None             # {"year", "amount"}
+
+    @property
+    def is_active(self):
+        return self.status == "Active"
+
+    currency_text = PayrollRecord.currency_text
+
+    @classmethod
+    def from_dict(cls, d):
+        return cls(d['name'], d.get('designation'), d.get('join_date'), d.get('date_of_birth'), d.get('currency'),
+                   d.get('bank_name'), d.get('account_number'), d.get('basic_salary'), d.get('status'),
+                   d.get('master_remark'), d.get('last_increment'), d.get('last_bonus'))
+
+    def to_dict(self):
+        return {s: getattr(self, s) for s in self.__slots__ if s[0] != "_"} | {"currency": self.currency_text}
+
+    def __eq__(self, other):
+        return isinstance(other, Employee) and self.to_dict() == other.to_dict()
+
+    def __repr__(self):
+        return f"Employee({self.name!r}, {self.status})"
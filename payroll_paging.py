@@ -0,0 +1,68 @@
+"""Server-side search, sort and paging for the one-row-per-employee tables.
+
+EmployeeIndex keeps the employee names sorted and lower-cased, built once per version
+of the Employees collection. A rerun then filters and sorts names only and builds
+table rows for the visible page alone, so what is rendered and sent to the browser
+stays one page whatever the headcount.
+"""
+import bisect
+import threading
+
+PAGE_SIZES = [25, 50, 100, 200]
+
+
+class EmployeeIndex:
+    def __init__(self, employees, version=None):
+        self.employees = employees
+        self.version = version
+        self.names = sorted(employees, key=lambda n: (n.lower(), n))
+        self._keys = [n.lower() for n in self.names]
+        self._text = [f"{n}\n{employees[n].designation}".lower() for n in self.names]
+
+    def search(self, query="", keep=None):
+        """Names whose name or designation contains query (case-insensitive), in name order."""
+        q = query.strip().lower()
+        if not q: return [n for n in self.names if keep is None or keep(n)]
+        return [n for n, text in zip(self.names, self._text) if q in text and (keep is None or keep(n))]
+
+    def suggest(self, query="", limit=50, keep=None):
+        """Type-ahead: up to limit names, names starting with query first (a binary search on the
+        sorted names), then other matches."""
+        q = query.strip().lower()
+        lo, hi = bisect.bisect_left(self._keys, q), bisect.bisect_right(self._keys, q + "\uffff")
+        out = [n for n in self.names[lo:hi] if keep is None or keep(n)][:limit]
+        if len(out) < limit and q:
+            for i, text in enumerate(self._text):
+                if (i < lo or i >= hi) and q in text and (keep is None or keep(self.names[i])):
+                    out.append(self.names[i])
+                    if len(out) == limit: break
+        return out
+
+
+_index_lock = threading.Lock()
+_last_index = None
+
+
+def employee_index(employees, version):
+    """The process-wide EmployeeIndex for this employees dict; rebuilt when version moves
+    (or the dict was reloaded / changed size without a version bump)."""
+    global _last_index
+    with _index_lock:
+        idx = _last_index
+        if idx is None or idx.employees is not employees or idx.version != version or len(idx.names) != len(employees):
+            idx = _last_index = EmployeeIndex(employees, version)
+        return idx
+
+
+def page_slice(total, page, page_size):
+    """(start, stop, page, n_pages) for 1-based page, clamped to 1..n_pages."""
+    n_pages = max(1, -(-total // page_size))
+    page = min(max(1, int(page)), n_pages)
+    start = (page - 1) * page_size
+    return start, min(start + page_size, total), page, n_pages
+
+
+def sort_names(names, key=None, descending=False):
+    """names (already in name order) sorted by key(name); ties keep name order."""
+    if key is None: return names[::-1] if descending else names
+    return sorted(names, key=key, reverse=descending)
@@ -0,0 +1,317 @@
+import hashlib
+import json
+import os
+import tempfile
+import threading
+import zipfile
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+import multiprocessing
+
+from payroll_metrics import timed
+from payroll_models import Currency
+from payroll_words import amount_in_words
+
+
+# ==========================================
+# PAYSLIP PDF
+# ==========================================
+# Layout (mm), declared once. Fields are (label, value(record, employee)); the header band, the
+# title and the field labels form the static layer, everything else is written per payslip.
+COLOR_NAVY = (33, 47, 61); COLOR_WHITE = (255, 255, 255); COLOR_TEXT = (50, 50, 50)
+HEADER_BAND = (0, 0, 210, 45)
+TITLE_Y, TITLE_H, SUBTITLE_H = 15, 10, 8
+FIELDS_Y = TITLE_Y + TITLE_H + SUBTITLE_H + 15
+LEFT_X, RIGHT_X, LINE_H, LABEL_W, VALUE_W = 15, 110, 7, 35, 50
+LEFT_FIELDS = [("Name", lambda r, e: e.name), ("Designation", lambda r, e: e.designation),
+               ("Join Date", lambda r, e: e.join_date)]
+RIGHT_FIELDS = [("Currency", lambda r, e: e.currency_text), ("Bank Name", lambda r, e: e.bank_name),
+                ("Account No.", lambda r, e: e.account_number)]
+FX_FIELD = ("Exchange Rate", lambda r, e: f"1 {r.currency.code} = {r.exchange_rate:.3f} MYR")
+W_DESC, W_AMT, H_ROW = 150, 30, 9
+
+
+def _new_pdf():
+    # fpdf loads on the first payslip, not on app start-up
+    from fpdf import FPDF
+    return FPDF(orientation='P', unit='mm', format='A4')
+
+
+def _field_columns(fx):
+    return [(LEFT_X, LEFT_FIELDS), (RIGHT_X, RIGHT_FIELDS + [FX_FIELD] if fx else RIGHT_FIELDS)]
+
+
+def _draw_static(pdf, fx):
+    pdf.set_fill_color(*COLOR_NAVY); pdf.rect(*HEADER_BAND, style='F')
+    pdf.set_y(TITLE_Y); pdf.set_font("Times", 'B', 36); pdf.set_text_color(*COLOR_WHITE); pdf.cell(0, TITLE_H, "SDG Tech", 0, 1, 'C')
+    pdf.set_text_color(*COLOR_TEXT); pdf.set_font("Arial", 'B', 10)
+    for x, fields in _field_columns(fx):
+        for i, (label, _) in enumerate(fields):
+            pdf.set_xy(x, FIELDS_Y + i * LINE_H); pdf.cell(LABEL_W, LINE_H, label, 0, 0)
+
+
+class StaticLayer:
+    """The static layer drawn once on a scratch page: its content stream, the fonts it uses and the
+    drawing state it leaves, stamped onto each new page in place of redrawing it. These are
+    fpdf 1.7.2 internals (pages, fonts, current_font), hence the pin in requirements.txt."""
+    STATE = ("font_family", "font_style", "font_size_pt", "font_size", "underline", "text_color", "fill_color",
+             "draw_color", "color_flag")
+
+    def __init__(self, fx):
+        pdf = _new_pdf(); pdf.add_page()
+        start = len(pdf.pages[1]); _draw_static(pdf, fx)
+        self.stream = pdf.pages[1][start:]
+        self.fonts = pdf.fonts
+        self.state = {a: getattr(pdf, a) for a in self.STATE}
+
+    def stamp(self, pdf):
+        for key, font in self.fonts.items():
+            if key not in pdf.fonts: pdf.fonts[key] = dict(font)
+        pdf.pages[pdf.page] += self.stream
+        for a, v in self.state.items(): setattr(pdf, a, v)
+        pdf.current_font = pdf.fonts[pdf.font_family + pdf.font_style]
+
+
+_layers = {}
+_layers_lock = threading.Lock()
+
+
+def static_layer(fx):
+    with _layers_lock:
+        if fx not in _layers: _layers[fx] = StaticLayer(fx)
+        return _layers[fx]
+
+
+def _draw_payslip(pdf, record, emp_static):
+    fx = bool(record.exchange_rate and record.currency is not Currency.MYR)
+    static_layer(fx).stamp(pdf)
+    pdf.set_xy(pdf.l_margin, TITLE_Y + TITLE_H); pdf.set_font("Arial", 'B', 9); pdf.set_text_color(200, 200, 200)
+    pdf.cell(0, SUBTITLE_H, f"PAYSLIP FOR {record.month_label.upper()} {record.year or ''}", 0, 1, 'C')
+    pdf.set_text_color(*COLOR_TEXT); pdf.set_font("Arial", '', 10)
+    for x, fields in _field_columns(fx):
+        for i, (_, value) in enumerate(fields):
+            pdf.set_xy(x + LABEL_W, FIELDS_Y + i * LINE_H); pdf.cell(VALUE_W, LINE_H, f": {value(record, emp_static)}", 0, 0)
+    pdf.set_xy(pdf.l_margin, FIELDS_Y + len(_field_columns(fx)[1][1]) * LINE_H + 10)
+
+    # Symbol and words follow the sheet's currency text, as the payslip always did (payroll_models.currency_cell)
+    curr = emp_static.currency_text.split("(")[0].strip()
+    def draw_section(title, items, total_val, is_deduct=False):
+        pdf.set_fill_color(230, 230, 230); pdf.set_font("Arial", 'B', 10); 
+        pdf.cell(W_DESC + W_AMT, 8, f"  {title}", 0, 1, 'L', True); pdf.set_font("Arial", '', 10); 
+        for item in items:
+            pdf.cell(W_DESC, H_ROW, "  " + item.description, 0, 0, 'L', False)
+            pdf.cell(W_AMT, H_ROW, f"{item.amount:,.2f}  ", 0, 1, 'R', False)
+        pdf.set_fill_color(255, 255, 255); pdf.set_font("Arial", 'B', 10); 
+        label = "Total Deductions" if is_deduct else "Total Earnings"; 
+        pdf.cell(W_DESC, 8, f"{label}  ", "T", 0, 'R', False); 
+        pdf.cell(W_AMT, 8, f"{curr} {total_val:,.2f}  ", "T", 1, 'R', False); 
+        pdf.ln(5)
+
+    earn_items = [i for i in record.earnings if i.amount > 0]; total_earn = sum(i.amount for i in earn_items)
+    draw_section("EARNINGS", earn_items, total_earn, False)
+    deduct_items = [i for i in record.deductions if i.amount > 0]; total_deduct = sum(i.amount for i in deduct_items)
+    draw_section("DEDUCTIONS", deduct_items, total_deduct, True)
+    
+    net_pay = total_earn - total_deduct
+    pdf.set_fill_color(*COLOR_NAVY); pdf.set_text_color(*COLOR_WHITE); pdf.set_font("Arial", 'B', 12)
+    pdf.cell(W_DESC, 12, "  NET PAYABLE", 0, 0, 'L', True); pdf.cell(W_AMT, 12, f"{curr} {net_pay:,.2f}  ", 0, 1, 'R', True)
+    pdf.set_text_color(*COLOR_TEXT); pdf.ln(5)
+    
+    try:
+        words = amount_in_words(net_pay, emp_static.currency_text)
+        pdf.set_font("Arial", 'B', 9); pdf.cell(35, 5, "Amount in Words:", 0, 0, 'L')
+        pdf.set_font("Arial", 'I', 9); pdf.multi_cell(0, 5, words, 0, 'L')
+    except Exception as e: pdf.set_font("Arial", 'I', 9); pdf.multi_cell(0, 5, f"ERROR: {str(e)}", 0, 'L')
+    
+    if record.remarks:
+        pdf.ln(5); pdf.set_font("Arial", 'B', 9); pdf.cell(20, 5, "Comment:", 0, 0, 'L')
+        pdf.set_font("Arial", '', 9); pdf.multi_cell(0, 5, record.remarks, 0, 'L')
+
+    pdf.ln(15); pdf.set_font("Arial", 'I', 8); pdf.set_text_color(150, 150, 150); 
+    pdf.cell(0, 5, "This is computer generated no signature required.", 0, 1, 'C')
+
+
+@timed("create_pdf")
+def create_pdf(record, emp_static):
+    pdf = _new_pdf(); pdf.add_page()
+    _draw_payslip(pdf, record, emp_static)
+    return pdf.output(dest='S').encode('latin-1', errors='replace')
+
+
+@timed("create_month_pdf")
+def create_month_pdf(jobs, progress=None):
+    """One PDF for printing: a page per (record, employee) in jobs, in order.
+    progress(done, total) is called after every payslip."""
+    pdf = _new_pdf()
+    for n, (record, emp_static) in enumerate(jobs, 1):
+        pdf.add_page(); _draw_payslip(pdf, record, emp_static)
+        if progress: progress(n, len(jobs))
+    return pdf.output(dest='S').encode('latin-1', errors='replace')
+
+
+# ==========================================
+# PAYSLIP CACHE (content-addressed: memory LRU + optional disk tier)
+# ==========================================
+# Bump when create_pdf's layout changes so old cached files stop matching
+PAYSLIP_LAYOUT_VERSION = 1
+
+
+def payslip_cache_key(record, emp_static):
+    """Stable hash of exactly the fields create_pdf reads."""
+    payload = [
+        PAYSLIP_LAYOUT_VERSION,
+        [i.to_dict() for i in record.earnings], [i.to_dict() for i in record.deductions], record.remarks,
+        record.exchange_rate, record.currency.value, record.month_label, record.year,
+        emp_static.name, emp_static.designation, emp_static.join_date,
+        emp_static.currency_text, emp_static.bank_name, emp_static.account_number,
+    ]
+    return hashlib.sha256(json.dumps(payload, sort_keys=True, default=str).encode()).hexdigest()
+
+
+class PayslipCache:
+    def __init__(self, max_entries=256, disk_dir=None, disk_max_bytes=200 * 1024 * 1024):
+        self.max_entries = max_entries
+        self.disk_dir = disk_dir
+        self.disk_max_bytes = disk_max_bytes
+        self._mem = OrderedDict()     # key -> pdf bytes, most recently used last
+        self._by_record = {}          # record id -> key it was last rendered under
+        self._disk = {}               # key -> file size
+        self._lock = threading.Lock()
+        self.hits = self.misses = 0
+        if disk_dir:
+            os.makedirs(disk_dir, exist_ok=True)
+            for f in os.listdir(disk_dir):
+                if f.endswith(".pdf"): self._disk[f[:-4]] = os.path.getsize(os.path.join(disk_dir, f))
+
+    def _path(self, key): return os.path.join(self.disk_dir, key + ".pdf")
+
+    def get(self, key):
+        with self._lock:
+            if key in self._mem:
+                self._mem.move_to_end(key); self.hits += 1
+                return self._mem[key]
+            if key in self._disk:
+                try:
+                    with open(self._path(key), "rb") as f: data = f.read()
+                    os.utime(self._path(key))
+                except OSError:
+                    self._disk.pop(key, None)
+                else:
+                    self._remember(key, data); self.hits += 1
+                    return data
+            self.misses += 1
+            return None
+
+    def put(self, key, data, record_id=None):
+        with self._lock:
+            # An edited record renders under a new key; drop only that record's stale file
+            old = self._by_record.get(record_id) if record_id is not None else None
+            if old and old != key: self._forget(old)
+            if record_id is not None: self._by_record[record_id] = key
+            self._remember(key, data)
+            if self.disk_dir and key not in self._disk:
+                tmp = self._path(key) + ".tmp"
+                with open(tmp, "wb") as f: f.write(data)
+                os.replace(tmp, self._path(key))
+                self._disk[key] = len(data)
+                self._trim_disk()
+
+    def get_or_render(self, record, emp_static):
+        key = payslip_cache_key(record, emp_static)
+        data = self.get(key)
+        if data is None:
+            data = create_pdf(record, emp_static)
+            self.put(key, data, record.id)
+        return data
+
+    def _remember(self, key, data):
+        self._mem[key] = data; self._mem.move_to_end(key)
+        while len(self._mem) > self.max_entries: self._mem.popitem(last=False)
+
+    def _forget(self, key):
+        self._mem.pop(key, None)
+        if key in self._disk:
+            self._disk.pop(key)
+            try: os.remove(self._path(key))
+            except OSError: pass
+
+    def _trim_disk(self):
+        total = sum(self._disk.values())
+        if total <= self.disk_max_bytes: return
+        by_age = sorted(self._disk, key=lambda k: os.path.getmtime(self._path(k)) if os.path.exists(self._path(k)) else 0)
+        for key in by_age:
+            if total <= self.disk_max_bytes: break
+            total -= self._disk[key]
+            self._disk.pop(key)
+            try: os.remove(self._path(key))
+            except OSError: pass
+
+
+# ==========================================
+# BULK EXPORT (one ZIP per month, rendered on a process pool)
+# ==========================================
+def payslip_file_name(emp_id):
+    return f"Payslip_{str(emp_id).replace(' ', '_')}.pdf"
+
+
+def month_payslip_jobs(db, year, month_label):
+    """(file name, record, employee) for every record of the month whose employee still exists."""
+    jobs = []
+    for rec in db['records'].for_month(year, month_label):
+        emp = db['employees'].get(rec.employee_id)
+        if emp is not None: jobs.append((payslip_file_name(rec.employee_id), rec, emp))
+    return jobs
+
+
+def _render_job(job):
+    name, record, emp_static = job
+    return name, create_pdf(record, emp_static)
+
+
+def export_payslips_zip(jobs, dest, workers=None, progress=None, mp_context="spawn", cache=None):
+    """Renders jobs in parallel and streams each PDF into the ZIP at dest as soon as it is ready.
+
+    At most 2 x workers PDFs are in flight, so memory does not grow with the month's headcount.
+    Payslips already in cache are copied straight in; fresh renders are added to it.
+    progress(done, total) is called after every file."""
+    total = len(jobs)
+    done = 0
+    with zipfile.ZipFile(dest, "w", zipfile.ZIP_DEFLATED) as zf:
+        misses = []
+        for job in jobs:
+            key = payslip_cache_key(job[1], job[2]) if cache else None
+            data = cache.get(key) if cache else None
+            if data is None:
+                misses.append((key, job)); continue
+            zf.writestr(job[0], data)
+            done += 1
+            if progress: progress(done, total)
+        if not misses: return done
+
+        workers = workers or max(1, min(os.cpu_count() or 1, len(misses)))
+        ctx = multiprocessing.get_context(mp_context) if mp_context else None
+        with ProcessPoolExecutor(max_workers=workers, mp_context=ctx) as pool:
+            pending, queue = {}, iter(misses)
+            while True:
+                while len(pending) < workers * 2:
+                    item = next(queue, None)
+                    if item is None: break
+                    pending[pool.submit(_render_job, item[1])] = item
+                if not pending: break
+                finished, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for fut in finished:
+                    key, job = pending.pop(fut)
+                    name, pdf_bytes = fut.result()
+                    zf.writestr(name, pdf_bytes)
+                    if cache: cache.put(key, pdf_bytes, job[1].id)
+                    done += 1
+                    if progress: progress(done, total)
+    return done
+
+
+def export_month_zip(db, year, month_label, dest=None, **kwargs):
+    """Convenience wrapper: writes the month's ZIP (to a temp file unless dest is given) and returns its path."""
+    if dest is None:
+        fd, dest = tempfile.mkstemp(prefix=f"payslips_{month_label}_{year}_", suffix=".zip"); os.close(fd)
+    export_payslips_zip(month_payslip_jobs(db, year, month_label), dest, **kwargs)
+    return dest
@@ -0,0 +1,291 @@
+"""Local columnar snapshot of Records and Employees (Parquet files, read memory-mapped).
+
+    records.parquet     one row per payslip; line items kept as their JSON text
+    line_items.parquet  earnings/deductions exploded: record_id, kind, description, amount
+    employees.parquet
+    meta.json           when each table was last read from the backend + its sheet layout
+
+SnapshotStorage puts a snapshot in front of any payroll_storage backend: a cold start
+within max_age of the last backend read opens Records/Employees from the snapshot
+instead of downloading and parsing the sheet, every save refreshes only the rows it
+touched, and "Reload" makes the next open go back to the backend.
+"""
+import json
+import os
+import time
+
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
+
+from payroll_db import UPSERT, ChangeTracker, RecordStore, SheetLayout
+from payroll_metrics import METRICS
+from payroll_models import Currency, Employee, PayrollRecord, currency_cell
+from payroll_storage import window_start
+
+SNAPSHOT_DIR = ".payroll_snapshot"
+
+RECORD_SCHEMA = pa.schema([
+    ("id", pa.string()), ("employee_id", pa.string()), ("month_label", pa.string()),
+    ("payment_date", pa.date32()), ("year", pa.int32()),
+    ("earnings_list", pa.string()), ("deductions_list", pa.string()),
+    ("net_salary", pa.float64()), ("currency", pa.string()), ("remarks", pa.string()),
+    ("status", pa.string()), ("exchange_rate", pa.float64()), ("payment_date_text", pa.string()),
+])
+ITEM_SCHEMA = pa.schema([
+    ("record_id", pa.string()), ("kind", pa.string()), ("description", pa.string()), ("amount", pa.float64()),
+])
+EMPLOYEE_SCHEMA = pa.schema([
+    ("name", pa.string()), ("designation", pa.string()), ("join_date", pa.string()), ("date_of_birth", pa.string()),
+    ("currency", pa.string()), ("bank_name", pa.string()), ("account_number", pa.string()),
+    ("basic_salary", pa.float64()), ("status", pa.string()), ("master_remark", pa.string()),
+    ("last_increment", pa.string()), ("last_bonus", pa.string()),
+])
+
+# snapshot table -> (key column, worksheet whose layout it restores)
+TABLES = {"records": ("id", "Records"), "employees": ("name", "Employees")}
+
+
+# ==========================================
+# ROWS <-> ARROW
+# ==========================================
+def record_table(records):
+    recs = list(records)
+    texts = [r.line_items_json() for r in recs]
+    return pa.table({
+        "id": [r.id for r in recs], "employee_id": [r.employee_id for r in recs],
+        "month_label": [r.month_label for r in recs], "payment_date": [r.payment_date for r in recs],
+        "year": [r.year for r in recs], "earnings_list": [t[0] for t in texts], "deductions_list": [t[1] for t in texts],
+        "net_salary": [r.net_salary for r in recs], "currency": [r.currency_text for r in recs],
+        "remarks": [r.remarks for r in recs], "status": [r.status for r in recs],
+        "exchange_rate": [r.exchange_rate for r in recs],
+        "payment_date_text": [_odd_date_text(r) for r in recs],
+    }, schema=RECORD_SCHEMA)
+
+
+def _odd_date_text(rec):
+    # Only a payment_date cell that is not its ISO date: date32 cannot hold "TBC" or "25/01/2024"
+    txt = rec.payment_date_text
+    return None if txt == (str(rec.payment_date) if rec.payment_date else "") else txt
+
+
+def item_table(records):
+    """The long line-item table (this decodes the records' items)."""
+    rec_id, kind, desc, amount = [], [], [], []
+    for r in records:
+        for k, items in (("earning", r.earnings), ("deduction", r.deductions)):
+            for i in items:
+                rec_id.append(r.id); kind.append(k); desc.append(i.description); amount.append(i.amount)
+    return pa.table({"record_id": rec_id, "kind": kind, "description": desc, "amount": amount}, schema=ITEM_SCHEMA)
+
+
+def employee_table(employees):
+    emps = list(employees)
+    return pa.table({
+        "name": [e.name for e in emps], "designation": [e.designation for e in emps],
+        "join_date": [e.join_date for e in emps], "date_of_birth": [e.date_of_birth for e in emps],
+        "currency": [e.currency_text for e in emps], "bank_name": [e.bank_name for e in emps],
+        "account_number": [e.account_number for e in emps], "basic_salary": [e.basic_salary for e in emps],
+        "status": [e.status for e in emps], "master_remark": [e.master_remark for e in emps],
+        "last_increment": [json.dumps(e.last_increment) if e.last_increment else None for e in emps],
+        "last_bonus": [json.dumps(e.last_bonus) if e.last_bonus else None for e in emps],
+    }, schema=EMPLOYEE_SCHEMA)
+
+
+def _records_from(table):
+    cols = [table.column(f.name).to_pylist() for f in RECORD_SCHEMA]
+    currencies = {}
+    for txt in set(cols[8]):
+        cur = Currency.parse(txt); currencies[txt] = (cur, currency_cell(txt, cur))
+    # Written from already-normalised records, so the per-field cleaning can be skipped
+    out = []
+    for rid, emp, month, pay_date, _, earn, ded, net, curr, rem, status, rate, date_txt in zip(*cols):
+        cur, cur_cell = currencies[curr]
+        out.append(PayrollRecord.from_clean(rid, emp, month, pay_date, earn, ded, net, cur, rem, status, rate, cur_cell, date_txt))
+    return out
+
+
+def _employees_from(table):
+    rows = zip(*[table.column(f.name).to_pylist() for f in EMPLOYEE_SCHEMA])
+    return {r[0]: Employee(*r[:10], json.loads(r[10]) if r[10] else None, json.loads(r[11]) if r[11] else None)
+            for r in rows}
+
+
+# ==========================================
+# SNAPSHOT FILES
+# ==========================================
+class RecordSnapshot:
+    def __init__(self, path=SNAPSHOT_DIR, source=""):
+        self.path = path
+        self.source = source        # backend identity; a snapshot of another workbook is never served
+        os.makedirs(path, exist_ok=True)
+
+    def _file(self, name):
+        return os.path.join(self.path, f"{name}.parquet")
+
+    def has(self, name):
+        return os.path.exists(self._file(name))
+
+    def meta(self):
+        try:
+            with open(os.path.join(self.path, "meta.json"), encoding="utf-8") as f: meta = json.load(f)
+        except (OSError, ValueError):
+            return {"source": self.source, "tables": {}}
+        return meta if meta.get("source") == self.source else {"source": self.source, "tables": {}}
+
+    def _save_meta(self, meta):
+        tmp = os.path.join(self.path, "meta.json.tmp")
+        with open(tmp, "w", encoding="utf-8") as f: json.dump(meta, f)
+        os.replace(tmp, os.path.join(self.path, "meta.json"))
+
+    def _write(self, name, table):
+        # Write-then-rename: a reader never sees a half-written file
+        tmp = self._file(name) + ".tmp"
+        pq.write_table(table, tmp)
+        os.replace(tmp, self._file(name))
+
+    def age(self, name):
+        """Seconds since the table was last read from the backend, None if it never was."""
+        read_at = self.meta()["tables"].get(name, {}).get("read_at")
+        return None if read_at is None else time.time() - read_at
+
+    def is_fresh(self, name, max_age):
+        age = self.age(name)
+        files = ["records", "line_items"] if name == "records" else [name]
+        return age is not None and age <= max_age and all(self.has(f) for f in files)
+
+    def layout(self, name):
+        saved = self.meta()["tables"].get(name, {}).get("layout")
+        return SheetLayout(saved["header"], saved["keys"]) if saved else SheetLayout([], [])
+
+    def _stamp(self, name, layout, read_at=None):
+        meta = self.meta()
+        entry = meta["tables"].setdefault(name, {})
+        if read_at is not None: entry["read_at"] = read_at
+        entry["layout"] = {"header": layout.header, "keys": layout.keys} if layout is not None else None
+        self._save_meta(meta)
+
+    # ---------- whole tables ----------
+    def write(self, name, collection, layout=None):
+        """Full snapshot of a freshly read collection (RecordStore or {name: Employee})."""
+        if name == "records":
+            self._write("records", record_table(collection))
+            self._write("line_items", item_table(collection))
+        else:
+            self._write("employees", employee_table(collection.values()))
+        self._stamp(name, layout, read_at=time.time())
+
+    def read_records(self, since_year=None):
+        """RecordStore from the snapshot; with since_year older years stay on disk until asked for."""
+        table = pq.read_table(self._file("records"), memory_map=True)
+        if since_year is None: return RecordStore(_records_from(table))
+        year = table.column("year")
+        # Rows without a readable date count as recent, same as the backend readers
+        hot = pc.or_kleene(pc.greater_equal(year, since_year), pc.is_null(year))
+        store = RecordStore(_records_from(table.filter(hot)))
+        cold = table.filter(pc.invert(hot))
+        if cold.num_rows:
+            def fetch_older(from_year, before_year):
+                y = cold.column("year")
+                return _records_from(cold.filter(pc.and_(pc.less(y, before_year), pc.greater_equal(y, from_year or 0))))
+
+            def fetch_employees(emp_ids, before_year):
+                mine = pc.is_in(cold.column("employee_id"), value_set=pa.array(list(emp_ids), pa.string()))
+                return _records_from(cold.filter(pc.and_(pc.less(cold.column("year"), before_year), mine)))
+            store.since_year, store.fetch_older, store.fetch_employees = since_year, fetch_older, fetch_employees
+        return store
+
+    def read_employees(self):
+        return _employees_from(pq.read_table(self._file("employees"), memory_map=True))
+
+    # ---------- incremental refresh ----------
+    def _replace_rows(self, name, key, dead, fresh):
+        # Not memory-mapped: the file is replaced while this table is still in use
+        old = pq.read_table(self._file(name))
+        if dead: old = old.filter(pc.invert(pc.is_in(old.column(key), value_set=pa.array(sorted(dead), pa.string()))))
+        self._write(name, pa.concat_tables([old, fresh]))
+
+    def apply(self, data, changes):
+        """Brings the snapshot in line with one saved ChangeTracker batch; only the touched rows are converted."""
+        if changes.records and self.has("records") and self.has("line_items"):
+            live = [data['records'].get(k) for k, op in changes.records.items() if op == UPSERT and k in data['records']]
+            self._replace_rows("records", "id", set(changes.records), record_table(live))
+            self._replace_rows("line_items", "record_id", set(changes.records), item_table(live))
+            self._stamp("records", data['_sheets']['Records'])
+        if changes.employees and self.has("employees"):
+            live = [data['employees'][k] for k, op in changes.employees.items() if op == UPSERT and k in data['employees']]
+            self._replace_rows("employees", "name", set(changes.employees), employee_table(live))
+            self._stamp("employees", data['_sheets']['Employees'])
+
+    def invalidate(self):
+        """Keeps the files (analytics) but makes the next open read the backend again."""
+        meta = self.meta()
+        for entry in meta["tables"].values(): entry["read_at"] = None
+        self._save_meta(meta)
+
+    # ---------- analytics ----------
+    def line_items(self, year=None):
+        """Line items joined to their record's period, status and currency (payroll_engine.line_item_frame shape)."""
+        recs = pq.read_table(self._file("records"), memory_map=True,
+                             columns=["id", "year", "month_label", "payment_date", "status", "currency", "exchange_rate"])
+        if year is not None: recs = recs.filter(pc.equal(recs.column("year"), year))
+        items = pq.read_table(self._file("line_items"), memory_map=True)
+        return items.join(recs, keys="record_id", right_keys="id", join_type="inner").to_pandas()
+
+
+# ==========================================
+# STORAGE WRAPPER
+# ==========================================
+class SnapshotStorage:
+    """A payroll_storage backend with a RecordSnapshot in front (same load/open/save surface).
+
+    On a snapshot miss Records are read in full once so the snapshot covers every year;
+    the record_years window then applies to what is parsed from the snapshot."""
+
+    def __init__(self, inner, snapshot, max_age=3600):
+        self.inner = inner
+        self.snapshot = snapshot
+        self.max_age = max_age
+
+    def __getattr__(self, name):
+        return getattr(self.inner, name)
+
+    def load(self):
+        return self.inner.load()
+
+    def open(self, lock=None):
+        db = self.inner.open(lock)
+        since = window_start(getattr(self.inner, "record_years", None))
+        db.wrap_loader("employees", lambda read: self._cached("employees", read, self.snapshot.read_employees))
+        db.wrap_loader("records", lambda read: self._cached("records", read, lambda: self.snapshot.read_records(since)))
+        return db
+
+    def _cached(self, name, read, read_snapshot):
+        sheet = TABLES[name][1]
+
+        def load(data):
+            if self.snapshot.is_fresh(name, self.max_age):
+                try:
+                    with METRICS.time(f"snapshot.read:{name}"): collection = read_snapshot()
+                    data['_sheets'][sheet] = self.snapshot.layout(name)
+                    return collection
+                except Exception:
+                    pass        # unreadable snapshot: the backend is still the source of truth
+            collection = read(data)
+            if name == "records": collection.load_all()
+            # An empty result may be a failed read; never pin that as fresh. Nor a Records sheet with
+            # repeated ids: the snapshot is keyed by id and would lose the extra rows
+            if len(collection) and not getattr(collection, "duplicates", None):
+                try: self.snapshot.write(name, collection, data['_sheets'][sheet])
+                except Exception: pass
+            return collection
+        return load
+
+    def save(self, data, changes):
+        batch = ChangeTracker(); batch.merge(changes)      # inner.save resets changes
+        self.inner.save(data, changes)
+        try: self.snapshot.apply(data, batch)
+        except Exception: self.snapshot.invalidate()
+
+    def invalidate(self):
+        self.snapshot.invalidate()
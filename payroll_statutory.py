@@ -0,0 +1,148 @@
+"""Malaysian statutory deductions: EPF (KWSP), SOCSO (PERKESO), EIS (SIP) and PCB/MTD.
+
+The contribution schedules are wage bands. They are built once at import into sorted
+band limits and looked up with a binary search (np.searchsorted), so a whole month of
+employees is priced in a few array operations.
+
+    EPF    Third Schedule: RM20 bands to RM5,000, RM100 bands to RM20,000, exact % above;
+           contribution on the band's upper limit, rounded up to the ringgit.
+           Employee 11%, employer 13% (12% above RM5,000). Age 60+: employee 0%, employer 4%.
+    SOCSO  Category 1 (employment injury + invalidity) 0.5% / 1.75%; age 60+ Category 2, employer 1.25%.
+    EIS    0.2% / 0.2%, age 18 to 59 only.
+           SOCSO and EIS are charged on the band's assumed wage, capped at the RM6,000 band,
+           rounded up to 5 sen (RM1,900.01-2,000: assumed 1,950, employer SOCSO 34.125 -> 34.15).
+    PCB    Monthly tax deduction, an estimate for a resident with no spouse/child reliefs:
+           (12 x gross - RM9,000 personal relief - EPF relief up to RM4,000) taxed on the
+           YA2024 resident scale, RM400 rebate up to RM35,000 chargeable, / 12; under RM10 -> 0.
+
+Figures follow the published rates. The official tables remain the reference: check
+them when the rates change.
+"""
+from datetime import datetime
+
+import numpy as np
+
+from payroll_models import Currency, LineItem
+
+EPF_LINE, SOCSO_LINE, EIS_LINE, PCB_LINE = "EPF (Employee)", "SOCSO (Employee)", "EIS (Employee)", "PCB (MTD)"
+STATUTORY_LINES = [EPF_LINE, SOCSO_LINE, EIS_LINE, PCB_LINE]
+
+SENIOR_AGE = 60
+SOCSO_EIS_CEILING = 6000.0
+
+
+def _bands(limits, values):
+    return np.asarray(limits, dtype=float), np.asarray(values, dtype=float)
+
+
+# ---------- EPF ----------
+EPF_TABLE_MAX = 20000.0
+_EPF_LIMITS = np.concatenate([[10.0], np.arange(20.0, 5000.0 + 1, 20.0), np.arange(5100.0, EPF_TABLE_MAX + 1, 100.0)])
+EPF_EMPLOYEE = _bands(_EPF_LIMITS, np.where(_EPF_LIMITS <= 10, 0.0, np.ceil(np.round(_EPF_LIMITS * 0.11, 6))))
+EPF_EMPLOYER = _bands(_EPF_LIMITS, np.where(_EPF_LIMITS <= 10, 0.0,
+                                             np.ceil(np.round(_EPF_LIMITS * np.where(_EPF_LIMITS <= 5000, 0.13, 0.12), 6))))
+EPF_EMPLOYER_SENIOR = _bands(_EPF_LIMITS, np.where(_EPF_LIMITS <= 10, 0.0, np.ceil(np.round(_EPF_LIMITS * 0.04, 6))))
+
+# ---------- SOCSO / EIS ----------
+_SE_LIMITS = np.concatenate([[30.0, 50.0, 70.0, 100.0, 140.0, 200.0, 300.0], np.arange(400.0, SOCSO_EIS_CEILING + 1, 100.0)])
+_SE_ASSUMED = (np.concatenate([[10.0], _SE_LIMITS[:-1]]) + _SE_LIMITS) / 2      # band midpoint
+
+
+def _five_sen(x):
+    # Up to the next 5 sen, as the schedule does; the inner round keeps exact multiples from creeping up
+    return np.ceil(np.round(x * 20, 6)) / 20
+
+
+SOCSO_EMPLOYEE = _bands(_SE_LIMITS, _five_sen(_SE_ASSUMED * 0.005))
+SOCSO_EMPLOYER = _bands(_SE_LIMITS, _five_sen(_SE_ASSUMED * 0.0175))
+SOCSO_EMPLOYER_SENIOR = _bands(_SE_LIMITS, _five_sen(_SE_ASSUMED * 0.0125))
+EIS_SHARE = _bands(_SE_LIMITS, _five_sen(_SE_ASSUMED * 0.002))
+
+# ---------- PCB ----------
+PERSONAL_RELIEF = 9000.0
+EPF_RELIEF_MAX = 4000.0
+REBATE, REBATE_LIMIT = 400.0, 35000.0
+MTD_MINIMUM = 10.0
+# Chargeable income bands: lower limit, rate; tax at each lower limit is accumulated below
+PCB_LOWER = np.array([0, 5000, 20000, 35000, 50000, 70000, 100000, 400000, 600000, 2000000], dtype=float)
+PCB_RATE = np.array([0, 0.01, 0.03, 0.06, 0.11, 0.19, 0.25, 0.26, 0.28, 0.30])
+PCB_BASE = np.concatenate([[0.0], np.cumsum(np.diff(PCB_LOWER) * PCB_RATE[:-1])])
+
+
+def band_lookup(table, wages):
+    """Value of the band each wage falls in (limit >= wage); wages above the last band use it."""
+    limits, values = table
+    idx = np.minimum(np.searchsorted(limits, wages, side="left"), len(limits) - 1)
+    return np.where(wages > 0, values[idx], 0.0)
+
+
+def epf(wages, senior):
+    employee = np.where(senior, 0.0, band_lookup(EPF_EMPLOYEE, wages))
+    employer = np.where(senior, band_lookup(EPF_EMPLOYER_SENIOR, wages), band_lookup(EPF_EMPLOYER, wages))
+    # Past the schedule: the exact percentage, still rounded up to the ringgit
+    over = wages > EPF_TABLE_MAX
+    employee = np.where(over & ~senior, np.ceil(np.round(wages * 0.11, 6)), employee)
+    employer = np.where(over, np.ceil(np.round(wages * np.where(senior, 0.04, 0.12), 6)), employer)
+    return employee, employer
+
+
+def pcb(wages, epf_employee):
+    chargeable = np.maximum(wages * 12 - PERSONAL_RELIEF - np.minimum(epf_employee * 12, EPF_RELIEF_MAX), 0.0)
+    i = np.searchsorted(PCB_LOWER, chargeable, side="right") - 1
+    tax = PCB_BASE[i] + (chargeable - PCB_LOWER[i]) * PCB_RATE[i]
+    tax = np.maximum(tax - np.where(chargeable <= REBATE_LIMIT, REBATE, 0.0), 0.0)
+    mtd = np.round(tax / 12, 2)
+    return np.where(mtd < MTD_MINIMUM, 0.0, mtd)
+
+
+class StatutoryResult:
+    """Column arrays, one entry per employee priced."""
+
+    def __init__(self, **cols):
+        self.cols = cols
+
+    def __getitem__(self, name): return self.cols[name]
+    def __len__(self): return len(self.cols["wages"])
+
+    def deductions(self, i):
+        return {EPF_LINE: self.cols["epf_employee"][i], SOCSO_LINE: self.cols["socso_employee"][i],
+                EIS_LINE: self.cols["eis_employee"][i], PCB_LINE: self.cols["pcb"][i]}
+
+    def employer(self, i):
+        return {"EPF": self.cols["epf_employer"][i], "SOCSO": self.cols["socso_employer"][i], "EIS": self.cols["eis_employer"][i]}
+
+
+def calculate(wages, ages):
+    """Statutory amounts for arrays of monthly wages and ages (NaN age = unknown, treated as under 60)."""
+    wages = np.nan_to_num(np.asarray(wages, dtype=float))
+    ages = np.asarray(ages, dtype=float)
+    senior = ages >= SENIOR_AGE
+    epf_ee, epf_er = epf(wages, senior)
+    eis = np.where((ages < 18) | senior, 0.0, band_lookup(EIS_SHARE, wages))
+    return StatutoryResult(
+        wages=wages, epf_employee=epf_ee, epf_employer=epf_er,
+        socso_employee=np.where(senior, 0.0, band_lookup(SOCSO_EMPLOYEE, wages)),
+        socso_employer=np.where(senior, band_lookup(SOCSO_EMPLOYER_SENIOR, wages), band_lookup(SOCSO_EMPLOYER, wages)),
+        eis_employee=eis, eis_employer=eis, pcb=pcb(wages, epf_ee),
+    )
+
+
+def age_on(date_of_birth, on):
+    """Whole years on date on; NaN when the date of birth is blank or unreadable."""
+    try: dob = datetime.strptime(date_of_birth, "%d %b %Y").date()
+    except (TypeError, ValueError): return np.nan
+    return on.year - dob.year - ((on.month, on.day) < (dob.month, dob.day))
+
+
+def applies_to(employee):
+    # Statutory schemes are run for the ringgit payroll; USD staff are paid outside it
+    return employee.currency is Currency.MYR
+
+
+def apply_statutory(deductions, amounts):
+    """Sets each statutory line (adding missing ones at the end) without reordering the others."""
+    out = [LineItem(d.description, d.amount) for d in deductions]
+    seen = set()
+    for d in out:
+        if d.description in amounts: d.amount = float(amounts[d.description]); seen.add(d.description)
+    return out + [LineItem(k, float(v)) for k, v in amounts.items() if k not in seen]
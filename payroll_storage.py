@@ -0,0 +1,262 @@
+"""Where the payroll data lives.
+
+Every backend has load() -> db dict (same shape as payroll_db.load_db), open(lock) ->
+the same dict as a payroll_db.LazyDB that reads each collection on first access, and
+save(db, changes) which persists one ChangeTracker batch.
+
+record_years limits what open() reads of Records to the last N payment years; older
+years are fetched on demand (RecordStore.ensure_year / ensure_employees / load_all).
+
+    SheetsStorage(conn)        the Google Sheet (or an .xlsx export via WorkbookConnection)
+    SQLiteStorage("payroll.db") a local file, works offline
+"""
+import calendar
+import sqlite3
+from contextlib import closing
+from datetime import date
+
+import pandas as pd
+
+import payroll_db
+from payroll_db import (DELETE, EMP_COLUMNS, LEAVE_COLUMNS, REC_COLUMNS, UPSERT, LeaveStore, RecordStore,
+                        employee_to_row, leave_to_row, record_to_row, safe_float)
+from payroll_metrics import timed
+
+
+def window_start(record_years):
+    return date.today().year - int(record_years) + 1 if record_years else None
+
+
+def _guarded(read, fallback):
+    # Same rule as load_db: an unreadable sheet shows as empty instead of breaking the page
+    def load(data):
+        try: return read(data)
+        except Exception: return fallback()
+    return load
+
+
+class SheetsStorage:
+    name = "sheets"
+
+    def __init__(self, conn, record_years=None):
+        self.conn = conn
+        self.record_years = record_years
+
+    def load(self):
+        return payroll_db.load_db(self.conn)
+
+    def open(self, lock=None):
+        conn, since = self.conn, window_start(self.record_years)
+        return payroll_db.LazyDB({
+            "settings": _guarded(lambda d: payroll_db.read_settings(conn), lambda: payroll_db.new_db()['settings']),
+            "employees": _guarded(lambda d: payroll_db.read_employees(conn, d), dict),
+            "records": _guarded(lambda d: payroll_db.read_records(conn, d, since, lazy=True), RecordStore),
+            "leave_records": _guarded(lambda d: payroll_db.read_leaves(conn, d), LeaveStore),
+        }, lock)
+
+    def save(self, data, changes):
+        payroll_db.save_db(self.conn, data, changes)
+
+
+# ==========================================
+# SQLITE
+# ==========================================
+SQLITE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS settings (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+CREATE TABLE IF NOT EXISTS employees (
+    name TEXT PRIMARY KEY,
+    designation TEXT, join_date TEXT, date_of_birth TEXT, currency TEXT, bank_name TEXT,
+    account_number TEXT, basic_salary REAL, status TEXT, master_remark TEXT,
+    last_increment TEXT, last_bonus TEXT
+);
+CREATE TABLE IF NOT EXISTS records (
+    id TEXT PRIMARY KEY,
+    employee_id TEXT NOT NULL,
+    year INTEGER, month INTEGER,
+    month_label TEXT, payment_date TEXT, earnings_list TEXT, deductions_list TEXT,
+    net_salary REAL, currency TEXT, remarks TEXT, status TEXT, exchange_rate REAL
+);
+CREATE INDEX IF NOT EXISTS records_employee ON records (employee_id);
+CREATE INDEX IF NOT EXISTS records_period ON records (year, month);
+CREATE TABLE IF NOT EXISTS leave (
+    id TEXT PRIMARY KEY,
+    employee_id TEXT NOT NULL,
+    date TEXT, days REAL, reason TEXT, notes TEXT
+);
+CREATE INDEX IF NOT EXISTS leave_employee ON leave (employee_id, date);
+CREATE TABLE IF NOT EXISTS fx_rates (
+    currency TEXT NOT NULL,
+    effective_date TEXT NOT NULL,
+    rate REAL,
+    PRIMARY KEY (currency, effective_date)
+);
+"""
+
+_MONTH_NUMBER = {name: i for i, name in enumerate(calendar.month_name) if name}
+
+
+def _sql(v):
+    # NaN/NaT become NULL, timestamps their date text, numpy scalars plain python
+    if v is None or (isinstance(v, float) and v != v) or v is pd.NaT: return None
+    if isinstance(v, (int, float, str)): return v
+    if isinstance(v, pd.Timestamp): return str(v.date())
+    if hasattr(v, "item"): return v.item()
+    return str(v)
+
+
+def _record_row(r):
+    row = record_to_row(r)
+    row["year"] = r.year
+    row["month"] = _MONTH_NUMBER.get(r.month_label)
+    return row
+
+
+class _Table:
+    def __init__(self, name, key, columns, to_row):
+        self.name, self.key, self.columns, self.to_row = name, key, columns, to_row
+        cols = ", ".join(columns)
+        marks = ", ".join("?" * len(columns))
+        updates = ", ".join(f"{c} = excluded.{c}" for c in columns if c != key)
+        self.upsert_sql = f"INSERT INTO {name} ({cols}) VALUES ({marks}) ON CONFLICT ({key}) DO UPDATE SET {updates}"
+        self.delete_sql = f"DELETE FROM {name} WHERE {key} = ?"
+
+    def values(self, item):
+        row = self.to_row(item)
+        return [_sql(row[c]) for c in self.columns]
+
+
+EMPLOYEES = _Table("employees", "name", EMP_COLUMNS, employee_to_row)
+RECORDS = _Table("records", "id", REC_COLUMNS + ["year", "month"], _record_row)
+LEAVE = _Table("leave", "id", LEAVE_COLUMNS, leave_to_row)
+
+
+class SQLiteStorage:
+    """Local database file. Saves are row-level upserts/deletes in one transaction per batch."""
+
+    name = "sqlite"
+
+    def __init__(self, path, record_years=None):
+        self.path = path
+        self.record_years = record_years
+        with closing(self._connect()) as con:
+            con.execute("PRAGMA journal_mode=WAL")
+            con.executescript(SQLITE_SCHEMA)
+
+    def _connect(self):
+        # One short-lived connection per call: Streamlit sessions run on different threads
+        return sqlite3.connect(self.path, timeout=30)
+
+    def load(self):
+        db = self.open(window=False)
+        for key in ("settings", "employees", "records", "leave_records"): db[key]
+        return db
+
+    def open(self, lock=None, window=True):
+        since = window_start(self.record_years) if window else None
+        return payroll_db.LazyDB({
+            "settings": lambda d: self._read_settings(),
+            "employees": lambda d: self._read_employees(),
+            "records": lambda d: self._read_records(since),
+            "leave_records": lambda d: self._read_leaves(),
+        }, lock)
+
+    @timed("sqlite.query")
+    def _query(self, sql, params=()):
+        with closing(self._connect()) as con:
+            return pd.read_sql_query(sql, con, params=params)
+
+    def _read_settings(self):
+        settings = payroll_db.new_db()['settings']
+        df = self._query("SELECT value FROM settings WHERE key = 'usd_rate'")
+        if not df.empty: settings['usd_rate'] = safe_float(df.iloc[0]['value'])
+        df_rates = self._query("SELECT currency, effective_date, rate FROM fx_rates")
+        if not df_rates.empty: settings['fx_rates'] = payroll_db.parse_rates(df_rates)
+        return settings
+
+    def _read_employees(self):
+        df_emp = self._query(f"SELECT {', '.join(EMP_COLUMNS)} FROM employees ORDER BY rowid")
+        return payroll_db.parse_employees(df_emp) if not df_emp.empty else {}
+
+    def _read_records(self, since_year=None):
+        cols = ', '.join(REC_COLUMNS)
+        if since_year is None:
+            df_rec = self._query(f"SELECT {cols} FROM records ORDER BY rowid")
+            return RecordStore(payroll_db.parse_records(df_rec, lazy=True)) if not df_rec.empty else RecordStore()
+        # records_period index: only the window's rows leave the file
+        df_rec = self._query(f"SELECT {cols} FROM records WHERE year >= ? OR year IS NULL ORDER BY rowid", (since_year,))
+        store = RecordStore(payroll_db.parse_records(df_rec, lazy=True)) if not df_rec.empty else RecordStore()
+
+        def fetch_older(from_year, before_year):
+            older = self._query(f"SELECT {cols} FROM records WHERE year < ? AND year >= ? ORDER BY rowid",
+                                (before_year, from_year or 0))
+            return payroll_db.parse_records(older, lazy=True)
+
+        def fetch_employees(emp_ids, before_year):
+            # records_employee index; the ids go in chunks under SQLite's bound-parameter limit
+            older = []
+            for i in range(0, len(emp_ids), 500):
+                chunk = emp_ids[i:i + 500]
+                older += payroll_db.parse_records(self._query(
+                    f"SELECT {cols} FROM records WHERE year < ? AND employee_id IN ({', '.join('?' * len(chunk))}) "
+                    "ORDER BY rowid", (before_year, *chunk)), lazy=True)
+            return older
+        store.since_year, store.fetch_older, store.fetch_employees = since_year, fetch_older, fetch_employees
+        return store
+
+    def _read_leaves(self):
+        df_leave = self._query(f"SELECT {', '.join(LEAVE_COLUMNS)} FROM leave ORDER BY rowid")
+        return LeaveStore(payroll_db.parse_leaves(df_leave)) if not df_leave.empty else LeaveStore()
+
+    @timed("sqlite.save")
+    def save(self, data, changes):
+        with closing(self._connect()) as con, con:
+            if changes.settings: self._save_settings(con, data)
+            self._apply(con, EMPLOYEES, changes.employees, data['employees'].get)
+            self._apply(con, RECORDS, changes.records, data['records'].get)
+            self._apply(con, LEAVE, changes.leaves, data['leave_records'].get)
+        changes.reset()
+
+    def replace_all(self, data):
+        """Overwrites every table with data (used by the migration)."""
+        with closing(self._connect()) as con, con:
+            for table in (EMPLOYEES, RECORDS, LEAVE): con.execute(f"DELETE FROM {table.name}")
+            self._save_settings(con, data)
+            con.executemany(EMPLOYEES.upsert_sql, [EMPLOYEES.values(e) for e in data['employees'].values()])
+            con.executemany(RECORDS.upsert_sql, [RECORDS.values(r) for r in data['records']])
+            con.executemany(LEAVE.upsert_sql, [LEAVE.values(l) for l in data['leave_records']])
+
+    def _save_settings(self, con, data):
+        con.execute("INSERT INTO settings (key, value) VALUES ('usd_rate', ?) ON CONFLICT (key) DO UPDATE SET value = excluded.value",
+                    (str(safe_float(data['settings']['usd_rate'])),))
+        # The rate history is small: replaced as a whole with the settings
+        con.execute("DELETE FROM fx_rates")
+        con.executemany("INSERT INTO fx_rates (currency, effective_date, rate) VALUES (?, ?, ?)",
+                        [(code, str(on), rate) for code, on, rate in data['settings']['fx_rates'].rows()])
+
+    def _apply(self, con, table, ops, lookup):
+        dead = [(k,) for k, op in ops.items() if op == DELETE]
+        live = [table.values(lookup(k)) for k, op in ops.items() if op == UPSERT and lookup(k) is not None]
+        if dead: con.executemany(table.delete_sql, dead)
+        if live: con.executemany(table.upsert_sql, live)
+
+
+# ==========================================
+# SELECTION
+# ==========================================
+SQLITE_SUFFIXES = (".db", ".sqlite", ".sqlite3")
+
+
+def open_storage(source):
+    """'sheets' -> the live Google Sheet, *.db/*.sqlite -> SQLite, otherwise an .xlsx export."""
+    if str(source).lower().endswith(SQLITE_SUFFIXES): return SQLiteStorage(source)
+    return SheetsStorage(payroll_db.open_connection(source))
+
+
+def migrate(source, dest):
+    """Copies everything from source (sheets/.xlsx) into the SQLite file dest. Returns the loaded db."""
+    data = open_storage(source).load()
+    SQLiteStorage(dest).replace_all(data)
+    return data
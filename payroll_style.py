@@ -0,0 +1,123 @@
+"""Page-wide CSS and the sidebar JS, injected at the top of every full rerun.
+
+PAGE_HEAD is the readable source; page_head() is the whitespace- and comment-stripped
+copy, built once per process and sent on each rerun.
+"""
+import functools
+import re
+
+# --- 注入 JS 脚本：专门解决手机 Sidebar 不自动收回的问题 ---
+PAGE_HEAD = """<script>
+    const radios = window.parent.document.querySelectorAll('input[type="radio"]');
+    radios.forEach(radio => {
+        radio.addEventListener('click', () => {
+            const closeBtn = window.parent.document.querySelector('button[kind="header"]');
+            if (closeBtn) {
+                closeBtn.click();
+            }
+        });
+    });
+</script>
+<style>
+    /* --- GLOBAL FONT FIX --- */
+    html, body, [class*="css"] {
+        font-family: "Source Sans Pro", -apple-system, BlinkMacSystemFont, "Segoe UI", Roboto, "Helvetica Neue", Arial, sans-serif !important;
+    }
+    
+    /* --- TABLE SCROLL FIX (手机横向滚动) --- */
+    [data-testid="stDataFrame"] {
+        width: 100%;
+        overflow-x: auto;
+        display: block;
+        white-space: nowrap;
+    }
+    
+    /* --- SIDEBAR --- */
+    [data-testid="stSidebar"] { background-color: #1a1f36; }
+    [data-testid="stSidebar"] * { color: #ffffff !important; }
+    .stRadio > div[role="radiogroup"] > label {
+        background-color: transparent; color: white; padding: 10px 15px; border-radius: 8px; margin-bottom: 5px; border: 1px solid transparent;
+    }
+    .stRadio > div[role="radiogroup"] > label:hover { background-color: #2c3350; cursor: pointer; }
+
+    /* --- METRICS --- */
+    .metric-card-purple { background-color: #7f56d9; color: white; padding: 20px; border-radius: 12px; text-align: center; box-shadow: 0 4px 6px rgba(0,0,0,0.1); }
+    .metric-card-blue { background-color: #0070f3; color: white; padding: 20px; border-radius: 12px; text-align: center; box-shadow: 0 4px 6px rgba(0,0,0,0.1); }
+    .metric-label { font-size: 14px; font-weight: 500; opacity: 0.9; margin-bottom: 5px; }
+    .metric-value { font-size: 28px; font-weight: 700; }
+
+    /* --- COMPACT BUTTONS & ROWS --- */
+    .stButton button {
+        height: 32px !important; 
+        padding-top: 0px !important;
+        padding-bottom: 0px !important;
+        line-height: 1 !important;
+        border-radius: 4px;
+        white-space: nowrap !important;
+    }
+    
+    div[data-testid="column"] > div {
+        display: flex;
+        flex-direction: column;
+        justify-content: center;
+        height: 100%;
+    }
+
+    .input-label-spacer { height: 28px; } 
+
+    /* ====================================================================
+       MOBILE ULTRA-COMPACT LAYOUT (手机极度紧凑模式)
+       ==================================================================== */
+    @media (max-width: 800px) {
+        /* 1. 强制容器宽度变窄，消灭中间的空白 */
+        .main .block-container {
+            min-width: 380px !important; 
+            max-width: 100vw !important;
+            padding-left: 2px !important;
+            padding-right: 2px !important;
+            overflow-x: auto !important;
+        }
+        
+        html, body {
+            overflow-x: auto !important;
+        }
+
+        /* 2. 强制横向，且间距 (gap) 设为 0 */
+        div[data-testid="stHorizontalBlock"] {
+            flex-direction: row !important;
+            flex-wrap: nowrap !important;
+            gap: 0px !important; 
+        }
+        
+        /* 3. 允许列被压缩，并缩小字体 */
+        div[data-testid="column"] {
+            width: auto !important;
+            flex: 1 1 auto !important;
+            min-width: 0px !important;
+            padding: 0px !important;
+        }
+
+        /* 4. 缩小所有文字 */
+        div[data-testid="column"] p, 
+        div[data-testid="column"] span,
+        div[data-testid="column"] div {
+            font-size: 11px !important; 
+        }
+        
+        /* 5. 调整按钮大小 */
+        .stButton button {
+            padding: 0px 4px !important;
+            font-size: 10px !important;
+            height: 28px !important;
+            min-height: 28px !important;
+        }
+    }
+</style>
+"""
+
+
+@functools.lru_cache(maxsize=None)
+def page_head():
+    html = re.sub(r"/\*.*?\*/", "", PAGE_HEAD, flags=re.S)
+    html = re.sub(r"\s+", " ", html)
+    return re.sub(r"\s*([{};:,>])\s*", r"\1", html).strip()
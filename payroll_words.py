@@ -0,0 +1,59 @@
+"""Amount in words for payslips: "ONE THOUSAND TWO HUNDRED RINGGIT AND FIFTY SEN ONLY".
+
+The text is exactly num2words(n, lang='en').upper().replace(",", "") for the whole and cent
+parts, but built by a small English converter (|n| < 10**15; larger numbers still go to
+num2words) and memoized per amount, so a month run spells each distinct net pay once.
+"""
+import functools
+
+CACHE_SIZE = 4096
+LIMIT = 10 ** 15
+
+_ONES = ["zero", "one", "two", "three", "four", "five", "six", "seven", "eight", "nine", "ten", "eleven", "twelve",
+         "thirteen", "fourteen", "fifteen", "sixteen", "seventeen", "eighteen", "nineteen"]
+_TENS = ["", "", "twenty", "thirty", "forty", "fifty", "sixty", "seventy", "eighty", "ninety"]
+_SCALES = [(10 ** 12, "trillion"), (10 ** 9, "billion"), (10 ** 6, "million"), (10 ** 3, "thousand")]
+
+
+def _below_1000(n):
+    if n < 20: return _ONES[n]
+    if n < 100:
+        tens, ones = divmod(n, 10)
+        return _TENS[tens] + (f"-{_ONES[ones]}" if ones else "")
+    hundreds, rest = divmod(n, 100)
+    return f"{_ONES[hundreds]} hundred" + (f" and {_below_1000(rest)}" if rest else "")
+
+
+def cardinal(n):
+    """num2words(n, lang='en') for an int: 1234 -> 'one thousand, two hundred and thirty-four'."""
+    if n < 0: return "minus " + cardinal(-n)
+    if n >= LIMIT:
+        from num2words import num2words
+        return num2words(n, lang='en')
+    if n < 1000: return _below_1000(n)
+    parts = []
+    for size, name in _SCALES:
+        if n >= size:
+            count, n = divmod(n, size)
+            parts.append(f"{_below_1000(count)} {name}")
+    # Like num2words: a last group under 100 joins with "and", anything else with a comma
+    if n == 0: return ", ".join(parts)
+    if n < 100: return ", ".join(parts) + f" and {_below_1000(n)}"
+    return ", ".join(parts + [_below_1000(n)])
+
+
+@functools.lru_cache(maxsize=CACHE_SIZE)
+def _spell(dollars, cents, myr):
+    dollars_txt = cardinal(dollars).upper().replace(",", "")
+    cents_txt = cardinal(cents).upper().replace(",", "")
+    if myr: return f"{dollars_txt} RINGGIT AND {cents_txt} SEN ONLY" if cents > 0 else f"{dollars_txt} RINGGIT ONLY"
+    return f"{dollars_txt} DOLLARS AND {cents_txt} CENTS ONLY" if cents > 0 else f"{dollars_txt} DOLLARS ONLY"
+
+
+def amount_in_words(amount, currency):
+    """Net pay as printed on the payslip: RINGGIT/SEN when the currency text has "RM", DOLLARS/CENTS
+    otherwise, the rule create_pdf always used. Pass the sheet text (Employee.currency_text): "MYR"
+    or "SGD" spell DOLLARS there although they convert as ringgit."""
+    net_val = round(amount, 2)
+    dollars = int(net_val); cents = int(round((net_val - dollars) * 100))
+    return _spell(dollars, cents, "RM" in str(currency))
@@ -0,0 +1,172 @@
+"""Write-behind saving: the UI journals a change batch and returns, a background thread
+writes it to storage.
+
+A batch is acknowledged once its rows are appended (and fsynced) to a small JSON-lines
+journal. The writer coalesces everything pending into one save, retries with backoff
+and marks the journal done afterwards; on start-up any batch without a done marker is
+replayed, so a crash or restart never loses an acknowledged write.
+"""
+import atexit
+import json
+import os
+import threading
+import time
+
+from payroll_db import UPSERT, ChangeTracker, LeaveStore, RecordStore, apply_snapshot, snapshot_changes
+
+JOURNAL_PATH = ".payroll_journal.jsonl"
+
+SAVED, SAVING, FAILED = "saved", "saving", "failed"
+
+
+def _ops(snap):
+    # Rebuilds the ChangeTracker a journaled snapshot came from
+    changes = ChangeTracker()
+    if snap.get("settings"): changes.touch_settings()
+    for k, row in snap.get("employees", {}).items():
+        (changes.delete_employee if row is None else changes.upsert_employee)(k)
+    for k, row in snap.get("records", {}).items():
+        (changes.delete_record if row is None else changes.upsert_record)(k)
+    for k, row in snap.get("leaves", {}).items():
+        (changes.delete_leave if row is None else changes.upsert_leave)(k)
+    return changes
+
+
+class _Journaled:
+    """A live RecordStore/LeaveStore with a batch's journaled rows in front (None = deleted)."""
+
+    def __init__(self, live, rows, key):
+        self.live, self.rows, self.key = live, rows, key
+
+    @property
+    def duplicates(self): return self.live.duplicates
+    def load_all(self): self.live.load_all()
+    def get(self, k): return self.rows[k] if k in self.rows else self.live.get(k)
+    def __contains__(self, k): return self.get(k) is not None
+
+    def __iter__(self):
+        seen = set()
+        for item in self.live:
+            k = self.key(item); seen.add(k)
+            if k not in self.rows: yield item
+            elif self.rows[k] is not None: yield self.rows[k]
+        for k, item in self.rows.items():
+            if k not in seen and item is not None: yield item
+
+
+def _journaled_db(live, batch, changes):
+    """What the writer saves: the rows as they were journaled, not as the UI has edited them
+    since (sessions change the shared db in place). A full sheet rewrite takes the other rows
+    from the live db."""
+    scratch = {"settings": dict(live['settings']), "employees": {}, "records": RecordStore(), "leave_records": LeaveStore()}
+    for _, snap in batch: apply_snapshot(scratch, snap, ChangeTracker())
+
+    def rows(ops, items):
+        return {k: items.get(k) if op == UPSERT else None for k, op in ops.items()}
+    employees = dict(list(live['employees'].items()))
+    for k, emp in rows(changes.employees, scratch['employees']).items():
+        if emp is None: employees.pop(k, None)
+        else: employees[k] = emp
+    return {"settings": scratch['settings'] if changes.settings else live['settings'], "employees": employees,
+            "records": _Journaled(live['records'], rows(changes.records, scratch['records']), lambda r: r.id),
+            "leave_records": _Journaled(live['leave_records'], rows(changes.leaves, scratch['leave_records']), lambda l: l['id']),
+            "_sheets": live['_sheets']}
+
+
+class WriteBehind:
+    """Background writer for a payroll_db.SharedDB (attach with shared.writer = WriteBehind(shared))."""
+
+    def __init__(self, shared, journal_path=JOURNAL_PATH, coalesce_delay=0.5, max_backoff=60.0):
+        self.shared = shared
+        self.journal_path = journal_path
+        self.coalesce_delay = coalesce_delay
+        self.max_backoff = max_backoff
+        self._cond = threading.Condition()
+        self._pending = []          # [(seq, snapshot)] in submit order
+        self._seq = 0
+        self.state, self.error, self.last_saved = SAVED, None, None
+        self._recover()
+        self._thread = threading.Thread(target=self._run, name="payroll-writer", daemon=True)
+        self._thread.start()
+        # Give queued saves a moment on a clean shutdown; anything left is replayed from the journal
+        atexit.register(self.flush, 10)
+
+    # ---------- journal ----------
+    def _recover(self):
+        if not os.path.exists(self.journal_path): return
+        entries, done = {}, 0
+        with open(self.journal_path, encoding="utf-8") as f:
+            for line in f:
+                try: item = json.loads(line)
+                except ValueError: continue     # torn last line from a crash mid-append: never acknowledged
+                if "done" in item: done = max(done, item["done"])
+                else: entries[item["seq"]] = item["batch"]
+        self._pending = [(seq, snap) for seq, snap in sorted(entries.items()) if seq > done]
+        self._seq = max([done] + list(entries))
+        if self._pending: self.state = SAVING
+
+    def _append(self, item):
+        with open(self.journal_path, "a", encoding="utf-8") as f:
+            f.write(json.dumps(item, default=str) + "\n")
+            f.flush(); os.fsync(f.fileno())
+
+    # ---------- UI side ----------
+    def submit(self, data, changes):
+        """Journals the batch and returns immediately. changes is reset."""
+        if changes.is_empty(): return None
+        snap = snapshot_changes(data, changes)
+        with self._cond:
+            self._seq += 1
+            self._append({"seq": self._seq, "batch": snap})
+            self._pending.append((self._seq, snap))
+            self.state = SAVING
+            self._cond.notify()
+        changes.reset()
+        return self._seq
+
+    def replay_into(self, data):
+        """Applies batches that are acknowledged but not yet in storage to a freshly loaded db."""
+        with self._cond: pending = list(self._pending)
+        for _, snap in pending: apply_snapshot(data, snap, ChangeTracker())
+
+    def status(self):
+        with self._cond:
+            return {"state": self.state, "pending": len(self._pending), "error": self.error, "last_saved": self.last_saved}
+
+    def flush(self, timeout=None):
+        """Blocks until everything submitted so far is in storage (or timeout). Returns True when drained."""
+        end = None if timeout is None else time.monotonic() + timeout
+        with self._cond:
+            while self._pending:
+                left = None if end is None else end - time.monotonic()
+                if left is not None and left <= 0: return False
+                self._cond.wait(left)
+        return True
+
+    # ---------- writer thread ----------
+    def _run(self):
+        attempt = 0
+        while True:
+            with self._cond:
+                while not self._pending: self._cond.wait()
+            # Let rapid successive edits (e.g. ticking several Paid boxes) land in the same save
+            if attempt == 0: time.sleep(self.coalesce_delay)
+            with self._cond:
+                batch = list(self._pending)
+            changes = ChangeTracker()
+            for _, snap in batch: changes.merge(_ops(snap))
+            try:
+                with self.shared.lock: self.shared.storage.save(_journaled_db(self.shared.get(), batch, changes), changes)
+            except Exception as e:
+                attempt += 1
+                with self._cond: self.state, self.error = FAILED, f"{type(e).__name__}: {e}"
+                time.sleep(min(self.max_backoff, 2 ** attempt))
+                continue
+            attempt = 0
+            last = batch[-1][0]
+            with self._cond:
+                self._pending = [(seq, snap) for seq, snap in self._pending if seq > last]
+                if self._pending: self._append({"done": last})
+                else: open(self.journal_path, "w").close()     # everything is in storage: compact
+                self.state, self.error, self.last_saved = (SAVING if self._pending else SAVED), None, time.time()
+                self._cond.notify_all()
@@ -0,0 +1,94 @@
+import calendar
+import os
+import re
+import sys
+from datetime import date
+
+import pandas as pd
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from payroll_db import EMP_COLUMNS, LEAVE_COLUMNS, REC_COLUMNS, employee_to_row, record_to_row  # noqa: E402
+from payroll_models import Employee, LineItem, PayrollRecord  # noqa: E402
+
+
+class FakeWorksheet:
+    """The gspread calls _patch_sheet makes, on a list of rows (row 1 = header)."""
+
+    def __init__(self, rows):
+        self.rows = rows
+        self.calls = []
+
+    def batch_get(self, ranges, **kwargs):
+        self.calls.append("batch_get")
+        out = []
+        for rng in ranges:
+            if rng == "1:1": out.append([list(self.rows[0])] if self.rows else []); continue
+            col = ord(re.match(r"([A-Z]+)", rng).group(1)) - 65
+            cells = [[str(r[col])] if col < len(r) and r[col] not in ("", None) else [] for r in self.rows[1:]]
+            while cells and not cells[-1]: cells.pop()
+            out.append(cells)
+        return out
+
+    def delete_rows(self, start, end=None):
+        self.calls.append("delete_rows")
+        del self.rows[start - 1:(end or start)]
+
+    def batch_update(self, data, **kwargs):
+        self.calls.append("batch_update")
+        for d in data:
+            row = int(re.match(r"A(\d+):", d["range"]).group(1))
+            self.rows[row - 1] = list(d["values"][0])
+
+    def append_rows(self, values, **kwargs):
+        self.calls.append("append_rows")
+        self.rows.extend(list(v) for v in values)
+
+
+class FakeSheets:
+    """A GSheetsConnection stand-in: read/update whole sheets, client._select_worksheet for row writes."""
+
+    def __init__(self, frames):
+        self.sheets = {name: FakeWorksheet([list(df.columns)] + df.values.tolist()) for name, df in frames.items()}
+        self.client = self
+        self.updates = []
+
+    def _select_worksheet(self, worksheet=None):
+        return self.sheets[worksheet]
+
+    def read(self, worksheet=None, ttl=None, **kwargs):
+        if worksheet not in self.sheets: raise KeyError(worksheet)
+        rows = self.sheets[worksheet].rows
+        return pd.DataFrame(rows[1:], columns=rows[0])
+
+    def update(self, worksheet=None, data=None, **kwargs):
+        self.updates.append(worksheet)
+        self.sheets[worksheet] = FakeWorksheet([list(data.columns)] + data.values.tolist())
+        return data
+
+    create = update
+
+    def column(self, worksheet, name):
+        rows = self.sheets[worksheet].rows
+        i = rows[0].index(name)
+        return [r[i] for r in rows[1:]]
+
+
+def make_record(emp, month="January", year=2024, net=1000.0, status="Paid", rec_id=None, currency="RM (MYR)"):
+    m = list(calendar.month_name).index(month)
+    return PayrollRecord(rec_id or f"{emp}_{month}_{year}", emp, month, date(year, m, 25),
+                         [LineItem("Basic Salary", net)], [], net, currency, "", status, 0.0)
+
+
+@pytest.fixture
+def sheets():
+    emps = [Employee(f"Emp {i}", "Dev", "01 Jan 2020", "01 Jan 1990", "RM (MYR)", "Maybank", f"11122233{i}",
+                     1000.0 + i, "Active") for i in range(3)]
+    recs = [make_record(f"Emp {i}", m, net=1000.0 + i) for m in ("January", "February") for i in range(3)]
+    frames = {
+        "Settings": pd.DataFrame([{"usd_rate": 4.5}]),
+        "Employees": pd.DataFrame([employee_to_row(e) for e in emps], columns=EMP_COLUMNS).fillna(""),
+        "Records": pd.DataFrame([record_to_row(r) for r in recs], columns=REC_COLUMNS),
+        "Leave": pd.DataFrame([], columns=LEAVE_COLUMNS),
+    }
+    return FakeSheets(frames)
@@ -0,0 +1,74 @@
+import os
+from datetime import date
+
+import pytest
+import streamlit as st
+from streamlit.testing.v1 import AppTest
+
+import payroll_db
+from payroll_storage import SQLiteStorage
+from conftest import make_record
+
+APP = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "payroll_app.py")
+YEAR = date.today().year
+
+
+@pytest.fixture
+def app(sheets, tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    db = payroll_db.load_db(sheets)
+    for i in range(3): db['records'].upsert(make_record(f"Emp {i}", "February", YEAR, status="Unpaid"))
+    path = str(tmp_path / "payroll.db")
+    SQLiteStorage(path).replace_all(db)
+    at = AppTest.from_file(APP, default_timeout=60)
+    at.secrets["credentials"] = {"username": "u", "password": "p"}
+    at.secrets["storage"] = {"backend": "sqlite", "path": path, "record_years": 50, "snapshot": False, "write_behind": False}
+    at.session_state["password_correct"] = True
+    at.run()
+    yield at, SQLiteStorage(path)
+    st.cache_resource.clear()       # the next test gets its own SharedDB
+
+
+def _editor_key(at, prefix):
+    keys = [k for k in at.session_state._state.filtered_state if k.startswith(prefix)]
+    assert len(keys) == 1, keys
+    return keys[0]
+
+
+def _edit(at, key, rows):
+    at.session_state[key] = {"edited_rows": rows, "added_rows": [], "deleted_rows": []}
+    at.run()
+    assert not at.exception
+
+
+def _status(storage, emp):
+    return storage.load()['records'].get(f"{emp}_February_{YEAR}").status
+
+
+def test_paid_tick_is_not_replayed_after_an_unpaid_reset(app):
+    at, storage = app
+    at.sidebar.radio[0].set_value("Payroll Center").run()
+    at.selectbox[0].set_value("February"); at.selectbox[1].set_value(YEAR); at.run()
+    key = _editor_key(at, "payslips_")
+    _edit(at, key, {1: {"Paid": True}})
+    assert _status(storage, "Emp 1") == "Paid"
+    # Another session (or a Workbench save) resets it to Unpaid
+    db, changes = at.session_state.db, payroll_db.ChangeTracker()
+    db['records'].update(f"Emp 1_February_{YEAR}", status="Unpaid"); changes.upsert_record(f"Emp 1_February_{YEAR}")
+    storage.save(db, changes)
+    # The browser still holds the grid's old tick and sends it with the next run
+    _edit(at, key, {1: {"Paid": True}})
+    assert _status(storage, "Emp 1") == "Unpaid" and db['records'].get(f"Emp 1_February_{YEAR}").status == "Unpaid"
+
+
+def test_remark_edit_is_not_replayed_over_a_later_remark(app):
+    at, storage = app
+    at.sidebar.radio[0].set_value("Manage Employees").run()
+    key = _editor_key(at, "employees_")
+    _edit(at, key, {2: {"Remark": "first"}})
+    assert storage.load()['employees']["Emp 2"].master_remark == "first"
+    db, changes = at.session_state.db, payroll_db.ChangeTracker()
+    db['employees']["Emp 2"].master_remark = "changed elsewhere"; changes.upsert_employee("Emp 2")
+    storage.save(db, changes)
+    _edit(at, key, {2: {"Remark": "first"}})
+    assert storage.load()['employees']["Emp 2"].master_remark == "changed elsewhere"
@@ -0,0 +1,62 @@
+import io
+from datetime import date
+
+import pytest
+
+import payroll_db
+from payroll_bank import BANK_FORMATS, BankFormat, mark_paid, payment_file_bytes, verify_payment_file
+
+
+@pytest.fixture
+def db(sheets):
+    db = payroll_db.load_db(sheets)
+    for i in range(3): db['records'].update(f"Emp {i}_February_2024", status="Unpaid")
+    return db
+
+
+def _file(db, name):
+    data, batch, problems = payment_file_bytes(db, 2024, "February", BANK_FORMATS[name], company="SDG Tech",
+                                               value_date=date(2024, 2, 25))
+    return data.decode("ascii"), batch, problems
+
+
+@pytest.mark.parametrize("name", ["fixed", "csv"])
+def test_file_matches_its_trailer(db, name):
+    text, batch, problems = _file(db, name)
+    assert problems == []
+    assert (batch.count, batch.total_cents, batch.skipped) == (3, 300300, 0)
+    assert batch.hash == sum(111222330 + i for i in range(3))
+    assert sorted(batch.record_ids) == [f"Emp {i}_February_2024" for i in range(3)]
+    if name == "fixed": assert text.splitlines()[-1] == f"T000003000000000300300{batch.hash:015d}"
+    else: assert text.splitlines()[-1] == f"TOTAL,3,3003.00,{batch.hash}"
+
+
+def test_tampered_amount_and_missing_line_are_caught(db):
+    text, batch, _ = _file(db, "fixed")
+    lines = text.split("\r\n")
+    changed = lines[1][:61] + "000000000999999" + lines[1][76:]       # amount_cents of the first payee
+    problems = verify_payment_file(io.StringIO("\r\n".join([lines[0], changed] + lines[2:])), BANK_FORMATS["fixed"], batch)
+    assert any(p.startswith("Trailer total_cents") for p in problems) and any(p.startswith("total_cents: wrote") for p in problems)
+    problems = verify_payment_file(io.StringIO("\r\n".join(lines[:2] + lines[3:])), BANK_FORMATS["fixed"])
+    assert [p.split()[:2] for p in problems] == [["Trailer", "count"], ["Trailer", "total_cents"], ["Trailer", "hash"]]
+    assert verify_payment_file(io.StringIO("\r\n".join(lines[:-2])), BANK_FORMATS["fixed"]) != []
+
+
+def test_totals_are_refused_in_the_header():
+    with pytest.raises(ValueError, match="trailer"):
+        BankFormat("bad", "csv", header=["company", "total"], detail=["account", "amount"])
+
+
+def test_payees_that_cannot_be_paid_are_left_out(db):
+    db['employees']["Emp 1"].account_number = "12-34"
+    text, batch, problems = _file(db, "csv")
+    assert problems == [] and batch.count == 2
+    assert [e for e, _ in batch.errors] == ["Emp 1"] and "Emp 1" not in text
+
+
+def test_mark_paid_flips_the_batch(db):
+    _, batch, _ = _file(db, "fixed")
+    changes = mark_paid(db, batch.record_ids)
+    assert sorted(changes.records) == sorted(batch.record_ids)
+    assert {db['records'].get(rec_id).status for rec_id in batch.record_ids} == {"Paid"}
+    assert _file(db, "fixed")[1].count == 0
@@ -0,0 +1,25 @@
+from datetime import date, datetime
+
+import pandas as pd
+import pytest
+
+from payroll_fx import RateTable
+
+
+@pytest.mark.parametrize("code, on", [("USD", date(2024, 2, 1)), ("usd ", datetime(2024, 2, 1, 9, 30)),
+                                      ("Usd", pd.Timestamp("2024-02-01")), ("USD", "2024-02-01"), ("usd", "01 Feb 2024")])
+def test_remove_finds_the_entry_set_under_any_spelling(code, on):
+    rates = RateTable([("USD", date(2024, 1, 1), 4.2), ("usd", "2024-02-01", 4.6), ("SGD", date(2024, 1, 1), 3.4)])
+    version = rates.version
+    rates.remove(code, on)
+    assert rates.rows() == [("SGD", date(2024, 1, 1), 3.4), ("USD", date(2024, 1, 1), 4.2)]
+    assert rates.version == version + 1 and rates.rate_on("USD", date(2024, 3, 1)) == 4.2
+
+
+def test_removing_the_last_rate_drops_the_currency():
+    rates = RateTable([("SGD", date(2024, 1, 1), 3.4)])
+    rates.remove("sgd", "2024-01-01")
+    assert rates.currencies() == [] and rates.rate_on("SGD") is None
+    version = rates.version
+    rates.remove("SGD", date(2024, 1, 1))       # nothing left: no change
+    assert rates.version == version
@@ -0,0 +1,83 @@
+import calendar
+from datetime import date
+
+import pytest
+
+import payroll_db
+from conftest import make_record
+from payroll_engine import default_payment_date, generate_payroll
+
+
+def test_past_month_is_filed_under_its_own_year(sheets):
+    db = payroll_db.load_db(sheets)
+    result = generate_payroll(db, "December", 2023)
+    assert len(result.created) == 3
+    assert {r.payment_date for r in result.created} == {date(2023, 12, 31)}
+    assert set(db['records'].month_by_employee(2023, "December")) == {"Emp 0", "Emp 1", "Emp 2"}
+
+
+def test_current_month_defaults_to_today():
+    today = date.today()
+    assert default_payment_date(calendar.month_name[today.month], today.year) == today
+
+
+def test_existing_id_is_skipped_not_overwritten(sheets):
+    db = payroll_db.load_db(sheets)
+    # December 2023 paid on 2 Jan 2024: indexed under 2024, id still says 2023
+    paid = make_record("Emp 0", "December", 2023, net=777.0, status="Paid")
+    paid.payment_date = date(2024, 1, 2)
+    db['records'].upsert(paid)
+    result = generate_payroll(db, "December", 2023, payment_date="2024-01-02")
+    assert result.skipped == ["Emp 0"] and [r.employee_id for r in result.created] == ["Emp 1", "Emp 2"]
+    kept = db['records'].get("Emp 0_December_2023")
+    assert kept.status == "Paid" and kept.net_salary == 777.0
+    again = generate_payroll(db, "December", 2023, payment_date="2024-01-02")
+    assert again.created == [] and sorted(again.skipped) == ["Emp 0", "Emp 1", "Emp 2"]
+
+
+def test_last_payslip_older_than_the_load_window_is_carried_forward(sheets, tmp_path):
+    from payroll_storage import SQLiteStorage
+    db = payroll_db.load_db(sheets)
+    old = make_record("Emp 0", "March", date.today().year - 6, net=4321.0)
+    db['records'] = payroll_db.RecordStore([old])
+    SQLiteStorage(str(tmp_path / "p.db")).replace_all(db)
+
+    windowed = SQLiteStorage(str(tmp_path / "p.db"), record_years=2).open()
+    assert windowed['records'].since_year is not None and len(windowed['records']) == 0
+    assert windowed['records'].latest("Emp 0").id == old.id
+
+    windowed = SQLiteStorage(str(tmp_path / "p.db"), record_years=2).open()
+    result = generate_payroll(windowed, "January", date.today().year + 1, dry_run=True)
+    carried = {r.employee_id: r.net_salary for r in result.created}
+    assert carried["Emp 0"] == 4321.0 and carried["Emp 1"] == 1001.0
+
+
+def _windowed(kind, sheets, tmp_path, since):
+    from payroll_snapshot import RecordSnapshot
+    from payroll_storage import SQLiteStorage
+    if kind == "sheets": return payroll_db.read_records(sheets, payroll_db.new_db(), since)
+    db = payroll_db.load_db(sheets)
+    if kind == "sqlite":
+        storage = SQLiteStorage(str(tmp_path / "p.db")); storage.replace_all(db)
+        return storage._read_records(since)
+    snap = RecordSnapshot(str(tmp_path / "snap")); snap.write("records", db['records'])
+    return snap.read_records(since)
+
+
+@pytest.mark.parametrize("kind", ["sheets", "sqlite", "snapshot"])
+def test_employees_outside_the_window_are_looked_up_one_by_one(sheets, tmp_path, kind):
+    this_year = date.today().year
+    sheets.sheets["Records"].rows.append(list(payroll_db.record_to_row(make_record("Emp 1", year=this_year)).values()))
+    store = _windowed(kind, sheets, tmp_path, this_year)
+    calls = []
+    fetch = store.fetch_employees
+    store.fetch_employees = lambda emp_ids, before: calls.append(list(emp_ids)) or fetch(emp_ids, before)
+    store.fetch_older = None        # any full load would fail
+    assert store.latest("Emp 0").id == "Emp 0_February_2024"
+    assert store.latest("New hire") is None and store.latest("New hire") is None
+    store.ensure_employees(["Emp 0", "Emp 1", "New hire"])
+    assert calls == [["Emp 0"], ["New hire"]]
+    assert store.since_year == this_year and store.for_employee("Emp 2") == []
+    store.fetch_older = _windowed(kind, sheets, tmp_path, this_year).fetch_older
+    store.load_all()
+    assert len(store) == 7 and store.duplicates == [] and len(store.for_employee("Emp 0")) == 2
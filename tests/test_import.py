@@ -0,0 +1,94 @@
+import io
+
+import pytest
+
+import payroll_db
+from payroll_import import EMPLOYEES, RECORDS, import_file
+from payroll_models import Currency
+
+EMP_CSV = """name,designation,join_date,date_of_birth,currency,bank_name,account_number,basic_salary,status
+Alice,Engineer,2020-01-15,12/03/1990,RM (MYR),Maybank,1234567890,5000,Active
+
+Bob,Designer,15 Mar 2021,,USD,HSBC,987,4000.5,resigned
+,NoName,2020-01-01,,,,,,
+Carl,Ops,2020-13-01,,,,,1000,
+Dina,Ops,2020-01-01,,EUR,,,1000,
+Eve,Ops,2020-01-01,,,,,1,x,y
+Fay,Ops,2020-01-01,,,,,abc,
+Gus,Ops,2020-01-01,,,,,100,Sacked
+"""
+
+REC_CSV = """employee_id,payment_date,month_label,earnings_list,deductions_list,net_salary,status
+Alice,2023-01-25,,"[{""Description"": ""Basic Salary"", ""Amount"": 5000}]","[{""Description"": ""EPF"", ""Amount"": 550}]",4450,
+Alice,2023-02-25,Feb,,,,unpaid
+Zed,2023-01-25,,,,,
+Alice,2023-03-25,,not json,,,
+Alice,2023-04-25,,"[{""Description"": ""Basic Salary"", ""Amount"": 5000}]",,4999,
+Alice,bad,,,,,
+Alice,2023-05-25,Smarch,[],,,
+"""
+
+
+@pytest.fixture
+def db():
+    return payroll_db.new_db()
+
+
+def test_employee_rows_are_validated_one_by_one(db):
+    saved = []
+    result = import_file(io.StringIO(EMP_CSV), EMPLOYEES, db, commit=saved.append, name="e.csv")
+    assert (result.rows, result.created, result.updated) == (8, 2, 0)
+    assert sorted(result.errors) == [(5, "Name is empty"), (6, "Unreadable join_date '2020-13-01'"), (7, "Unknown currency 'EUR'"),
+                             (8, "10 cells, the header has 9 columns"), (9, "basic_salary 'abc' is not an amount"),
+                             (10, "Unknown status 'Sacked' (Active / Inactive)")]
+    bob = db['employees']["Bob"]
+    assert (bob.currency, bob.status, bob.join_date, bob.basic_salary) == (Currency.USD, "Inactive", "15 Mar 2021", 4000.5)
+    assert len(saved) == 1 and set(saved[0].employees) == {"Alice", "Bob"}
+
+
+def test_blank_cells_keep_existing_values(db):
+    import_file(io.StringIO(EMP_CSV), EMPLOYEES, db, commit=lambda ch: None, name="e.csv")
+    result = import_file(io.StringIO("name,basic_salary,bank_name\nAlice,5500,\n"), EMPLOYEES, db, commit=lambda ch: None, name="e.csv")
+    assert (result.created, result.updated) == (0, 1)
+    assert (db['employees']["Alice"].basic_salary, db['employees']["Alice"].bank_name) == (5500.0, "Maybank")
+
+
+def test_record_rows_are_validated_one_by_one(db):
+    import_file(io.StringIO(EMP_CSV), EMPLOYEES, db, commit=lambda ch: None, name="e.csv")
+    result = import_file(io.StringIO(REC_CSV), RECORDS, db, commit=lambda ch: None, name="r.csv")
+    assert result.errors == [(3, "No earnings (earnings_list or basic_salary)"), (4, "Unknown employee 'Zed'"),
+                             (5, "earnings_list is not a JSON list"),
+                             (6, "net_salary '4999' is not earnings - deductions (5,000.00)"),
+                             (7, "Unreadable payment_date 'bad'"), (8, "Unknown month_label 'Smarch'")]
+    rec = db['records'].get("Alice_January_2023")
+    assert (rec.net_salary, rec.status, rec.currency) == (4450.0, "Paid", Currency.MYR)
+
+
+def test_missing_required_column_stops_the_import(db):
+    result = import_file(io.StringIO("foo,bar\n1,2\n"), RECORDS, db, commit=lambda ch: None, name="r.csv")
+    assert result.errors == [(0, "Missing column(s): employee_id, payment_date")] and result.imported == 0
+
+
+def test_dry_run_leaves_db_alone(db):
+    result = import_file(io.StringIO(EMP_CSV), EMPLOYEES, db, dry_run=True, name="e.csv")
+    assert result.created == 2 and db['employees'] == {}
+
+
+def test_failed_commit_is_undone_and_not_retried(db):
+    import_file(io.StringIO("name,basic_salary\nAlice,100\n"), EMPLOYEES, db, commit=lambda ch: None, name="e.csv")
+    calls = []
+
+    def commit(changes):
+        calls.append(sorted(changes.employees))
+        if len(calls) == 2: raise OSError("quota exceeded")
+    csv_text = "name,basic_salary\nBea,1\nCai,2\nAlice,300\nDan,4\nEd,5\n"
+    result = import_file(io.StringIO(csv_text), EMPLOYEES, db, commit=commit, batch_rows=2, name="e.csv")
+    assert calls == [["Bea", "Cai"], ["Alice", "Dan"]]
+    assert result.save_error == "quota exceeded" and result.saved == 2 and result.batches == 1
+    assert list(db['employees']) == ["Alice", "Bea", "Cai"] and db['employees']["Alice"].basic_salary == 100.0
+    assert "Could not read file" not in str(result.errors)
+
+
+def test_unreadable_file_is_a_read_error(db):
+    result = import_file(io.BytesIO(b"name\nAlice\n\xff\xfe bad\n"), EMPLOYEES, db, commit=lambda ch: None, name="e.csv")
+    assert result.errors and result.errors[0][1].startswith("Could not read file")
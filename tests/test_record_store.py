@@ -0,0 +1,84 @@
+from datetime import date
+
+import pandas as pd
+import pytest
+
+import payroll_db
+from payroll_db import REC_COLUMNS, ChangeTracker, RecordStore, record_to_row
+from payroll_engine import MonthlyRollup, convert_record_to_myr, monthly_rollup
+from payroll_fx import RateTable
+from conftest import make_record
+
+
+def test_indexes_follow_update_and_delete():
+    store = RecordStore([make_record("A", "January"), make_record("A", "February"), make_record("B", "January")])
+    assert len(store) == 3 and "A_January_2024" in store
+    assert sorted(r.id for r in store.for_month(2024, "January")) == ["A_January_2024", "B_January_2024"]
+    assert store.latest("A").id == "A_February_2024"
+    store.update("A_February_2024", month_label="March")
+    assert store.for_month(2024, "February") == [] and [r.id for r in store.for_month(2024, "March")] == ["A_February_2024"]
+    store.delete("A_February_2024")
+    assert store.latest("A").id == "A_January_2024"
+    assert [r.id for r in store.for_employee("A")] == ["A_January_2024"] and store.get("A_February_2024") is None
+
+
+def test_repeated_ids_are_reported_and_the_last_row_wins():
+    first, second = make_record("A", net=100.0), make_record("A", net=200.0)
+    store = RecordStore([first, second, make_record("B")])
+    assert len(store) == 2 and store.get("A_January_2024") is second
+    assert store.duplicates == [first]
+    assert RecordStore([make_record("A"), make_record("B")]).duplicates == []
+
+
+def test_full_rewrite_keeps_rows_with_repeated_ids(sheets):
+    rows = sheets.sheets["Records"].rows
+    rows.append(list(record_to_row(make_record("Emp 0", net=5.0)).values()))     # a second Emp 0_January_2024
+    db = payroll_db.load_db(sheets)
+    assert [r.id for r in db['records'].duplicates] == ["Emp 0_January_2024"]
+    db['records'].update("Emp 1_January_2024", status="Unpaid")
+    changes = ChangeTracker(); changes.upsert_record("Emp 1_January_2024")
+    payroll_db.save_db(sheets, db, changes)
+    assert sheets.updates == ["Records"]
+    ids = sheets.column("Records", "id")
+    assert len(ids) == 7 and ids.count("Emp 0_January_2024") == 2
+    saved = pd.DataFrame(sheets.sheets["Records"].rows[1:], columns=REC_COLUMNS)
+    assert saved.loc[saved["id"] == "Emp 1_January_2024", "status"].tolist() == ["Unpaid"]
+
+
+def _usd(emp, month, net, rate=0.0, status="Paid"):
+    rec = make_record(emp, month, net=net, status=status, currency="$ (USD)")
+    rec.exchange_rate = rate
+    return rec
+
+
+def _expected(store, month, rates, default_rate, status="Paid"):
+    return sum(convert_record_to_myr(r, default_rate, rates) for r in store.for_month(2024, month) if r.status == status)
+
+
+@pytest.mark.parametrize("rates", [None, RateTable([("USD", date(2024, 1, 1), 4.2), ("USD", date(2024, 2, 15), 4.6)])])
+def test_rollup_follows_store_changes(rates):
+    store = RecordStore([make_record("A", "January", net=3000.0), _usd("B", "January", 1000.0, rate=4.4),
+                         _usd("C", "January", 500.0), _usd("C", "February", 800.0), make_record("A", "February", net=3100.0)])
+    view = monthly_rollup(store, rates)
+    assert monthly_rollup(store, rates) is view
+    store.update("A_January_2024", status="Unpaid")
+    store.update("C_February_2024", net_salary=900.0)
+    store.delete("A_February_2024")
+    store.upsert(_usd("D", "January", 250.0))
+    for month in ("January", "February"):
+        assert view.myr(2024, month, default_rate=4.0) == pytest.approx(_expected(store, month, rates, 4.0))
+        assert view.myr(2024, month, "Unpaid", 4.0) == pytest.approx(_expected(store, month, rates, 4.0, "Unpaid"))
+        assert view.count(2024, month) == sum(r.status == "Paid" for r in store.for_month(2024, month))
+    rebuilt = MonthlyRollup(store, rates)
+    assert {k: pytest.approx(v) for k, v in view.cells.items()} == rebuilt.cells
+
+
+def test_rollup_rebuilds_when_the_rate_table_changes():
+    rates = RateTable([("USD", date(2024, 1, 1), 4.2)])
+    store = RecordStore([_usd("C", "January", 500.0)])
+    view = monthly_rollup(store, rates)
+    assert view.myr(2024, "January") == pytest.approx(2100.0)
+    rates.set("USD", date(2024, 1, 10), 5.0)
+    fresh = monthly_rollup(store, rates)
+    assert fresh is not view and fresh.myr(2024, "January") == pytest.approx(2500.0)
+    assert store.listeners == [fresh.apply]
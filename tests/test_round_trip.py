@@ -0,0 +1,71 @@
+import pandas as pd
+
+import payroll_db
+from payroll_db import ChangeTracker
+from payroll_models import Currency
+from payroll_snapshot import RecordSnapshot
+from payroll_storage import SQLiteStorage
+
+# Cells the app does not write itself but finds in real sheets
+ODD = {"Emp 0_January_2024": ("MYR", "25/01/2024"), "Emp 1_January_2024": ("SGD", "TBC"),
+       "Emp 2_January_2024": ("", "2024-01-25 00:00:00"), "Emp 0_February_2024": ("USD ", "")}
+
+
+def _odd(sheets):
+    rows = sheets.sheets["Records"].rows
+    cur, day = rows[0].index("currency"), rows[0].index("payment_date")
+    for row in rows[1:]:
+        if row[0] in ODD: row[cur], row[day] = ODD[row[0]]
+    emps = sheets.sheets["Employees"].rows
+    emps[1][emps[0].index("currency")] = "MYR"
+    emps[2][emps[0].index("currency")] = ""
+    return sheets
+
+
+def _cells(sheets, name, key, *cols):
+    df = sheets.read(worksheet=name)
+    return {r[key]: tuple(r[c] for c in cols) for _, r in df.iterrows()}
+
+
+def test_full_rewrite_keeps_cells_as_read(sheets):
+    _odd(sheets)
+    before = _cells(sheets, "Records", "id", "currency", "payment_date")
+    emps_before = _cells(sheets, "Employees", "name", "currency")
+    db = payroll_db.load_db(sheets)
+    assert db['records'].get("Emp 1_January_2024").currency is Currency.MYR
+    assert db['records'].get("Emp 1_January_2024").payment_date is None
+    for name in ("Records", "Employees"):
+        rows = sheets.sheets[name].rows
+        rows[1:] = rows[:0:-1]                           # sorted by hand: forces a full rewrite
+    db['records'].update("Emp 2_February_2024", status="Unpaid")
+    db['employees']["Emp 2"].status = "Inactive"
+    changes = ChangeTracker(); changes.upsert_record("Emp 2_February_2024"); changes.upsert_employee("Emp 2")
+    payroll_db.save_db(sheets, db, changes)
+    assert sheets.updates == ["Employees", "Records"]
+    assert _cells(sheets, "Records", "id", "currency", "payment_date") == before
+    assert _cells(sheets, "Employees", "name", "currency") == emps_before
+
+
+def test_changed_values_are_written_canonical(sheets):
+    _odd(sheets)
+    db = payroll_db.load_db(sheets)
+    db['records'].update("Emp 1_January_2024", currency=Currency.USD)
+    db['records'].update("Emp 0_January_2024", payment_date=pd.Timestamp("2024-01-31").date())
+    rec = db['records'].get("Emp 2_January_2024")
+    assert (rec.currency_text, rec.payment_date_text) == ("", "2024-01-25 00:00:00")
+    assert (db['records'].get("Emp 1_January_2024").currency_text,
+            db['records'].get("Emp 0_January_2024").payment_date_text) == ("$ (USD)", "2024-01-31")
+
+
+def test_sqlite_and_snapshot_keep_cells_as_read(sheets, tmp_path):
+    _odd(sheets)
+    db = payroll_db.load_db(sheets)
+    expected = {r.id: (r.currency_text, r.payment_date_text) for r in db['records']}
+    assert expected["Emp 1_January_2024"] == ("SGD", "TBC")
+    storage = SQLiteStorage(str(tmp_path / "p.db"))
+    storage.replace_all(db)
+    assert {r.id: (r.currency_text, r.payment_date_text) for r in storage.load()['records']} == expected
+    snap = RecordSnapshot(str(tmp_path / "snap"))
+    snap.write("records", db['records']); snap.write("employees", db['employees'])
+    assert {r.id: (r.currency_text, r.payment_date_text) for r in snap.read_records()} == expected
+    assert snap.read_employees()["Emp 0"].currency_text == "MYR"
@@ -0,0 +1,67 @@
+import payroll_db
+from payroll_db import ChangeTracker
+from conftest import make_record
+
+
+def _status(sheets, rec_id):
+    ids, status = sheets.column("Records", "id"), sheets.column("Records", "status")
+    return status[ids.index(rec_id)]
+
+
+def test_status_change_patches_one_row(sheets):
+    db = payroll_db.load_db(sheets)
+    db['records'].update("Emp 1_January_2024", status="Unpaid")
+    changes = ChangeTracker(); changes.upsert_record("Emp 1_January_2024")
+    payroll_db.save_db(sheets, db, changes)
+    assert sheets.updates == []
+    assert sheets.sheets["Records"].calls == ["batch_get", "batch_update"]
+    assert _status(sheets, "Emp 1_January_2024") == "Unpaid"
+    assert [_status(sheets, r.id) for r in db['records'] if r.id != "Emp 1_January_2024"] == ["Paid"] * 5
+
+
+def test_delete_and_append_keep_rows_in_step(sheets):
+    db = payroll_db.load_db(sheets)
+    changes = ChangeTracker()
+    for rec_id in ("Emp 0_January_2024", "Emp 1_January_2024"):
+        db['records'].delete(rec_id); changes.delete_record(rec_id)
+    db['records'].upsert(make_record("Emp 0", "March")); changes.upsert_record("Emp 0_March_2024")
+    payroll_db.save_db(sheets, db, changes)
+    assert sheets.updates == []
+    assert sheets.column("Records", "id") == ["Emp 2_January_2024", "Emp 0_February_2024", "Emp 1_February_2024",
+                                              "Emp 2_February_2024", "Emp 0_March_2024"]
+    # The layout follows the sheet, so the next patch lands on the right row
+    db['records'].update("Emp 0_March_2024", status="Unpaid")
+    changes.upsert_record("Emp 0_March_2024"); payroll_db.save_db(sheets, db, changes)
+    assert _status(sheets, "Emp 0_March_2024") == "Unpaid" and _status(sheets, "Emp 2_January_2024") == "Paid"
+
+
+def test_new_employee_is_appended(sheets):
+    db = payroll_db.load_db(sheets)
+    db['employees']["Emp 9"] = payroll_db.Employee("Emp 9", "QA", basic_salary=500.0, status="Active")
+    changes = ChangeTracker(); changes.upsert_employee("Emp 9")
+    payroll_db.save_db(sheets, db, changes)
+    assert sheets.updates == [] and sheets.column("Employees", "name") == ["Emp 0", "Emp 1", "Emp 2", "Emp 9"]
+
+
+def test_sorted_sheet_falls_back_to_full_rewrite(sheets):
+    db = payroll_db.load_db(sheets)
+    rows = sheets.sheets["Records"].rows
+    rows[1:] = sorted(rows[1:], key=lambda r: r[0], reverse=True)      # someone sorted the sheet by id
+    db['records'].update("Emp 1_January_2024", status="Unpaid")
+    changes = ChangeTracker(); changes.upsert_record("Emp 1_January_2024")
+    payroll_db.save_db(sheets, db, changes)
+    assert sheets.updates == ["Records"]
+    assert _status(sheets, "Emp 1_January_2024") == "Unpaid"
+    assert sorted(sheets.column("Records", "id")) == sorted(r.id for r in db['records'])
+    assert [_status(sheets, r.id) for r in db['records'] if r.id != "Emp 1_January_2024"] == ["Paid"] * 5
+
+
+def test_row_deleted_in_sheet_is_not_overwritten_by_position(sheets):
+    db = payroll_db.load_db(sheets)
+    del sheets.sheets["Records"].rows[1]                              # row 2 removed by hand
+    db['records'].update("Emp 2_February_2024", status="Unpaid")
+    changes = ChangeTracker(); changes.upsert_record("Emp 2_February_2024")
+    payroll_db.save_db(sheets, db, changes)
+    assert sheets.updates == ["Records"]
+    assert _status(sheets, "Emp 2_February_2024") == "Unpaid"
+    assert len(set(sheets.column("Records", "id"))) == len(sheets.column("Records", "id")) == 6
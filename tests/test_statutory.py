@@ -0,0 +1,78 @@
+from datetime import date
+
+import numpy as np
+import pytest
+
+from payroll_engine import apply_statutory_batch
+from payroll_models import Employee, LineItem
+from payroll_statutory import EIS_LINE, EPF_LINE, PCB_LINE, SOCSO_LINE, apply_statutory, calculate
+from conftest import make_record
+
+
+def _one(wage, age=30):
+    r = calculate([wage], [age])
+    return {k: float(r[k][0]) for k in r.cols}
+
+
+# Third Schedule rows: (wage, employee, employer)
+@pytest.mark.parametrize("wage, employee, employer", [
+    (1990.0, 220, 260), (3000.0, 330, 390), (5000.0, 550, 650), (5050.0, 561, 612), (20000.0, 2200, 2400),
+    (25000.0, 2750, 3000)])
+def test_epf_rows(wage, employee, employer):
+    got = _one(wage)
+    assert (got["epf_employee"], got["epf_employer"]) == (employee, employer)
+
+
+def test_epf_from_age_60():
+    got = _one(3000.0, 60)
+    assert (got["epf_employee"], got["epf_employer"]) == (0, 120)
+
+
+# SOCSO Category 1 and EIS rows: (wage, SOCSO employer, SOCSO employee, EIS each)
+@pytest.mark.parametrize("wage, employer, employee, eis", [
+    (1050.0, 18.40, 5.25, 2.10), (1950.0, 34.15, 9.75, 3.90), (2000.0, 34.15, 9.75, 3.90), (2950.0, 51.65, 14.75, 5.90),
+    (3050.0, 53.40, 15.25, 6.10), (4950.0, 86.65, 24.75, 9.90), (8000.0, 104.15, 29.75, 11.90)])
+def test_socso_and_eis_rows(wage, employer, employee, eis):
+    got = _one(wage)
+    assert (got["socso_employer"], got["socso_employee"], got["eis_employee"], got["eis_employer"]) == \
+        pytest.approx((employer, employee, eis, eis))
+
+
+def test_socso_and_eis_by_age():
+    senior, minor = _one(1950.0, 60), _one(1950.0, 17)
+    assert (senior["socso_employee"], senior["socso_employer"], senior["eis_employee"]) == pytest.approx((0, 24.40, 0))
+    assert (minor["socso_employee"], minor["eis_employee"]) == pytest.approx((9.75, 0))
+
+
+@pytest.mark.parametrize("wage, mtd", [
+    (2000.0, 0.0),          # chargeable 23,040 - tax 241.20 - RM400 rebate
+    (5000.0, 110.0),        # chargeable 47,000: 600 + 12,000 x 6% = 1,320 a year
+    (10000.0, 929.17)])     # chargeable 107,000: 9,400 + 7,000 x 25% = 11,150 a year
+def test_pcb(wage, mtd):
+    assert _one(wage)["pcb"] == pytest.approx(mtd)
+
+
+def test_batch_matches_one_employee_at_a_time():
+    wages = [0.0, 10.0, 10.01, 29.99, 30.0, 1900.0, 1900.01, 2000.0, 4999.99, 5000.0, 5000.01, 5999.0, 6000.01, 19999.0,
+             20000.5, 48000.0, np.nan]
+    ages = [np.nan, 17, 18, 30, 59, 60, 75]
+    w, a = np.repeat(wages, len(ages)), np.tile(ages, len(wages))
+    batch = calculate(w, a)
+    for i in range(len(w)):
+        one = calculate([w[i]], [a[i]])
+        assert {k: one[k][0] for k in one.cols} == pytest.approx({k: batch[k][i] for k in batch.cols}, nan_ok=True), (w[i], a[i])
+
+
+def test_generated_records_match_the_workbench_path():
+    on = date(2024, 3, 25)
+    employees = {f"E{i}": Employee(f"E{i}", date_of_birth=dob, basic_salary=wage)
+                 for i, (dob, wage) in enumerate([("01 Jan 1990", 1950.0), ("15 Mar 1964", 3200.0), ("", 9000.0)])}
+    records = [make_record(name, "March", net=emp.basic_salary) for name, emp in employees.items()]
+    for r in records: r.deductions = [LineItem("Unpaid Leave", 0.0)]
+    apply_statutory_batch(records, employees, on)
+    ages = {"E0": 34, "E1": 60, "E2": np.nan}      # the age on the payment date; a blank birth date counts as under 60
+    for r in records:
+        stat = calculate([sum(i.amount for i in r.earnings)], [ages[r.employee_id]])
+        expected = apply_statutory([LineItem("Unpaid Leave", 0.0)], stat.deductions(0))
+        assert r.deductions == expected
+        assert [i.description for i in r.deductions] == ["Unpaid Leave", EPF_LINE, SOCSO_LINE, EIS_LINE, PCB_LINE]
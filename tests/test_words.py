@@ -0,0 +1,50 @@
+import random
+
+import pytest
+from num2words import num2words
+
+from payroll_models import Currency, Employee
+from payroll_words import amount_in_words, cardinal
+
+# Currency cells seen in real sheets, as the payslip is given them (Employee.currency_text)
+CURRENCY_TEXTS = ["RM (MYR)", "$ (USD)", "RM", "MYR", "USD", "SGD", "", "rm", "RM(MYR)", "US$", "$ (USD) "]
+
+
+def _legacy(amount, currency):
+    # create_pdf's num2words block before payroll_words, on the raw sheet text
+    net_val = round(amount, 2)
+    dollars = int(net_val); cents = int(round((net_val - dollars) * 100))
+    dollars_txt = num2words(dollars, lang='en').upper().replace(",", "")
+    cents_txt = num2words(cents, lang='en').upper().replace(",", "")
+    if "RM" in currency:
+        return f"{dollars_txt} RINGGIT AND {cents_txt} SEN ONLY" if cents > 0 else f"{dollars_txt} RINGGIT ONLY"
+    return f"{dollars_txt} DOLLARS AND {cents_txt} CENTS ONLY" if cents > 0 else f"{dollars_txt} DOLLARS ONLY"
+
+
+def test_cardinal_matches_num2words():
+    rng = random.Random(0)
+    numbers = list(range(2001)) + [rng.randrange(10 ** rng.randint(1, 18)) * rng.choice([1, -1]) for _ in range(2000)]
+    assert [n for n in numbers if cardinal(n) != num2words(n, lang='en')] == []
+
+
+@pytest.mark.parametrize("currency", CURRENCY_TEXTS)
+def test_amount_in_words_matches_the_old_payslip_text(currency):
+    rng = random.Random(currency)
+    amounts = [0.0, 0.01, 0.5, 1.0, 101.1, 1234.5, 3000.0, 2500.999, 1_000_000.07, -12.34, 0.1 + 0.2, 10.0 ** 15 + 0.25]
+    # cents exactly, float noise and half-cent edges, across every magnitude payroll sees
+    amounts += [rng.randrange(-10 ** 6, 10 ** rng.randint(2, 11)) / 100 + rng.choice([0, 0, 1e-9, -1e-9, 0.005, -0.005])
+                for _ in range(1500)]
+    assert [(a, amount_in_words(a, currency)) for a in amounts] == [(a, _legacy(a, currency)) for a in amounts]
+
+
+@pytest.mark.parametrize("cell, words", [("RM (MYR)", "RINGGIT"), ("MYR", "DOLLARS"), ("SGD", "DOLLARS"), ("", "DOLLARS"),
+                                         ("$ (USD)", "DOLLARS"), (Currency.MYR, "RINGGIT")])
+def test_payslip_words_follow_the_sheet_text(cell, words):
+    emp = Employee("A", currency=cell)
+    assert emp.currency is (Currency.USD if cell == "$ (USD)" else Currency.MYR)
+    assert amount_in_words(1234.5, emp.currency_text).split()[-5] == words
+
+
+def test_amount_in_words_text():
+    assert amount_in_words(1234.5, "RM (MYR)") == "ONE THOUSAND TWO HUNDRED AND THIRTY-FOUR RINGGIT AND FIFTY SEN ONLY"
+    assert amount_in_words(20, "$ (USD)") == "TWENTY DOLLARS ONLY"
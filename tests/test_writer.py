@@ -0,0 +1,91 @@
+import json
+
+import payroll_db
+from payroll_db import ChangeTracker, SharedDB, snapshot_changes
+from payroll_storage import SheetsStorage
+from payroll_writer import SAVED, WriteBehind
+from conftest import make_record
+
+
+def _batch(sheets, edit):
+    db, changes = payroll_db.load_db(sheets), ChangeTracker()
+    edit(db, changes)
+    return snapshot_changes(db, changes)
+
+
+def _unpay(db, changes):
+    db['records'].update("Emp 0_January_2024", status="Unpaid"); changes.upsert_record("Emp 0_January_2024")
+
+
+def _delete(db, changes):
+    db['records'].delete("Emp 1_January_2024"); changes.delete_record("Emp 1_January_2024")
+
+
+def _add(db, changes):
+    db['records'].upsert(make_record("Emp 0", "March")); changes.upsert_record("Emp 0_March_2024")
+
+
+def test_restart_replays_batches_not_marked_done(sheets, tmp_path):
+    journal = tmp_path / "journal.jsonl"
+    lines = [{"seq": 1, "batch": _batch(sheets, _unpay)}, {"done": 1},
+             {"seq": 2, "batch": _batch(sheets, _delete)}, {"seq": 3, "batch": _batch(sheets, _add)}]
+    journal.write_text("".join(json.dumps(item, default=str) + "\n" for item in lines) + '{"seq": 4, "ba')
+    shared = SharedDB(SheetsStorage(sheets))
+    shared.writer = WriteBehind(shared, str(journal), coalesce_delay=0)
+    # Acknowledged batches are visible before they reach storage; the torn line was never acknowledged
+    db = shared.get()
+    assert "Emp 1_January_2024" not in db['records'] and "Emp 0_March_2024" in db['records']
+    assert shared.writer.flush(10)
+    ids = sheets.column("Records", "id")
+    assert "Emp 1_January_2024" not in ids and "Emp 0_March_2024" in ids
+    # Batch 1 was marked done, so it is not written again
+    assert sheets.column("Records", "status")[ids.index("Emp 0_January_2024")] == "Paid"
+    assert shared.writer.status()["state"] == SAVED and journal.read_text() == ""
+
+
+def test_submitted_batch_reaches_storage(sheets, tmp_path):
+    shared = SharedDB(SheetsStorage(sheets))
+    shared.writer = WriteBehind(shared, str(tmp_path / "journal.jsonl"), coalesce_delay=0)
+    changes = ChangeTracker()
+    _unpay(shared.get(), changes)
+    shared.commit(changes)
+    assert changes.is_empty() and shared.writer.flush(10)
+    ids = sheets.column("Records", "id")
+    assert sheets.column("Records", "status")[ids.index("Emp 0_January_2024")] == "Unpaid"
+
+
+def test_writer_saves_the_journaled_rows_not_later_edits(sheets, tmp_path):
+    shared = SharedDB(SheetsStorage(sheets))
+    shared.writer = WriteBehind(shared, str(tmp_path / "journal.jsonl"), coalesce_delay=0)
+    db, changes = shared.get(), ChangeTracker()
+    with shared.lock:       # the writer cannot save until the UI's next edits are half done
+        _unpay(db, changes); _add(db, changes); _delete(db, changes)
+        db['employees']["Emp 2"].designation = "Lead"; changes.upsert_employee("Emp 2")
+        shared.commit(changes)
+        # Not committed yet: another session is still editing these rows
+        db['records'].update("Emp 0_January_2024", remarks="half typed")
+        db['records'].update("Emp 0_March_2024", net_salary=0.0)
+        db['records'].upsert(make_record("Emp 1", "January", net=5.0))
+        db['employees']["Emp 2"].designation = "Le"
+    assert shared.writer.flush(10)
+    saved = payroll_db.load_db(sheets)
+    assert saved['records'].get("Emp 0_January_2024").status == "Unpaid"
+    assert saved['records'].get("Emp 0_January_2024").remarks == ""
+    assert saved['records'].get("Emp 0_March_2024").net_salary == 1000.0
+    assert "Emp 1_January_2024" not in saved['records'] and saved['employees']["Emp 2"].designation == "Lead"
+
+
+def test_full_rewrite_from_the_writer_keeps_every_row(sheets, tmp_path):
+    shared = SharedDB(SheetsStorage(sheets))
+    shared.writer = WriteBehind(shared, str(tmp_path / "journal.jsonl"), coalesce_delay=0)
+    db, changes = shared.get(), ChangeTracker()
+    assert len(db['records']) == 6
+    rows = sheets.sheets["Records"].rows
+    rows[1:] = rows[:0:-1]                  # sorted by hand: the patch refuses, the sheet is rewritten
+    with shared.lock:
+        _unpay(db, changes); _delete(db, changes); shared.commit(changes)
+        db['records'].update("Emp 0_January_2024", status="Paid")
+    assert shared.writer.flush(10) and sheets.updates == ["Records"]
+    ids = sheets.column("Records", "id")
+    assert sorted(ids) == sorted(r.id for r in db['records'])
+    assert sheets.column("Records", "status")[ids.index("Emp 0_January_2024")] == "Unpaid"